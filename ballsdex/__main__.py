@@ -18,6 +18,8 @@ from tortoise import Tortoise
 
 from ballsdex import __version__ as bot_version
 from ballsdex.core.bot import BallsDexBot
+from ballsdex.core.db import instrument_pool, read_router, tortoise_config
+from ballsdex.core.metrics import startup_phase
 from ballsdex.logging import init_logger
 from ballsdex.settings import read_settings, settings, update_settings, write_default_settings
 
@@ -154,6 +156,17 @@ async def shutdown_handler(bot: BallsDexBot, signal_type: str | None = None):
     else:
         log.info("Shutting down the bot...")
     try:
+        # a failing service (like the database being down) must not keep the bot connected
+        for name, stop in (
+            ("catch buffer", bot.catches.stop),
+            ("statistics", bot.stats.stop),
+            ("locks", bot.locks.stop),
+            ("read router", read_router.stop),
+        ):
+            try:
+                await stop()
+            except Exception:
+                log.exception(f"Failed to stop the {name}")
         await asyncio.wait_for(bot.close(), timeout=10)
     finally:
         pending = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
@@ -218,12 +231,21 @@ class RemoveWSBehindMsg(logging.Filter):
 
 async def init_tortoise(db_url: str):
     log.debug(f"Database URL: {db_url}")
-    await Tortoise.init(config=TORTOISE_ORM)
+    replica_url = os.environ.get("BALLSDEXBOT_DB_REPLICA_URL")
+    config = tortoise_config(db_url, replica_url)
+    with startup_phase("database"):
+        await Tortoise.init(config=config)
+    instrument_pool()
+    if replica_url:
+        instrument_pool("replica")
+        read_router.start(settings.replica_max_lag)
+        log.info("Routing read-only queries to the replica.")
 
     # migrations
-    command = Command(TORTOISE_ORM, app="models")
-    await command.init()
-    migrations = await command.upgrade()
+    command = Command(config, app="models")
+    with startup_phase("migrations"):
+        await command.init()
+        migrations = await command.upgrade()
     if migrations:
         log.info(f"Ran {len(migrations)} migrations: {', '.join(migrations)}")
 
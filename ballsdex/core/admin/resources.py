@@ -179,7 +179,7 @@ class BallResource(Model):
         filters.ForeignKey(model=Economy, name="economy", label="Economy"),
         filters.Boolean(name="enabled", label="Enabled"),
         filters.Boolean(name="tradeable", label="Tradeable"),
-        # filters.Boolean(name="mergeable", label="Mergeable"),
+        filters.Boolean(name="mergeable", label="Mergeable"),
     ]
     fields = [
         "country",
@@ -193,7 +193,14 @@ class BallResource(Model):
         "rarity",
         "enabled",
         "tradeable",
-        # "mergeable",
+        "mergeable",
+        Field(
+            name="recipe",
+            label="Recipe",
+            input_=inputs.Text(
+                null=True, help_text="Names of the ingredients, separated by semicolons"
+            ),
+        ),
         Field(
             name="emoji_id",
             label="Emoji ID",
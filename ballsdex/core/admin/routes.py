@@ -7,6 +7,7 @@ from starlette.responses import Response
 from tortoise.exceptions import DoesNotExist
 
 from ballsdex.core.models import Ball, BallInstance, GuildConfig, Player, Special
+from ballsdex.core.stats import REDIS_KEY
 
 
 @app.get("/")
@@ -14,14 +15,18 @@ async def home(
     request: Request,
     resources=Depends(get_resources),
 ):
+    # counts are refreshed by the bot, only query them if the bot didn't publish anything yet
+    stats = await app.redis.hmget(REDIS_KEY, "players", "guilds")
+    if None in stats:
+        stats = (await Player.all().count(), await GuildConfig.all().count())
     return templates.TemplateResponse(
         "dashboard.html",
         context={
             "request": request,
             "resources": resources,
             "ball_count": await Ball.all().count(),
-            "player_count": await Player.all().count(),
-            "guild_count": await GuildConfig.all().count(),
+            "player_count": int(stats[0]),
+            "guild_count": int(stats[1]),
             "resource_label": "Dashboard",
             "page_pre_title": "overview",
             "page_title": "Dashboard",
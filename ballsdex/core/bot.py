@@ -1,17 +1,19 @@
 from __future__ import annotations
 
 import asyncio
+import hashlib
 import inspect
+import json
 import logging
 import math
 import types
 from datetime import datetime
-from typing import TYPE_CHECKING, cast
+from pathlib import Path
+from typing import TYPE_CHECKING, Sequence, cast
 
 import aiohttp
 import discord
 import discord.gateway
-from cachetools import TTLCache
 from discord import app_commands
 from discord.app_commands.translator import (
     TranslationContextLocation,
@@ -25,9 +27,13 @@ from rich import box, print
 from rich.console import Console
 from rich.table import Table
 
+from ballsdex.core.catches import CatchBuffer
 from ballsdex.core.commands import Core
+from ballsdex.core.completion import CompletionCache
 from ballsdex.core.dev import Dev
-from ballsdex.core.metrics import PrometheusServer
+from ballsdex.core.locks import LockManager
+from ballsdex.core.menu_refresh import MenuRefresher
+from ballsdex.core.metrics import PrometheusServer, mark_ready, startup_phase
 from ballsdex.core.models import (
     Ball,
     BlacklistedGuild,
@@ -40,6 +46,10 @@ from ballsdex.core.models import (
     regimes,
     specials,
 )
+from ballsdex.core.recipes import RecipeBook
+from ballsdex.core.sessions import SessionRegistry
+from ballsdex.core.stats import StatsService
+from ballsdex.core.users import UserResolver
 from ballsdex.settings import settings
 
 if TYPE_CHECKING:
@@ -50,6 +60,10 @@ http_counter = Histogram("discord_http_requests", "HTTP requests", ["key", "code
 
 PACKAGES = ["config", "players", "countryballs", "info", "admin", "trade", "balls"]
 
+# hashes of the last synced command trees, to skip syncing when nothing changed, stored in the
+# data path
+COMMAND_HASHES = ".command-hashes.json"
+
 
 def owner_check(ctx: commands.Context[BallsDexBot]):
     return ctx.bot.is_owner(ctx.author)
@@ -159,7 +173,20 @@ class BallsDexBot(commands.AutoShardedBot):
         self.blacklist_guild: set[int] = set()
         self.catch_log: set[int] = set()
         self.command_log: set[int] = set()
-        self.locked_balls = TTLCache(maxsize=99999, ttl=60 * 30)
+        self.locks = LockManager.from_settings()
+        self.catches = CatchBuffer(
+            settings.buffer_catches,
+            settings.catch_flush_interval,
+            journal=Path(settings.catch_journal) if settings.catch_journal else None,
+        )
+        self.completions = CompletionCache(catches=self.catches)
+        # rendered emoji of each countryball, indexed by ball ID
+        self.ball_emojis: dict[int, str] = {}
+        self.stats = StatsService()
+        self.menu_refresher = MenuRefresher()
+        self.sessions = SessionRegistry()
+        self.user_resolver = UserResolver(self)
+        self.recipes = RecipeBook()
 
         self.owner_ids: set
 
@@ -198,40 +225,113 @@ class BallsDexBot(commands.AutoShardedBot):
         table.add_column("Model", style="cyan")
         table.add_column("Count", justify="right", style="green")
 
+        # independent queries, ran concurrently on the connection pool
+        (
+            ball_list,
+            regime_list,
+            economy_list,
+            special_list,
+            blacklisted_users,
+            blacklisted_guilds,
+        ) = await asyncio.gather(
+            Ball.all(),
+            Regime.all(),
+            Economy.all(),
+            Special.all(),
+            BlacklistedID.all().values_list("discord_id", flat=True),
+            BlacklistedGuild.all().values_list("discord_id", flat=True),
+        )
+
         balls.clear()
-        for ball in await Ball.all():
-            balls[ball.pk] = ball
+        balls.update((x.pk, x) for x in ball_list)
         table.add_row(settings.collectible_name.title() + "s", str(len(balls)))
 
+        self.recipes.load_balls(balls.values())
+        table.add_row("Merge recipes", str(len(self.recipes.recipes)))
+
         regimes.clear()
-        for regime in await Regime.all():
-            regimes[regime.pk] = regime
+        regimes.update((x.pk, x) for x in regime_list)
         table.add_row("Regimes", str(len(regimes)))
 
         economies.clear()
-        for economy in await Economy.all():
-            economies[economy.pk] = economy
+        economies.update((x.pk, x) for x in economy_list)
         table.add_row("Economies", str(len(economies)))
 
         specials.clear()
-        for special in await Special.all():
-            specials[special.pk] = special
+        specials.update((x.pk, x) for x in special_list)
         table.add_row("Special events", str(len(specials)))
 
-        self.blacklist = set()
-        for blacklisted_id in await BlacklistedID.all().only("discord_id"):
-            self.blacklist.add(blacklisted_id.discord_id)
+        self.blacklist = set(blacklisted_users)  # type: ignore
         table.add_row("Blacklisted users", str(len(self.blacklist)))
 
-        self.blacklist_guild = set()
-        for blacklisted_id in await BlacklistedGuild.all().only("discord_id"):
-            self.blacklist_guild.add(blacklisted_id.discord_id)
+        self.blacklist_guild = set(blacklisted_guilds)  # type: ignore
         table.add_row("Blacklisted guilds", str(len(self.blacklist_guild)))
 
+        self.refresh_ball_emojis()
+
         log.info("Cache loaded, summary displayed below")
         console = Console()
         console.print(table)
 
+    async def command_tree_hash(self, guild: discord.abc.Snowflake | None = None) -> str:
+        """
+        Hash the payload sent to Discord when syncing the command tree.
+        """
+        translator = self.tree.translator
+        payload = []
+        for command in self.tree.get_commands(guild=guild):
+            # discord.py 2.4 added the tree to the parameters of the payload methods
+            method = command.get_translated_payload if translator else command.to_dict
+            args: tuple = (translator,) if translator else ()
+            if "tree" in inspect.signature(method).parameters:
+                args = (self.tree, *args)
+            payload.append(await discord.utils.maybe_coroutine(method, *args))
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    async def sync_command_tree(
+        self, guild: discord.abc.Snowflake | None = None
+    ) -> tuple[list[app_commands.AppCommand], bool]:
+        """
+        Sync the command tree with Discord, only if it changed since the last sync.
+
+        Syncing is heavily rate-limited, an unchanged tree is only fetched to retrieve the IDs
+        of the commands. The hashes of the synced trees are stored in `COMMAND_HASHES`, in the
+        data path of the settings.
+
+        Returns
+        -------
+        tuple[list[app_commands.AppCommand], bool]
+            The commands registered on Discord, and whether they were synced.
+        """
+        key = f"{self.application_id}:{guild.id if guild else 'global'}"
+        digest = await self.command_tree_hash(guild)
+        path = Path(settings.data_path, COMMAND_HASHES)
+        try:
+            hashes: dict[str, str] = json.loads(path.read_text())
+        except (OSError, ValueError):
+            hashes = {}
+        if hashes.get(key) == digest:
+            return await self.tree.fetch_commands(guild=guild), False
+
+        synced_commands = await self.tree.sync(guild=guild)
+        hashes[key] = digest
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(hashes))
+        except OSError:
+            log.warning("Failed to save the hash of the command tree", exc_info=True)
+        return synced_commands, True
+
+    def refresh_ball_emojis(self):
+        """
+        Render the emoji of each countryball once, balls with a missing emoji are skipped.
+        """
+        self.ball_emojis = {
+            pk: f"{emoji} "
+            for pk, ball in balls.items()
+            if (emoji := self.get_emoji(ball.emoji_id))
+        }
+
     async def gateway_healthy(self) -> bool:
         """Check whether or not the gateway proxy is ready and healthy."""
         if settings.gateway_url is None:
@@ -287,45 +387,56 @@ class BallsDexBot(commands.AutoShardedBot):
                 f"{await self.fetch_user(next(iter(self.owner_ids)))} is the owner of this bot."
             )
 
-        await self.load_cache()
+        with startup_phase("cache"):
+            await self.load_cache()
+            await self.locks.start()
+        self.catches.start()
         if self.blacklist:
             log.info(f"{len(self.blacklist)} blacklisted users.")
 
         log.info("Loading packages...")
-        await self.add_cog(Core(self))
-        if self.dev:
-            await self.add_cog(Dev())
-
-        loaded_packages = []
-        for package in PACKAGES:
-            try:
-                await self.load_extension("ballsdex.packages." + package)
-            except Exception:
-                log.error(f"Failed to load package {package}", exc_info=True)
-            else:
-                loaded_packages.append(package)
+        with startup_phase("packages"):
+            await self.add_cog(Core(self))
+            if self.dev:
+                await self.add_cog(Dev())
+
+            loaded_packages = []
+            for package in PACKAGES:
+                try:
+                    await self.load_extension("ballsdex.packages." + package)
+                except Exception:
+                    log.error(f"Failed to load package {package}", exc_info=True)
+                else:
+                    loaded_packages.append(package)
         if loaded_packages:
             log.info(f"Packages loaded: {', '.join(loaded_packages)}")
         else:
             log.info("No package loaded.")
 
-        synced_commands = await self.tree.sync()
-        if synced_commands:
-            log.info(f"Synced {len(synced_commands)} commands.")
-            try:
-                self.assign_ids_to_app_commands(synced_commands)
-            except Exception:
-                log.error("Failed to assign IDs to app commands", exc_info=True)
-        else:
-            log.info("No command to sync.")
-
-        if "admin" in PACKAGES:
-            for guild_id in settings.admin_guild_ids:
-                guild = self.get_guild(guild_id)
-                if not guild:
-                    continue
-                synced_commands = await self.tree.sync(guild=guild)
-                log.info(f"Synced {len(synced_commands)} admin commands for guild {guild.id}.")
+        with startup_phase("command sync"):
+            synced_commands, synced = await self.sync_command_tree()
+            if synced_commands:
+                if synced:
+                    log.info(f"Synced {len(synced_commands)} commands.")
+                else:
+                    log.info(f"Command tree unchanged, {len(synced_commands)} commands.")
+                try:
+                    self.assign_ids_to_app_commands(synced_commands)
+                except Exception:
+                    log.error("Failed to assign IDs to app commands", exc_info=True)
+            else:
+                log.info("No command to sync.")
+
+            if "admin" in PACKAGES:
+                for guild_id in settings.admin_guild_ids:
+                    guild = self.get_guild(guild_id)
+                    if not guild:
+                        continue
+                    synced_commands, synced = await self.sync_command_tree(guild)
+                    if synced:
+                        log.info(
+                            f"Synced {len(synced_commands)} admin commands for guild {guild.id}."
+                        )
 
         if settings.prometheus_enabled:
             try:
@@ -333,6 +444,9 @@ class BallsDexBot(commands.AutoShardedBot):
             except Exception:
                 log.exception("Failed to start Prometheus server, stats will be unavailable.")
 
+        self.stats.start()
+        mark_ready()
+
         print(
             f"\n    [bold][red]{settings.bot_name} bot[/red] [green]"
             "is now operational![/green][/bold]\n"
@@ -366,6 +480,14 @@ class BallsDexBot(commands.AutoShardedBot):
             )
         return True
 
+    async def on_guild_emojis_update(
+        self,
+        guild: discord.Guild,
+        before: Sequence[discord.Emoji],
+        after: Sequence[discord.Emoji],
+    ):
+        self.refresh_ball_emojis()
+
     async def on_command_error(
         self, context: commands.Context, exception: commands.errors.CommandError
     ):
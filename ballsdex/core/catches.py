@@ -0,0 +1,340 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from asyncpg import DataError
+from prometheus_client import Counter, Gauge, Histogram
+from tortoise.exceptions import IntegrityError
+
+from ballsdex.core import repository
+from ballsdex.core.models import BallInstanceView
+
+if TYPE_CHECKING:
+    from ballsdex.core.repository import PlayerRow
+
+log = logging.getLogger("ballsdex.core.catches")
+# dead-letter log, the values of the catches the database refused
+rejected_log = logging.getLogger("ballsdex.core.catches.rejected")
+
+buffer_size = Gauge("catch_buffer_size", "Number of catches waiting to be written")
+flush_duration = Histogram("catch_buffer_flush_duration", "Time taken to write buffered catches")
+flush_errors = Counter("catch_buffer_flush_errors", "Number of failed writes of buffered catches")
+rejected = Counter("catch_buffer_rejected", "Number of buffered catches refused by the database")
+
+
+class CatchJournal:
+    """
+    Append-only file of the queued catches, so that they survive a crash of the bot.
+
+    Each line holds the Discord ID of the owner followed by the values of the row, in JSON.
+
+    Parameters
+    ----------
+    path: Path
+        The file, created if needed.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._fd: int | None = None
+
+    def open(self) -> list[tuple[int, tuple[Any, ...]]]:
+        """
+        Open the journal for writing, returning the catches it already holds.
+        """
+        entries: list[tuple[int, tuple[Any, ...]]] = []
+        if self.path.exists():
+            for line in self.path.read_text().splitlines():
+                try:
+                    discord_id, *row = json.loads(line)
+                except ValueError:
+                    # the bot stopped in the middle of a write, that catch was not acknowledged
+                    log.warning(f"Ignoring a truncated line of the catch journal: {line!r}")
+                    continue
+                row[8] = datetime.fromisoformat(row[8])
+                entries.append((discord_id, tuple(row)))
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        return entries
+
+    def _write(self, data: bytes):
+        assert self._fd is not None
+        os.write(self._fd, data)
+        os.fsync(self._fd)
+
+    async def append(self, discord_id: int, row: tuple[Any, ...]):
+        """
+        Append a catch and wait until it is on the disk.
+        """
+        line = json.dumps([discord_id, *row[:8], row[8].isoformat()]) + "\n"
+        await asyncio.to_thread(self._write, line.encode())
+
+    def clear(self):
+        """
+        Empty the journal, once all of its catches were written to the database.
+        """
+        if self._fd is not None:
+            os.ftruncate(self._fd, 0)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class CatchBuffer:
+    """
+    Write-behind buffer for the catches, batching their inserts during spawn storms.
+
+    When enabled, a caught instance gets its ID right away from a block reserved on the
+    ``ballinstance`` sequence, and is queued. The queue is written with a single multi-row
+    insert every `interval` seconds. A failed write keeps the catches queued and is retried
+    with the same IDs, the rows already written being skipped. If the database refuses the
+    rows (such as a constraint violation), the batch is split to find the faulty catches,
+    which are dropped from the queue and written to the ``ballsdex.core.catches.rejected``
+    log. The queue is flushed when the bot shuts down, and the catches that could not be
+    written are logged with their values.
+
+    With a `journal`, a catch is also appended to that file and synced to the disk before
+    being acknowledged. The file is emptied whenever the queue is, and the catches left in it
+    by a crash are queued again on startup. Without a journal, the queued catches are lost if
+    the bot is killed.
+
+    Reads that must see the catches of a player, like the inventory commands, call
+    `ensure_written` first.
+
+    When disabled, instances are inserted immediately.
+
+    Parameters
+    ----------
+    enabled: bool
+        Buffer the catches. If not, `create` inserts them directly.
+    interval: float
+        Number of seconds between two writes.
+    batch_size: int
+        Maximum number of catches written by a single statement.
+    id_block_size: int
+        Number of IDs reserved at once.
+    journal: Path | None
+        The file where the queued catches are persisted, if any.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        interval: float = 0.05,
+        batch_size: int = 1000,
+        id_block_size: int = 100,
+        journal: Path | None = None,
+    ):
+        self.enabled = enabled
+        self.interval = interval
+        self.batch_size = batch_size
+        self.id_block_size = id_block_size
+        self.journal = CatchJournal(journal) if journal else None
+        self.pending: list[tuple[Any, ...]] = []
+        # Discord ID of the owner of each queued instance, and number of queued catches of
+        # each owner
+        self._owners: dict[int, int] = {}
+        self._players: dict[int, int] = {}
+        self.task: asyncio.Task | None = None
+        self._ids: deque[int] = deque()
+        self._ids_lock = asyncio.Lock()
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+
+    def start(self):
+        if not self.enabled:
+            return
+        buffer_size.set_function(lambda: len(self.pending))
+        if self.journal and self.journal._fd is None:
+            entries = self.journal.open()
+            if entries:
+                log.warning(f"Writing {len(entries)} catches left in the journal")
+            for discord_id, row in entries:
+                self._queue(discord_id, row)
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """
+        Stop the background writes and flush the remaining catches.
+        """
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        for attempt in range(3):
+            try:
+                await self.flush()
+            except Exception:
+                log.warning(f"Failed to flush the buffered catches ({attempt + 1}/3)")
+                await asyncio.sleep(1)
+            else:
+                if self.journal:
+                    self.journal.close()
+                return
+        if self.journal:
+            log.critical(
+                f"{len(self.pending)} catches were not written to the database, they are kept "
+                f"in {self.journal.path} and will be written on next start"
+            )
+            self.journal.close()
+            return
+        log.critical(f"{len(self.pending)} catches were not written to the database!")
+        for row in self.pending:
+            log.critical(f"Lost catch: {row!r}")
+
+    async def _loop(self):
+        while True:
+            await self._wakeup.wait()
+            # let the other catches of the storm join the batch
+            await asyncio.sleep(self.interval)
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                log.exception("Failed to write the buffered catches, retrying")
+                await asyncio.sleep(1)
+                self._wakeup.set()
+
+    async def _next_id(self) -> int:
+        async with self._ids_lock:
+            if not self._ids:
+                self._ids.extend(await repository.reserve_instance_ids(self.id_block_size))
+            return self._ids.popleft()
+
+    def _queue(self, discord_id: int, row: tuple[Any, ...]):
+        self.pending.append(row)
+        self._owners[row[0]] = discord_id
+        self._players[discord_id] = self._players.get(discord_id, 0) + 1
+        self._wakeup.set()
+
+    def _dequeue(self, rows: list[tuple[Any, ...]]):
+        for row in rows:
+            discord_id = self._owners.pop(row[0])
+            self._players[discord_id] -= 1
+            if not self._players[discord_id]:
+                del self._players[discord_id]
+
+    async def create(
+        self,
+        player: "PlayerRow",
+        ball_id: int,
+        *,
+        shiny: bool = False,
+        special_id: int | None = None,
+        attack_bonus: int = 0,
+        health_bonus: int = 0,
+        server_id: int | None = None,
+    ) -> BallInstanceView:
+        """
+        Create a caught instance, queued for writing if the buffer is enabled.
+
+        The parameters are the same as `repository.create_instance`, except for the owner
+        which is given as returned by `repository.get_or_create_player`.
+        """
+        if not self.enabled or self.task is None:
+            return await repository.create_instance(
+                player.id,
+                ball_id,
+                shiny=shiny,
+                special_id=special_id,
+                attack_bonus=attack_bonus,
+                health_bonus=health_bonus,
+                server_id=server_id,
+            )
+        instance = BallInstanceView(
+            await self._next_id(),
+            ball_id,
+            player.id,
+            shiny,
+            special_id,
+            False,
+            attack_bonus,
+            health_bonus,
+            datetime.now(timezone.utc),
+        )
+        row = (
+            instance.id,
+            ball_id,
+            player.id,
+            shiny,
+            special_id,
+            attack_bonus,
+            health_bonus,
+            server_id,
+            instance.catch_date,
+        )
+        # queued before being journaled, the journal is only emptied with the queue
+        self._queue(player.discord_id, row)
+        if self.journal:
+            await self.journal.append(player.discord_id, row)
+        return instance
+
+    async def ensure_written(
+        self, *, discord_id: int | None = None, instance_id: int | None = None
+    ):
+        """
+        Write the queue now if it holds catches of this player or this instance, for the reads
+        that must see them.
+
+        Parameters
+        ----------
+        discord_id: int | None
+            The Discord ID of a player about to be read.
+        instance_id: int | None
+            The ID of an instance about to be read.
+        """
+        if discord_id in self._players or instance_id in self._owners:
+            await self.flush()
+
+    async def flush(self):
+        """
+        Write the queued catches now.
+        """
+        async with self._flush_lock:
+            while self.pending:
+                batch = self.pending[: self.batch_size]
+                start = time.perf_counter()
+                try:
+                    refused = await self._write(batch)
+                except Exception:
+                    flush_errors.inc()
+                    raise
+                flush_duration.observe(time.perf_counter() - start)
+                for row in refused:
+                    rejected.inc()
+                    rejected_log.error(f"Catch refused by the database: {row!r}")
+                # catches queued during the write were appended after the batch
+                del self.pending[: len(batch)]
+                self._dequeue(batch)
+            if self.journal:
+                self.journal.clear()
+
+    async def _write(self, batch: list[tuple[Any, ...]]) -> list[tuple[Any, ...]]:
+        """
+        Insert a batch, splitting it in halves until the rows refused by the database are
+        isolated. Other errors are raised, the whole batch being retried later.
+
+        Returns
+        -------
+        list[tuple[Any, ...]]
+            The rows that could not be written.
+        """
+        try:
+            await repository.insert_instances(batch)
+        except (IntegrityError, DataError):
+            # caused by the values themselves, retrying the same rows would fail forever
+            if len(batch) == 1:
+                return batch
+            log.warning(f"A batch of {len(batch)} catches was refused, splitting it")
+            middle = len(batch) // 2
+            return await self._write(batch[:middle]) + await self._write(batch[middle:])
+        return []
@@ -5,6 +5,8 @@ from typing import TYPE_CHECKING
 from discord.ext import commands
 from tortoise import Tortoise
 
+from ballsdex.core.utils.tortoise import check_player_ball_stats
+
 log = logging.getLogger("ballsdex.core.commands")
 
 if TYPE_CHECKING:
@@ -71,10 +73,36 @@ class Core(commands.Cog):
     @commands.is_owner()
     async def analyzedb(self, ctx: commands.Context):
         """
-        Analyze the database. This refreshes the counts displayed by the `/about` command.
+        Analyze the database. This also refreshes the counts displayed by the `/about` command
+        and the admin panel.
         """
         connection = Tortoise.get_connection("default")
         t1 = time.time()
         await connection.execute_query("ANALYZE")
+        await self.bot.stats.refresh()
         t2 = time.time()
         await ctx.send(f"Analyzed database in {round((t2 - t1) * 1000)}ms.")
+
+    @commands.command()
+    @commands.is_owner()
+    async def checkstats(self, ctx: commands.Context, rebuild: bool = False):
+        """
+        Check the consistency of the per-player ball counters, used by the count commands.
+
+        Pass `rebuild` to rebuild the counters from scratch if they are inconsistent.
+        """
+        t1 = time.time()
+        mismatches = await check_player_ball_stats(rebuild=rebuild)
+        t2 = time.time()
+        if not mismatches:
+            await ctx.send(f"Counters are consistent (checked in {round((t2 - t1) * 1000)}ms).")
+        elif rebuild:
+            await ctx.send(
+                f"{mismatches} inconsistent counters found, "
+                f"table rebuilt in {round((t2 - t1) * 1000)}ms."
+            )
+        else:
+            await ctx.send(
+                f"{mismatches} inconsistent counters found. "
+                "Run this command again with `rebuild` set to true to fix them."
+            )
@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Iterable
+
+from cachetools import TTLCache
+
+from ballsdex.core import repository
+from ballsdex.core.db import read_router
+
+if TYPE_CHECKING:
+    from ballsdex.core.catches import CatchBuffer
+    from ballsdex.core.models import BallInstance, BallInstanceView
+
+
+class PlayerCompletion:
+    """
+    The countryballs owned by a player, stored as bitsets over ball IDs.
+
+    Bit ``n`` of a bitset is set when the player owns at least one instance of the ball with
+    ID ``n``. One bitset is kept per (shiny, special ID) couple, and they are combined on read.
+
+    Attributes
+    ----------
+    bitsets: dict[tuple[bool, int | None], int]
+        Bitsets of owned ball IDs, indexed by shiny and special ID.
+    """
+
+    __slots__ = ("bitsets",)
+
+    def __init__(self):
+        self.bitsets: dict[tuple[bool, int | None], int] = {}
+
+    def add(self, ball_id: int, shiny: bool, special_id: int | None):
+        key = (shiny, special_id)
+        self.bitsets[key] = self.bitsets.get(key, 0) | (1 << ball_id)
+
+    def owned(self, *, shiny: bool | None = None, special_id: int | None = None) -> int:
+        """
+        Return the bitset of the owned ball IDs, optionally filtered.
+
+        Parameters
+        ----------
+        shiny: bool | None
+            Only count shiny (or non-shiny) instances.
+        special_id: int | None
+            Only count instances of this special.
+        """
+        bitset = 0
+        for (is_shiny, special), bits in self.bitsets.items():
+            if shiny is not None and is_shiny != shiny:
+                continue
+            if special_id is not None and special != special_id:
+                continue
+            bitset |= bits
+        return bitset
+
+    def owns(
+        self, ball_id: int, *, shiny: bool | None = None, special_id: int | None = None
+    ) -> bool:
+        return bool(self.owned(shiny=shiny, special_id=special_id) >> ball_id & 1)
+
+
+class CompletionCache:
+    """
+    Maintains the completion of the active players in memory.
+
+    The completion of a player is built with a single query on first access, then updated
+    incrementally when instances are obtained or lost. Entries expire after `ttl` seconds, to
+    pick up the changes made outside of the bot, like on the admin panel.
+
+    Players are indexed by their Discord ID. Completions are built from the read replica, unless
+    the player obtained or lost instances recently.
+
+    The changes made while a query of the same player is running are recorded, and replayed
+    on its result once it returns. The catches of the player still queued in `catches` are
+    written before querying.
+    """
+
+    def __init__(
+        self, maxsize: int = 10000, ttl: float = 60 * 60, catches: "CatchBuffer | None" = None
+    ):
+        self.catches = catches
+        self.cache: TTLCache[int, PlayerCompletion] = TTLCache(maxsize=maxsize, ttl=ttl)
+        # changes of the players with a running query, one list per query. Obtained instances
+        # are recorded as (ball ID, shiny, special ID), lost ones as None
+        self._changes: dict[int, list[list[tuple[int, bool, int | None] | None]]] = {}
+
+    def _record(self, discord_id: int, change: tuple[int, bool, int | None] | None):
+        for changes in self._changes.get(discord_id, ()):
+            changes.append(change)
+
+    async def _query(
+        self, discord_id: int, ball_ids: Iterable[int] | None = None, *, primary: bool = False
+    ) -> tuple[list[tuple[int, bool, int | None]], list[tuple[int, bool, int | None] | None]]:
+        """
+        Query the owned combinations, returning them with the changes made in the meantime.
+        """
+        connection = None if primary else read_router.connection(discord_id)
+        changes: list[tuple[int, bool, int | None] | None] = []
+        self._changes.setdefault(discord_id, []).append(changes)
+        try:
+            if self.catches:
+                await self.catches.ensure_written(discord_id=discord_id)
+            rows = await repository.completion_rows(discord_id, ball_ids, connection=connection)
+        finally:
+            running = self._changes[discord_id]
+            running.remove(changes)
+            if not running:
+                del self._changes[discord_id]
+        return rows, changes
+
+    async def get(self, discord_id: int) -> PlayerCompletion:
+        """
+        Return the completion of a player, building it if not cached.
+        """
+        completion = self.cache.get(discord_id)
+        if completion is None:
+            completion = PlayerCompletion()
+            rows, changes = await self._query(discord_id)
+            for ball_id, shiny, special_id in rows + [x for x in changes if x is not None]:
+                completion.add(ball_id, shiny, special_id)
+            # the query may have missed a loss, only cache a result known to be complete
+            if None not in changes:
+                self.cache[discord_id] = completion
+        return completion
+
+    def add(self, discord_id: int, *instances: "BallInstance | BallInstanceView"):
+        """
+        Register instances obtained by a player (catch, trade, donation, merge...)
+        """
+        read_router.mark_write(discord_id)
+        for instance in instances:
+            self._record(discord_id, (instance.ball_id, instance.shiny, instance.special_id))
+        completion = self.cache.get(discord_id)
+        if completion is None:
+            return  # will be built on next access
+        for instance in instances:
+            completion.add(instance.ball_id, instance.shiny, instance.special_id)
+
+    async def remove(self, discord_id: int, *instances: "BallInstance | BallInstanceView"):
+        """
+        Register instances lost by a player (trade, donation, merge, deletion...)
+
+        A player may own other copies of these balls, so their bits are queried again.
+        """
+        read_router.mark_write(discord_id)
+        if instances:
+            self._record(discord_id, None)
+        completion = self.cache.get(discord_id)
+        if completion is None or not instances:
+            return
+        ball_ids = {x.ball_id for x in instances}
+        # the deletion was just committed, the replica may not have it yet
+        rows, changes = await self._query(discord_id, ball_ids, primary=True)
+        if None in changes:
+            # another loss raced with this one, build it again rather than guessing
+            self.invalidate(discord_id)
+            return
+
+        # the instances obtained during the query may not be part of its result
+        mask = ~sum(1 << x for x in ball_ids)
+        for key in completion.bitsets:
+            completion.bitsets[key] &= mask
+        for ball_id, shiny, special_id in rows + [x for x in changes if x is not None]:
+            completion.add(ball_id, shiny, special_id)
+
+    def invalidate(self, discord_id: int):
+        """
+        Drop the completion of a player, it will be built again on next access.
+        """
+        self.cache.pop(discord_id, None)
+
+
+def iter_bits(bitset: int) -> Iterable[int]:
+    """
+    Yield the positions of the set bits, in ascending order.
+    """
+    while bitset:
+        lowest = bitset & -bitset
+        yield lowest.bit_length() - 1
+        bitset ^= lowest
+
+
+def completion_fields(title: str, texts: list[str], limit: int = 1024) -> list[tuple[str, str]]:
+    """
+    Pack pre-rendered emoji strings into embed fields of at most `limit` characters.
+
+    Parameters
+    ----------
+    title: str
+        The name of the first field, the following ones are left blank.
+    texts: list[str]
+        The rendered emojis, in display order.
+    limit: int
+        The maximum length of a field value.
+
+    Returns
+    -------
+    list[tuple[str, str]]
+        The name and value of each field.
+    """
+    fields: list[tuple[str, str]] = []
+    start = 0
+    length = 0
+    for i, text in enumerate(texts):
+        if length + len(text) > limit:
+            # hitting embed limits, adding an intermediate field
+            fields.append(("\u200B", "".join(texts[start:i])))
+            start = i
+            length = 0
+        length += len(text)
+    if start < len(texts):
+        fields.append(("\u200B", "".join(texts[start:])))
+    if fields:
+        fields[0] = (f"__**{title}**__", fields[0][1])
+    return fields
@@ -0,0 +1,305 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import re
+import time
+from functools import lru_cache, partial
+from typing import TYPE_CHECKING, Any, Hashable
+
+from cachetools import TTLCache
+from prometheus_client import Counter, Gauge, Histogram
+from tortoise import Tortoise
+from tortoise.backends.base.config_generator import expand_db_url
+
+from ballsdex.settings import settings
+
+if TYPE_CHECKING:
+    import asyncpg
+    from asyncpg.connection import LoggedQuery
+    from asyncpg.pool import PoolAcquireContext
+    from tortoise.backends.base.client import BaseDBAsyncClient
+
+log = logging.getLogger("ballsdex.core.db")
+
+# distinct query shapes exported as labels, the others are grouped together
+MAX_QUERY_SHAPES = 500
+
+query_duration = Histogram(
+    "db_query_duration", "Time taken to execute SQL queries", ["connection", "query"]
+)
+pool_acquire_duration = Histogram(
+    "db_pool_acquire_duration", "Time waited for a connection from the pool", ["connection"]
+)
+pool_connections = Gauge(
+    "db_pool_connections", "Number of open connections in the pool", ["connection"]
+)
+pool_connections_in_use = Gauge(
+    "db_pool_connections_in_use", "Number of pool connections currently used", ["connection"]
+)
+replica_lag = Gauge("db_replica_lag_seconds", "Replication lag of the read replica")
+read_routes = Counter("db_read_routes", "Number of reads routed to each connection", ["target"])
+
+_placeholders = re.compile(r"\$\d+(?:\s*,\s*\$\d+)*")
+_literals = re.compile(r"'(?:[^']|'')*'|(?<!\$)\b\d+(?:\.\d+)?\b")
+_spaces = re.compile(r"\s+")
+_shapes: set[str] = set()
+
+
+@lru_cache(maxsize=4096)
+def normalize_query(query: str) -> str:
+    """
+    Reduce a query to its shape, replacing literals and lists of parameters, to be used as a
+    metric label.
+    """
+    # placeholders first, their numbers are not literals
+    query = _placeholders.sub("$n", query)
+    query = _literals.sub("?", query)
+    return _spaces.sub(" ", query).strip()[:200]
+
+
+def _connection_config(db_url: str, connection_name: str) -> dict[str, Any]:
+    connection = expand_db_url(db_url)
+    credentials = connection["credentials"]
+    credentials.update(
+        minsize=settings.db_pool_min_size,
+        maxsize=settings.db_pool_max_size,
+        statement_cache_size=settings.db_statement_cache_size,
+        init=partial(_init_connection, connection_name),
+    )
+    if settings.db_statement_timeout:
+        credentials["server_settings"] = {
+            "statement_timeout": str(int(settings.db_statement_timeout * 1000))
+        }
+    return connection
+
+
+def tortoise_config(db_url: str, replica_url: str | None = None) -> dict[str, Any]:
+    """
+    Build the Tortoise configuration, with the pool options from the settings.
+
+    Parameters
+    ----------
+    db_url: str
+        The URL of the primary database.
+    replica_url: str | None
+        The URL of a read replica, registered as the ``replica`` connection. Models are always
+        bound to the primary, reads are sent to the replica through `read_router`.
+    """
+    connections = {"default": _connection_config(db_url, "default")}
+    if replica_url:
+        connections["replica"] = _connection_config(replica_url, "replica")
+    return {
+        "connections": connections,
+        "apps": {
+            "models": {
+                "models": ["ballsdex.core.models", "aerich.models"],
+                "default_connection": "default",
+            },
+        },
+    }
+
+
+def _observe_query(connection_name: str, record: "LoggedQuery"):
+    query = normalize_query(record.query)
+    if settings.slow_query_threshold and record.elapsed >= settings.slow_query_threshold:
+        log.warning(f"Slow query on {connection_name} ({record.elapsed:.3f}s): {query}")
+    if query not in _shapes:
+        if len(_shapes) >= MAX_QUERY_SHAPES:
+            query = "other"
+        else:
+            _shapes.add(query)
+    query_duration.labels(connection=connection_name, query=query).observe(record.elapsed)
+
+
+async def _init_connection(connection_name: str, connection: "asyncpg.Connection"):
+    connection.add_query_logger(partial(_observe_query, connection_name))
+
+
+class _TimedAcquire:
+    """
+    Wrap the acquisition of a connection to measure the time spent waiting for it.
+    """
+
+    def __init__(self, context: "PoolAcquireContext", connection_name: str):
+        self.context = context
+        self.connection_name = connection_name
+        self.start = time.perf_counter()
+
+    def _observe(self):
+        pool_acquire_duration.labels(connection=self.connection_name).observe(
+            time.perf_counter() - self.start
+        )
+
+    def __await__(self):
+        connection = yield from self.context.__await__()
+        self._observe()
+        return connection
+
+    async def __aenter__(self):
+        connection = await self.context.__aenter__()
+        self._observe()
+        return connection
+
+    async def __aexit__(self, *args):
+        return await self.context.__aexit__(*args)
+
+
+class _InstrumentedPool:
+    def __init__(self, pool: "asyncpg.Pool", connection_name: str):
+        self._pool = pool
+        self._connection_name = connection_name
+
+    def acquire(self, *args, **kwargs) -> _TimedAcquire:
+        return _TimedAcquire(self._pool.acquire(*args, **kwargs), self._connection_name)
+
+    def __getattr__(self, name: str):
+        return getattr(self._pool, name)
+
+
+def instrument_pool(connection_name: str = "default"):
+    """
+    Export the pool metrics of a Tortoise connection. Must be called after `Tortoise.init`.
+    """
+    client = Tortoise.get_connection(connection_name)
+    # Tortoise has no hook for this, the pool is a private attribute of the asyncpg client
+    if getattr(client, "_pool", None) is not None:
+        client._pool = _InstrumentedPool(client._pool, connection_name)  # type: ignore
+    # the pool is created again after a connection loss
+    create_pool = client.create_pool  # type: ignore
+
+    async def create_instrumented_pool(**kwargs):
+        return _InstrumentedPool(await create_pool(**kwargs), connection_name)
+
+    client.create_pool = create_instrumented_pool  # type: ignore
+
+    def pool_size(idle: bool):
+        pool = getattr(client, "_pool", None)
+        if pool is None:
+            return 0
+        return pool.get_size() - (pool.get_idle_size() if idle else 0)
+
+    pool_connections.labels(connection=connection_name).set_function(lambda: pool_size(False))
+    pool_connections_in_use.labels(connection=connection_name).set_function(
+        lambda: pool_size(True)
+    )
+
+
+class ReadRouter:
+    """
+    Route the read-only queries that opt in to the read replica, when one is configured.
+
+    The replication lag is checked periodically, the primary is used while the replica is
+    unreachable or lagging behind by more than `max_lag` seconds. Flows reading right after
+    writing register their writes with `mark_write`, their reads go to the primary until the
+    replica is guaranteed to have caught up.
+
+    Parameters
+    ----------
+    max_lag: float
+        Maximum replication lag tolerated, in seconds. Also the duration during which reads
+        following a write are sent to the primary.
+    check_interval: float
+        Number of seconds between two checks of the replication lag.
+    max_tracked: int
+        Maximum number of recent writers tracked. When more write within `max_lag`, all the
+        reads of a writer go to the primary until the burst is over.
+    """
+
+    def __init__(self, max_lag: float = 5, check_interval: float = 10, max_tracked: int = 100000):
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.max_tracked = max_tracked
+        self.enabled = False
+        self.healthy = False
+        self.task: asyncio.Task | None = None
+        self.recent_writes: TTLCache[Hashable, bool] = TTLCache(maxsize=max_tracked, ttl=max_lag)
+        # writers may have been evicted before the end of their delay until then
+        self._saturated_until = 0.0
+
+    def start(self, max_lag: float | None = None):
+        """
+        Start routing reads to the ``replica`` connection. Must be called after `Tortoise.init`.
+        """
+        if max_lag is not None and max_lag != self.max_lag:
+            self.max_lag = max_lag
+            self.recent_writes = TTLCache(maxsize=self.max_tracked, ttl=max_lag)
+        self.enabled = True
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        self.enabled = False
+        self.healthy = False
+        if self.task:
+            self.task.cancel()
+
+    async def _loop(self):
+        while True:
+            try:
+                lag = await self.check_lag()
+            except Exception:
+                log.warning("Failed to check the replica lag, reading from primary", exc_info=True)
+                self.healthy = False
+            else:
+                replica_lag.set(lag)
+                if self.healthy and lag > self.max_lag:
+                    log.warning(f"Replica lagging by {lag:.1f}s, reading from primary")
+                elif not self.healthy and lag <= self.max_lag:
+                    log.info("Replica caught up, reading from replica")
+                self.healthy = lag <= self.max_lag
+            await asyncio.sleep(self.check_interval)
+
+    async def check_lag(self) -> float:
+        """
+        Query the replication lag of the replica, in seconds.
+        """
+        connection = Tortoise.get_connection("replica")
+        # the replay timestamp does not move while the primary is idle, only trust it when
+        # there is something left to replay
+        _, rows = await connection.execute_query(
+            "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+            "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END AS lag"
+        )
+        lag = rows[0]["lag"] if rows else None
+        return float(lag) if lag is not None else 0
+
+    def mark_write(self, key: Hashable):
+        """
+        Register a write made on behalf of `key`, usually a Discord user ID. Its next reads go
+        to the primary.
+        """
+        if not self.enabled:
+            return
+        if key not in self.recent_writes and len(self.recent_writes) >= self.max_tracked:
+            self.recent_writes.expire()
+            if len(self.recent_writes) >= self.max_tracked:
+                # the insert evicts a writer whose reads must still go to the primary
+                self._saturated_until = time.monotonic() + self.max_lag
+        self.recent_writes[key] = True
+
+    def connection(self, key: Hashable | None = None) -> "BaseDBAsyncClient":
+        """
+        Return the connection to use for a read-only query.
+
+        Parameters
+        ----------
+        key: Hashable | None
+            The key passed to `mark_write` by the flows writing the data read. If it wrote
+            recently, the primary is returned.
+        """
+        if (
+            self.enabled
+            and self.healthy
+            and (
+                key is None
+                or (key not in self.recent_writes and time.monotonic() >= self._saturated_until)
+            )
+        ):
+            read_routes.labels(target="replica").inc()
+            return Tortoise.get_connection("replica")
+        read_routes.labels(target="default").inc()
+        return Tortoise.get_connection("default")
+
+
+read_router = ReadRouter()
@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, NamedTuple
+
+from cachetools import TLRUCache
+from tortoise import Tortoise
+
+from ballsdex.core.models import BallInstance
+from ballsdex.settings import settings
+
+if TYPE_CHECKING:
+    from redis.asyncio import Redis
+
+log = logging.getLogger("ballsdex.core.locks")
+
+# acquire all the keys or none, and index the keys by owner to list them later
+ACQUIRE_SCRIPT = """
+for i, key in ipairs(KEYS) do
+    if redis.call("EXISTS", key) == 1 then
+        return 0
+    end
+end
+for i, key in ipairs(KEYS) do
+    redis.call("SET", key, ARGV[1], "PX", ARGV[2])
+    redis.call("SADD", ARGV[3], ARGV[i + 3])
+end
+redis.call("PEXPIRE", ARGV[3], ARGV[2])
+return 1
+"""
+# only delete the keys still held by the given owners, a lock may have expired and been taken
+RELEASE_SCRIPT = """
+for i, key in ipairs(KEYS) do
+    if redis.call("GET", key) == ARGV[i] then
+        redis.call("DEL", key)
+    end
+end
+"""
+
+
+class Lock(NamedTuple):
+    owner: int
+    expires: float
+
+
+class RedisLockBackend:
+    """
+    Share the locks between multiple processes through Redis.
+
+    Each lock is a key expiring with the lock, holding the Discord ID of its owner.
+    """
+
+    prefix = "ballsdex:lock"
+
+    def __init__(self, redis: "Redis"):
+        self.redis = redis
+        self.acquire_script = redis.register_script(ACQUIRE_SCRIPT)
+        self.release_script = redis.register_script(RELEASE_SCRIPT)
+
+    def _key(self, pk: int) -> str:
+        return f"{self.prefix}:{pk}"
+
+    def _owner_key(self, owner: int) -> str:
+        return f"{self.prefix}:owner:{owner}"
+
+    async def acquire(self, owner: int, pks: list[int], ttl: float) -> bool:
+        result = await self.acquire_script(
+            keys=[self._key(x) for x in pks],
+            args=[owner, int(ttl * 1000), self._owner_key(owner), *pks],
+        )
+        return bool(result)
+
+    async def release(self, locks: dict[int, int]):
+        await self.release_script(
+            keys=[self._key(x) for x in locks], args=[str(x) for x in locks.values()]
+        )
+
+    async def owned(self, owner: int) -> set[int]:
+        members = [int(x) for x in await self.redis.smembers(self._owner_key(owner))]
+        if not members:
+            return set()
+        # the owner set is never cleaned on release, check which locks are still held
+        values = await self.redis.mget([self._key(x) for x in members])
+        return {pk for pk, value in zip(members, values) if value == str(owner)}
+
+
+class LockManager:
+    """
+    Lock ball instances while they are part of a trade, a merge or a donation.
+
+    The lock table is held in memory and is authoritative. Changes are written to the
+    ``locked`` column of `BallInstance` in the background, only to recover the locks after a
+    restart. Locks expire after `ttl` seconds.
+
+    If a `RedisLockBackend` is given, Redis becomes the authority, allowing multiple processes
+    to share the locks. The memory table is then a mirror of this process' locks, used for
+    display and to release only the keys still held by their owner.
+
+    Parameters
+    ----------
+    ttl: float
+        Number of seconds before a lock expires.
+    flush_interval: float
+        Number of seconds between two writes of the pending changes to the database.
+    backend: RedisLockBackend | None
+        The optional Redis backend.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 30 * 60,
+        flush_interval: float = 5,
+        backend: RedisLockBackend | None = None,
+    ):
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.backend = backend
+        self.locks: TLRUCache[int, Lock] = TLRUCache(
+            maxsize=1_000_000, ttu=lambda _, value, now: value.expires, timer=time.time
+        )
+        # owner to the IDs it locked, expired locks are pruned when listed
+        self._owned: dict[int, set[int]] = {}
+        # write-behind queue, ball instance ID to its new lock date
+        self._dirty: dict[int, datetime | None] = {}
+        self._mutex = asyncio.Lock()
+        self.task: asyncio.Task | None = None
+
+    async def start(self):
+        """
+        Restore the locks saved in the database and start flushing changes.
+        """
+        if self.backend is None:
+            now = time.time()
+            for pk, owner, locked in await BallInstance.filter(
+                locked__gt=datetime.fromtimestamp(now - self.ttl, timezone.utc)
+            ).values_list("id", "player__discord_id", "locked"):
+                self.locks[pk] = Lock(owner, locked.timestamp() + self.ttl)
+                self._owned.setdefault(owner, set()).add(pk)
+            if self.locks:
+                log.info(f"Restored {len(self.locks)} locks from the database.")
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+        await self.flush()
+
+    def is_locked(self, pk: int) -> bool:
+        """
+        Synchronously check if an instance is locked. With the Redis backend, only the locks
+        held by this process are known.
+        """
+        return pk in self.locks
+
+    async def acquire(self, owner: int, *instances: BallInstance) -> bool:
+        """
+        Lock the given instances, all of them or none.
+
+        Parameters
+        ----------
+        owner: int
+            The Discord ID of the player locking the instances.
+        *instances: BallInstance
+            The instances to lock.
+
+        Returns
+        -------
+        bool
+            `False` if one of the instances is already locked, and nothing was locked.
+        """
+        pks = [x.pk for x in instances]
+        if not pks:
+            return True
+        async with self._mutex:
+            if self.backend is not None:
+                if not await self.backend.acquire(owner, pks, self.ttl):
+                    return False
+            elif any(x in self.locks for x in pks):
+                return False
+            now = time.time()
+            date = datetime.fromtimestamp(now, timezone.utc)
+            owned = self._owned.setdefault(owner, set())
+            for pk in pks:
+                self.locks[pk] = Lock(owner, now + self.ttl)
+                self._dirty[pk] = date
+            owned.update(pks)
+        return True
+
+    async def release(self, *instances: BallInstance):
+        """
+        Unlock the given instances.
+        """
+        pks = [x.pk for x in instances]
+        if not pks:
+            return
+        async with self._mutex:
+            locks = {pk: lock.owner for pk in pks if (lock := self.locks.pop(pk, None))}
+            if self.backend is not None and locks:
+                await self.backend.release(locks)
+            for pk in pks:
+                self._dirty[pk] = None
+            for pk, owner in locks.items():
+                if owned := self._owned.get(owner):
+                    owned.discard(pk)
+                    if not owned:
+                        del self._owned[owner]
+
+    async def owned(self, owner: int) -> set[int]:
+        """
+        Return the IDs of the instances locked by a player.
+        """
+        if self.backend is not None:
+            return await self.backend.owned(owner)
+        owned = self._owned.get(owner)
+        if not owned:
+            return set()
+        owned.intersection_update(
+            pk for pk in owned if (lock := self.locks.get(pk)) and lock.owner == owner
+        )
+        if not owned:
+            del self._owned[owner]
+        return set(owned)
+
+    async def flush(self):
+        """
+        Write the pending lock changes to the database, with one query for the released
+        instances and one for the locked ones.
+        """
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        locked = {pk: date for pk, date in dirty.items() if date is not None}
+        connection = Tortoise.get_connection("default")
+        try:
+            if len(locked) < len(dirty):
+                await BallInstance.bulk_unlock(x for x, y in dirty.items() if y is None)
+            if locked:
+                await connection.execute_query(
+                    "UPDATE ballinstance SET locked = v.locked "
+                    "FROM unnest($1::int[], $2::timestamptz[]) AS v(id, locked) "
+                    "WHERE ballinstance.id = v.id",
+                    [list(locked.keys()), list(locked.values())],
+                )
+        except Exception:
+            # try again on next flush, without overwriting newer changes
+            self._dirty = dirty | self._dirty
+            raise
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                log.exception("Failed to write the locks to the database")
+
+    @classmethod
+    def from_settings(cls) -> LockManager:
+        """
+        Build the lock manager, using Redis if enabled in the settings.
+        """
+        if not settings.redis_locks:
+            return cls()
+        from redis import asyncio as aioredis
+
+        redis = aioredis.from_url(
+            os.environ["BALLSDEXBOT_REDIS_URL"], decode_responses=True, encoding="utf8"
+        )
+        return cls(backend=RedisLockBackend(redis))
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import defaultdict, deque
+from typing import Protocol
+
+import discord
+from prometheus_client import Counter, Gauge
+
+log = logging.getLogger("ballsdex.core.menu_refresh")
+
+open_menus = Gauge("open_menus", "Number of trade and merge menus open", ["kind"])
+menu_edits = Counter("menu_edits", "Number of edits of trade and merge menus", ["kind"])
+
+
+class RefreshableMenu(Protocol):
+    kind: str
+    channel: discord.abc.GuildChannel
+
+    async def refresh(self) -> None:
+        """
+        Rebuild the embed and edit the message.
+        """
+        ...
+
+    async def timeout(self) -> None:
+        """
+        Called when the menu was open for too long, it must close itself.
+        """
+        ...
+
+
+class MenuRefresher:
+    """
+    Refresh all the open trade and merge menus from a single task.
+
+    Menus are only edited after being marked dirty, and edits are spread to respect a maximum
+    number of edits per channel, matching Discord's rate limits.
+
+    Parameters
+    ----------
+    interval: float
+        Number of seconds between two refresh rounds.
+    timeout: float
+        Number of seconds before a menu times out.
+    channel_rate: tuple[int, float]
+        Maximum number of edits in a channel over a number of seconds.
+    """
+
+    def __init__(
+        self,
+        interval: float = 5,
+        timeout: float = 15 * 60,
+        channel_rate: tuple[int, float] = (4, 5),
+    ):
+        self.interval = interval
+        self.timeout = timeout
+        self.channel_rate = channel_rate
+        self.menus: dict[RefreshableMenu, float] = {}
+        self.dirty: set[RefreshableMenu] = set()
+        self.task: asyncio.Task | None = None
+        # time of the last edits, per channel
+        self._edits: defaultdict[int, deque[float]] = defaultdict(deque)
+
+    def open(self, menu: RefreshableMenu):
+        """
+        Start tracking a menu, until `close` is called or the menu times out.
+        """
+        self.menus[menu] = time.monotonic()
+        open_menus.labels(kind=menu.kind).inc()
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._loop())
+
+    def close(self, menu: RefreshableMenu):
+        if self.menus.pop(menu, None) is not None:
+            open_menus.labels(kind=menu.kind).dec()
+        self.dirty.discard(menu)
+
+    def mark_dirty(self, menu: RefreshableMenu):
+        """
+        Schedule an edit of the menu for the next refresh round.
+        """
+        if menu in self.menus:
+            self.dirty.add(menu)
+
+    def _take_slot(self, channel_id: int, now: float) -> bool:
+        count, period = self.channel_rate
+        edits = self._edits[channel_id]
+        while edits and edits[0] <= now - period:
+            edits.popleft()
+        if len(edits) >= count:
+            return False
+        edits.append(now)
+        return True
+
+    async def _refresh(self, menu: RefreshableMenu):
+        try:
+            await menu.refresh()
+        except Exception:
+            # a menu that cannot be refreshed anymore is closed, like a timed out one
+            log.exception(f"Failed to refresh {menu.kind} menu in channel {menu.channel.id}")
+            self.close(menu)
+            await self._expire(menu)
+        else:
+            menu_edits.labels(kind=menu.kind).inc()
+
+    async def _expire(self, menu: RefreshableMenu):
+        try:
+            await menu.timeout()
+        except Exception:
+            log.exception(f"Failed to time out {menu.kind} menu in channel {menu.channel.id}")
+
+    async def _tick(self):
+        now = time.monotonic()
+        expired = [x for x, opened in self.menus.items() if now - opened > self.timeout]
+        for menu in expired:
+            self.close(menu)
+
+        batch: list[RefreshableMenu] = []
+        for menu in list(self.dirty):
+            # menus without a slot stay dirty for the next round
+            if self._take_slot(menu.channel.id, now):
+                self.dirty.discard(menu)
+                batch.append(menu)
+
+        await asyncio.gather(
+            *(self._expire(menu) for menu in expired), *(self._refresh(menu) for menu in batch)
+        )
+
+        for channel_id in [x for x, y in self._edits.items() if not y or y[-1] < now - 60]:
+            del self._edits[channel_id]
+
+    async def _loop(self):
+        while self.menus:
+            await asyncio.sleep(self.interval)
+            try:
+                await self._tick()
+            except Exception:
+                log.exception("Failed to refresh the menus")
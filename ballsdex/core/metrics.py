@@ -1,9 +1,11 @@
 import asyncio
 import logging
 import math
+import time
 from collections import defaultdict
+from contextlib import contextmanager
 from datetime import datetime
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Iterator
 
 from aiohttp import web
 from prometheus_client import CONTENT_TYPE_LATEST, Gauge, Histogram, generate_latest
@@ -13,6 +15,39 @@ if TYPE_CHECKING:
 
 log = logging.getLogger("ballsdex.core.metrics")
 
+# close enough to the start of the process, this module is imported early
+PROCESS_START = time.perf_counter()
+
+startup_phase_duration = Gauge(
+    "startup_phase_duration", "Time taken by each phase of the startup", ["phase"]
+)
+startup_time_to_ready = Gauge(
+    "startup_time_to_ready", "Time between the start of the process and the bot being ready"
+)
+
+
+@contextmanager
+def startup_phase(name: str) -> Iterator[None]:
+    """
+    Measure a phase of the startup, logging its duration and exporting it to Prometheus.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        startup_phase_duration.labels(phase=name).set(elapsed)
+        log.info(f"Startup phase {name!r} took {elapsed:.2f}s")
+
+
+def mark_ready():
+    """
+    Record the time to ready, since the start of the process.
+    """
+    elapsed = time.perf_counter() - PROCESS_START
+    startup_time_to_ready.set(elapsed)
+    log.info(f"Ready {elapsed:.2f}s after starting")
+
 
 class PrometheusServer:
     """
@@ -1,20 +1,22 @@
 from __future__ import annotations
 
 from concurrent.futures import ThreadPoolExecutor
-from datetime import datetime, timedelta
+from datetime import datetime
 from enum import IntEnum
 from io import BytesIO
-from typing import TYPE_CHECKING, Iterable, Tuple, Type
+from typing import TYPE_CHECKING, Any, Iterable, Tuple, Type
 
 import discord
 from discord.utils import format_dt
 from fastapi_admin.models import AbstractAdmin
-from tortoise import exceptions, fields, models, signals, timezone, validators
+from tortoise import Tortoise, exceptions, fields, models, signals, validators
+from tortoise.functions import Sum
 
 from ballsdex.core.image_generator.image_gen import draw_card
 
 if TYPE_CHECKING:
     from tortoise.backends.base.client import BaseDBAsyncClient
+    from tortoise.queryset import QuerySet
 
 
 balls: dict[int, Ball] = {}
@@ -171,47 +173,23 @@ class Ball(models.Model):
 Ball.register_listener(signals.Signals.pre_save, lower_catch_names)
 
 
-class BallInstance(models.Model):
-    ball_id: int
-    special_id: int
-    trade_player_id: int
+class InstanceDisplayMixin:
+    """
+    Display helpers shared by `BallInstance` and its read model `BallInstanceView`.
 
-    ball: fields.ForeignKeyRelation[Ball] = fields.ForeignKeyField("models.Ball")
-    player: fields.ForeignKeyRelation[Player] = fields.ForeignKeyRelation(
-        "models.Player", related_name="balls"
-    )  # type: ignore
-    catch_date = fields.DatetimeField(auto_now_add=True)
-    server_id = fields.BigIntField(
-        description="Discord server ID where this ball was caught", null=True
-    )
-    shiny = fields.BooleanField(default=False)
-    special: fields.ForeignKeyRelation[Special] | None = fields.ForeignKeyField(
-        "models.Special", null=True, default=None, on_delete=fields.SET_NULL
-    )
-    health_bonus = fields.IntField(default=0)
-    attack_bonus = fields.IntField(default=0)
-    trade_player: fields.ForeignKeyRelation[Player] | None = fields.ForeignKeyField(
-        "models.Player", null=True, default=None, on_delete=fields.SET_NULL
-    )
-    favorite = fields.BooleanField(default=False)
-    tradeable = fields.BooleanField(default=True)
-    locked: fields.Field[datetime] = fields.DatetimeField(
-        description="If the instance was locked for a trade and when",
-        null=True,
-        default=None,
-    )
-    extra_data = fields.JSONField(default={})
+    Subclasses provide the ``countryball`` and ``specialcard`` properties.
+    """
 
-    class Meta:
-        unique_together = ("player", "id")
+    __slots__ = ()
 
-    @property
-    def is_tradeable(self) -> bool:
-        return (
-            self.tradeable
-            and self.countryball.tradeable
-            and getattr(self.specialcard, "tradeable", True)
-        )
+    pk: Any
+    ball_id: int
+    shiny: bool
+    favorite: bool
+    attack_bonus: int
+    health_bonus: int
+    countryball: Ball
+    specialcard: Special | None
 
     @property
     def attack(self) -> int:
@@ -223,25 +201,9 @@ class BallInstance(models.Model):
         bonus = int(self.countryball.health * self.health_bonus * 0.01)
         return self.countryball.health + bonus
 
-    @property
-    def special_card(self) -> str | None:
-        if self.specialcard:
-            return self.specialcard.background or self.countryball.collection_card
-
-    @property
-    def countryball(self) -> Ball:
-        return balls.get(self.ball_id, self.ball)
-
-    @property
-    def specialcard(self) -> Special | None:
-        return specials.get(self.special_id, self.special)
-
-    def __str__(self) -> str:
-        return self.to_string()
-
     def to_string(self, bot: discord.Client | None = None, is_trade: bool = False) -> str:
         emotes = ""
-        if bot and self.pk in bot.locked_balls and not is_trade:  # type: ignore
+        if bot and bot.locks.is_locked(self.pk) and not is_trade:  # type: ignore
             emotes += "🔒"
         if self.favorite:
             emotes += "❤️"
@@ -296,6 +258,65 @@ class BallInstance(models.Model):
                     text = f"{emoji} {text}"
         return text
 
+
+class BallInstance(InstanceDisplayMixin, models.Model):
+    ball_id: int
+    special_id: int
+    trade_player_id: int
+
+    ball: fields.ForeignKeyRelation[Ball] = fields.ForeignKeyField("models.Ball")
+    player: fields.ForeignKeyRelation[Player] = fields.ForeignKeyRelation(
+        "models.Player", related_name="balls"
+    )  # type: ignore
+    catch_date = fields.DatetimeField(auto_now_add=True)
+    server_id = fields.BigIntField(
+        description="Discord server ID where this ball was caught", null=True
+    )
+    shiny = fields.BooleanField(default=False)
+    special: fields.ForeignKeyRelation[Special] | None = fields.ForeignKeyField(
+        "models.Special", null=True, default=None, on_delete=fields.SET_NULL
+    )
+    health_bonus = fields.IntField(default=0)
+    attack_bonus = fields.IntField(default=0)
+    trade_player: fields.ForeignKeyRelation[Player] | None = fields.ForeignKeyField(
+        "models.Player", null=True, default=None, on_delete=fields.SET_NULL
+    )
+    favorite = fields.BooleanField(default=False)
+    tradeable = fields.BooleanField(default=True)
+    locked: fields.Field[datetime] = fields.DatetimeField(
+        description="If the instance was locked for a trade and when",
+        null=True,
+        default=None,
+    )
+    extra_data = fields.JSONField(default={})
+
+    class Meta:
+        unique_together = ("player", "id")
+
+    @property
+    def is_tradeable(self) -> bool:
+        return (
+            self.tradeable
+            and self.countryball.tradeable
+            and getattr(self.specialcard, "tradeable", True)
+        )
+
+    @property
+    def special_card(self) -> str | None:
+        if self.specialcard:
+            return self.specialcard.background or self.countryball.collection_card
+
+    @property
+    def countryball(self) -> Ball:
+        return balls.get(self.ball_id, self.ball)
+
+    @property
+    def specialcard(self) -> Special | None:
+        return specials.get(self.special_id, self.special)
+
+    def __str__(self) -> str:
+        return self.to_string()
+
     def draw_card(self) -> BytesIO:
         image = draw_card(self)
         buffer = BytesIO()
@@ -348,22 +369,136 @@ class BallInstance(models.Model):
 
         return content, discord.File(buffer, "card.png")
 
-    async def lock_for_trade(self):
-        self.locked = timezone.now()
-        await self.save(update_fields=("locked",))
+    @classmethod
+    async def bulk_unlock(cls, ids: Iterable[int], using_db: BaseDBAsyncClient | None = None):
+        """
+        Clear the saved lock of multiple instances in a single query.
+        """
+        connection = using_db or Tortoise.get_connection("default")
+        await connection.execute_query(
+            "UPDATE ballinstance SET locked = NULL WHERE id = ANY($1)", [list(ids)]
+        )
+
 
-    async def unlock(self):
-        self.locked = None  # type: ignore
-        await self.save(update_fields=("locked",))
+class BallInstanceView(InstanceDisplayMixin):
+    """
+    A read-only view of a `BallInstance`, holding only the columns needed to display it.
 
-    async def is_locked(self):
-        await self.refresh_from_db(fields=("locked",))
-        self.locked
-        return self.locked is not None and (self.locked + timedelta(minutes=30)) > timezone.now()
+    Views are built from `values_list` queries, skipping the hydration of full models and the
+    loading of ``extra_data``. The ball and special are read from the cache, the instances of
+    balls missing from it (created since it was loaded) are skipped when listing.
+    """
 
-    async def lock_for_merge(self):
-        self.locked = timezone.now()
-        await self.save(update_fields=("locked",))
+    columns = (
+        "id",
+        "ball_id",
+        "player_id",
+        "shiny",
+        "special_id",
+        "favorite",
+        "attack_bonus",
+        "health_bonus",
+        "catch_date",
+    )
+    __slots__ = columns
+
+    def __init__(
+        self,
+        id: int,
+        ball_id: int,
+        player_id: int,
+        shiny: bool,
+        special_id: int | None,
+        favorite: bool,
+        attack_bonus: int,
+        health_bonus: int,
+        catch_date: datetime,
+    ):
+        self.id = id
+        self.ball_id = ball_id
+        self.player_id = player_id
+        self.shiny = shiny
+        self.special_id = special_id
+        self.favorite = favorite
+        self.attack_bonus = attack_bonus
+        self.health_bonus = health_bonus
+        self.catch_date = catch_date
+
+    @classmethod
+    async def fetch(cls, queryset: "QuerySet[BallInstance]") -> list[BallInstanceView]:
+        """
+        Run a `BallInstance` queryset, returning views instead of models.
+        """
+        return [cls(*x) for x in await queryset.values_list(*cls.columns) if x[1] in balls]
+
+    @property
+    def pk(self) -> int:
+        return self.id
+
+    @property
+    def countryball(self) -> Ball:
+        return balls[self.ball_id]
+
+    @property
+    def specialcard(self) -> Special | None:
+        return specials.get(self.special_id) if self.special_id is not None else None
+
+    def __repr__(self) -> str:
+        return f"<BallInstanceView {self.id}>"
+
+    def __str__(self) -> str:
+        return self.to_string()
+
+
+class PlayerBallStats(models.Model):
+    """
+    Number of instances owned by a player, for each ball, special, shininess and server.
+
+    This table is maintained by database triggers on `ballinstance` and must not be written
+    to by the bot. Use `ballsdex.core.utils.tortoise.check_player_ball_stats` to verify or
+    rebuild it.
+    """
+
+    player_id: int
+    ball_id: int
+    special_id: int | None
+
+    player: fields.ForeignKeyRelation[Player] = fields.ForeignKeyField(
+        "models.Player", related_name="ball_stats"
+    )
+    ball: fields.ForeignKeyRelation[Ball] = fields.ForeignKeyField(
+        "models.Ball", related_name="player_stats", index=True
+    )
+    special: fields.ForeignKeyRelation[Special] | None = fields.ForeignKeyField(
+        "models.Special", null=True, default=None
+    )
+    shiny = fields.BooleanField()
+    server_id = fields.BigIntField(null=True)
+    count = fields.IntField(default=0)
+
+    class Meta:
+        table_description = (
+            "Number of instances per player, ball, special, shininess and server. "
+            "Maintained by triggers on ballinstance"
+        )
+
+    @classmethod
+    async def count_balls(cls, **filters: Any) -> int:
+        """
+        Count the instances matching the given filters, summing the aggregated rows.
+
+        Parameters
+        ----------
+        **filters: Any
+            Tortoise filters on the columns of this table, like for `BallInstance.filter`.
+        """
+        total = (
+            await cls.filter(**filters)
+            .annotate(total=Sum("count"))
+            .first()
+            .values_list("total", flat=True)
+        )
+        return int(total or 0)
 
 
 class DonationPolicy(IntEnum):
@@ -457,6 +592,16 @@ class Merge(models.Model):
     player1: fields.ForeignKeyRelation[Player] = fields.ForeignKeyField(
         "models.Player", related_name="merges"
     )
+    ball: fields.ForeignKeyRelation[Ball] = fields.ForeignKeyField(
+        "models.Ball", description="The ball obtained from this merge"
+    )
+    result: fields.ForeignKeyRelation[BallInstance] | None = fields.ForeignKeyField(
+        "models.BallInstance",
+        null=True,
+        on_delete=fields.SET_NULL,
+        related_name="merge_results",
+        description="The instance created by this merge",
+    )
     date = fields.DatetimeField(auto_now_add=True)
     mergeobjects: fields.ReverseRelation[MergeObject]
 
@@ -468,11 +613,11 @@ class MergeObject(models.Model):
     merge_id: int
 
     merge: fields.ForeignKeyRelation[Merge] = fields.ForeignKeyField(
-        "models.Merge", related_name="mergeobjects"
-    )
-    ballinstance: fields.ForeignKeyRelation[BallInstance] = fields.ForeignKeyField(
-        "models.BallInstance", related_name="mergeobjects"
+        "models.Merge", related_name="mergeobjects", index=True
     )
+    # not a foreign key, the ingredients are deleted by the merge
+    ballinstance_id = fields.IntField(description="ID of the consumed instance")
+    ball: fields.ForeignKeyRelation[Ball] = fields.ForeignKeyField("models.Ball")
     player: fields.ForeignKeyRelation[Player] = fields.ForeignKeyField(
         "models.Player", related_name="mergeobjects"
     )
@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import logging
+from collections import Counter
+from typing import Iterable
+
+from ballsdex.core import repository
+from ballsdex.core.models import Ball, BallInstance, Player
+
+log = logging.getLogger("ballsdex.core.recipes")
+
+
+class RecipeCycleError(Exception):
+    def __init__(self, cycle: list[int]):
+        super().__init__(cycle)
+        self.cycle = cycle
+
+
+class RecipeBook:
+    """
+    The merge recipes, compiled into multisets of ball IDs.
+
+    Recipes may use the result of other recipes as ingredients. Their fully expanded multiset
+    of base ingredients is computed once on load.
+
+    Attributes
+    ----------
+    recipes: dict[int, Counter[int]]
+        The ingredients of each recipe, indexed by the ID of the resulting ball.
+    expanded: dict[int, Counter[int]]
+        The base ingredients of each recipe, with nested recipes replaced by their own
+        ingredients, indexed by the ID of the resulting ball.
+    used_in: dict[int, set[int]]
+        The recipes using each ingredient, indexed by ingredient ball ID.
+    """
+
+    def __init__(self):
+        self.recipes: dict[int, Counter[int]] = {}
+        self.expanded: dict[int, Counter[int]] = {}
+        self.used_in: dict[int, set[int]] = {}
+
+    def __contains__(self, ball_id: int) -> bool:
+        return ball_id in self.recipes
+
+    def load(self, definitions: dict[int, Iterable[int]]):
+        """
+        Replace the recipes with new ones.
+
+        Parameters
+        ----------
+        definitions: dict[int, Iterable[int]]
+            The ball IDs of the ingredients of each recipe, repeated if needed more than once,
+            indexed by resulting ball ID.
+        """
+        self.recipes = {x: Counter(y) for x, y in definitions.items() if y}
+        while True:
+            self.expanded = {}
+            try:
+                for ball_id in self.recipes:
+                    self._expand(ball_id, [])
+            except RecipeCycleError as e:
+                # the balls of the cycle can still be used as ingredients, obtained otherwise
+                log.warning(f"Skipping recipes forming a cycle: {' -> '.join(map(str, e.cycle))}")
+                for ball_id in e.cycle:
+                    self.recipes.pop(ball_id, None)
+            else:
+                break
+
+        self.used_in = {}
+        for result, ingredients in self.recipes.items():
+            for ingredient in ingredients:
+                self.used_in.setdefault(ingredient, set()).add(result)
+
+    def load_balls(self, balls: Iterable[Ball]):
+        """
+        Replace the recipes with the ones defined on the mergeable balls.
+
+        The ``recipe`` field lists the names of the ingredients separated by semicolons, an
+        ingredient needed multiple times is repeated. Recipes referencing an unknown ball are
+        skipped.
+        """
+        balls = list(balls)
+        ids = {x.country: x.pk for x in balls}
+        definitions: dict[int, list[int]] = {}
+        for ball in balls:
+            if not ball.mergeable or not ball.recipe:
+                continue
+            names = [x.strip() for x in ball.recipe.split(";") if x.strip()]
+            if unknown := [x for x in names if x not in ids]:
+                log.warning(
+                    f"Skipping recipe of {ball.country}, unknown balls: {', '.join(unknown)}"
+                )
+                continue
+            definitions[ball.pk] = [ids[x] for x in names]
+        self.load(definitions)
+
+    def _expand(self, ball_id: int, visiting: list[int]) -> Counter[int]:
+        if (expanded := self.expanded.get(ball_id)) is not None:
+            return expanded
+        if ball_id in visiting:
+            raise RecipeCycleError(visiting[visiting.index(ball_id) :] + [ball_id])
+        visiting.append(ball_id)
+        expanded = Counter()
+        for ingredient, amount in self.recipes[ball_id].items():
+            if ingredient in self.recipes:
+                for base, count in self._expand(ingredient, visiting).items():
+                    expanded[base] += count * amount
+            else:
+                expanded[ingredient] += amount
+        visiting.pop()
+        self.expanded[ball_id] = expanded
+        return expanded
+
+    def matches(self, ball_id: int, instances: Iterable[BallInstance]) -> bool:
+        """
+        Check if the given instances are exactly the ingredients of a recipe.
+        """
+        recipe = self.recipes.get(ball_id)
+        return recipe is not None and Counter(x.ball_id for x in instances) == recipe
+
+    def completable(self, counts: dict[int, int]) -> list[int]:
+        """
+        Return the recipes that can be merged with the given inventory.
+
+        Parameters
+        ----------
+        counts: dict[int, int]
+            The number of instances owned, indexed by ball ID.
+
+        Returns
+        -------
+        list[int]
+            The IDs of the balls that can be obtained.
+        """
+        candidates: set[int] = set()
+        for ball_id in counts:
+            candidates.update(self.used_in.get(ball_id, ()))
+        return [
+            x for x in candidates if all(counts.get(y, 0) >= z for y, z in self.recipes[x].items())
+        ]
+
+    def is_nested(self, ball_id: int) -> bool:
+        """
+        Check if a recipe uses the result of other recipes as ingredients.
+        """
+        return any(x in self.recipes for x in self.recipes.get(ball_id, ()))
+
+    def completable_from_base(self, counts: dict[int, int]) -> list[int]:
+        """
+        Return the nested recipes whose base ingredients are all owned, merging the
+        intermediate recipes first.
+
+        Parameters
+        ----------
+        counts: dict[int, int]
+            The number of instances owned, indexed by ball ID.
+
+        Returns
+        -------
+        list[int]
+            The IDs of the balls that can be obtained after one or more intermediate merges.
+        """
+        return [
+            x
+            for x, expanded in self.expanded.items()
+            if self.is_nested(x) and all(counts.get(y, 0) >= z for y, z in expanded.items())
+        ]
+
+    async def inventory(self, player: Player, ball_ids: Iterable[int]) -> dict[int, int]:
+        """
+        Count the instances of the given balls owned by a player, with one query.
+        """
+        ball_ids = list(ball_ids)
+        if not ball_ids:
+            return {}
+        return await repository.inventory_counts(player.pk, ball_ids)
+
+    async def owned_counts(self, player: Player, ball_id: int) -> dict[int, int]:
+        """
+        Count the instances of each ingredient of a recipe owned by a player, including its base
+        ingredients.
+        """
+        return await self.inventory(
+            player, {*self.recipes.get(ball_id, ()), *self.expanded.get(ball_id, ())}
+        )
+
+    async def completable_by(self, player: Player) -> tuple[list[int], list[int]]:
+        """
+        Return the recipes that a player can merge right now, and the nested ones that can be
+        obtained from the base ingredients owned, with a single query.
+        """
+        counts = await self.inventory(player, self.used_in)
+        return self.completable(counts), self.completable_from_base(counts)
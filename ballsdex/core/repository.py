@@ -0,0 +1,382 @@
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Iterable, NamedTuple
+
+from tortoise import Tortoise, timezone
+
+from ballsdex.core.models import (
+    BallInstance,
+    BallInstanceView,
+    DonationPolicy,
+    PrivacyPolicy,
+    balls,
+)
+
+if TYPE_CHECKING:
+    from tortoise.backends.base.client import BaseDBAsyncClient
+
+
+class PlayerRow(NamedTuple):
+    id: int
+    discord_id: int
+    donation_policy: DonationPolicy
+    privacy_policy: PrivacyPolicy
+
+
+# Each query has a fixed text (one per combination of filters), so asyncpg prepares it once per
+# connection and reuses the statement, see the statement-cache-size setting.
+PLAYER_COLUMNS = "id, discord_id, donation_policy, privacy_policy"
+INSTANCE_COLUMNS = ", ".join(f"bi.{x}" for x in BallInstanceView.columns)
+
+GET_PLAYER = f"SELECT {PLAYER_COLUMNS} FROM player WHERE discord_id = $1"
+# the select does not see the row being inserted, and the insert returns nothing on conflict
+GET_OR_CREATE_PLAYER = (
+    "WITH inserted AS ("
+    "INSERT INTO player (discord_id, donation_policy, privacy_policy) VALUES ($1, $2, $3) "
+    f"ON CONFLICT (discord_id) DO NOTHING RETURNING {PLAYER_COLUMNS}) "
+    f"SELECT {PLAYER_COLUMNS}, TRUE AS created FROM inserted UNION ALL "
+    f"SELECT {PLAYER_COLUMNS}, FALSE AS created FROM player WHERE discord_id = $1"
+)
+# columns left to the defaults of the model, see _instance_defaults
+DEFAULT_COLUMNS = ("favorite", "tradeable", "extra_data")
+CREATE_INSTANCE = (
+    "INSERT INTO ballinstance AS bi (ball_id, player_id, shiny, special_id, attack_bonus, "
+    f"health_bonus, server_id, catch_date, {', '.join(DEFAULT_COLUMNS)}) "
+    "VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11) "
+    f"RETURNING {INSTANCE_COLUMNS}"
+)
+RESERVE_INSTANCE_IDS = (
+    "SELECT nextval('ballinstance_id_seq') AS id FROM generate_series(1, $1::int)"
+)
+# written again with the same IDs when retried, the rows already inserted are skipped
+INSERT_INSTANCES = (
+    "INSERT INTO ballinstance (id, ball_id, player_id, shiny, special_id, attack_bonus, "
+    f"health_bonus, server_id, catch_date, {', '.join(DEFAULT_COLUMNS)}) "
+    "SELECT *, $10::bool, $11::bool, $12::jsonb FROM unnest($1::int[], $2::int[], $3::int[], "
+    "$4::bool[], $5::int[], $6::int[], $7::int[], $8::bigint[], $9::timestamptz[]) "
+    "ON CONFLICT (id) DO NOTHING"
+)
+COUNT_FAVORITES = "SELECT COUNT(*) AS count FROM ballinstance WHERE player_id = $1 AND favorite"
+COMPLETION = (
+    "SELECT DISTINCT bi.ball_id, bi.shiny, bi.special_id FROM ballinstance AS bi "
+    "INNER JOIN player AS p ON p.id = bi.player_id WHERE p.discord_id = $1"
+)
+COMPLETION_OF_BALLS = f"{COMPLETION} AND bi.ball_id = ANY($2::int[])"
+INVENTORY = (
+    "SELECT ball_id, COUNT(*) AS count FROM ballinstance "
+    "WHERE player_id = $1 AND ball_id = ANY($2::int[]) GROUP BY ball_id"
+)
+
+
+async def _fetch(query: str, values: list[Any], connection: "BaseDBAsyncClient | None"):
+    connection = connection or Tortoise.get_connection("default")
+    _, rows = await connection.execute_query(query, values)
+    return rows
+
+
+def _instance_defaults() -> list[Any]:
+    """
+    Return the database values of the `BallInstance` defaults, for the columns not set when
+    creating an instance.
+    """
+    values: list[Any] = []
+    for name in DEFAULT_COLUMNS:
+        field = BallInstance._meta.fields_map[name]
+        default = field.default() if callable(field.default) else field.default
+        values.append(field.to_db_value(default, None))
+    return values
+
+
+def _player(row) -> PlayerRow:
+    return PlayerRow(
+        row["id"],
+        row["discord_id"],
+        DonationPolicy(row["donation_policy"]),
+        PrivacyPolicy(row["privacy_policy"]),
+    )
+
+
+async def get_or_create_player(
+    discord_id: int, *, connection: "BaseDBAsyncClient | None" = None
+) -> tuple[PlayerRow, bool]:
+    """
+    Return the player with the given Discord ID, registering it if needed, in one round trip.
+
+    Returns
+    -------
+    tuple[PlayerRow, bool]
+        The player, and whether it was just created.
+    """
+    values = [discord_id, DonationPolicy.ALWAYS_ACCEPT.value, PrivacyPolicy.DENY.value]
+    rows = await _fetch(GET_OR_CREATE_PLAYER, values, connection)
+    if not rows:
+        # registered concurrently, committed after the start of the query
+        rows = await _fetch(GET_PLAYER, [discord_id], connection)
+        return _player(rows[0]), False
+    return _player(rows[0]), rows[0]["created"]
+
+
+async def create_instance(
+    player_id: int,
+    ball_id: int,
+    *,
+    shiny: bool = False,
+    special_id: int | None = None,
+    attack_bonus: int = 0,
+    health_bonus: int = 0,
+    server_id: int | None = None,
+    connection: "BaseDBAsyncClient | None" = None,
+) -> BallInstanceView:
+    """
+    Insert a new countryball instance, like `BallInstance.create` with the default values for
+    the other fields.
+    """
+    values = [ball_id, player_id, shiny, special_id, attack_bonus, health_bonus, server_id]
+    values += [timezone.now(), *_instance_defaults()]
+    rows = await _fetch(CREATE_INSTANCE, values, connection)
+    return BallInstanceView(*rows[0].values())
+
+
+async def reserve_instance_ids(
+    count: int, *, connection: "BaseDBAsyncClient | None" = None
+) -> list[int]:
+    """
+    Reserve a block of instance IDs from the sequence, for inserts made later.
+    """
+    rows = await _fetch(RESERVE_INSTANCE_IDS, [count], connection)
+    return [x["id"] for x in rows]
+
+
+async def insert_instances(
+    rows: list[tuple[Any, ...]], *, connection: "BaseDBAsyncClient | None" = None
+):
+    """
+    Insert many instances with reserved IDs in a single statement.
+
+    Parameters
+    ----------
+    rows: list[tuple[Any, ...]]
+        The ID, ball ID, player ID, shiny, special ID, attack bonus, health bonus, server ID
+        and catch date of each instance. IDs already present are skipped.
+    """
+    values = [list(x) for x in zip(*rows)] + _instance_defaults()
+    await _fetch(INSERT_INSTANCES, values, connection)
+
+
+@lru_cache(maxsize=None)
+def _count_query(ball: bool, shiny: bool, special: bool, server: bool) -> str:
+    filters = ["p.discord_id = $1"]
+    for column, enabled in (
+        ("ball_id", ball),
+        ("shiny", shiny),
+        ("special_id", special),
+        ("server_id", server),
+    ):
+        if enabled:
+            filters.append(f"s.{column} = ${len(filters) + 1}")
+    return (
+        "SELECT COALESCE(SUM(s.count), 0) AS total FROM playerballstats AS s "
+        f"INNER JOIN player AS p ON p.id = s.player_id WHERE {' AND '.join(filters)}"
+    )
+
+
+async def count_instances(
+    discord_id: int,
+    *,
+    ball_id: int | None = None,
+    shiny: bool | None = None,
+    special_id: int | None = None,
+    server_id: int | None = None,
+    connection: "BaseDBAsyncClient | None" = None,
+) -> int:
+    """
+    Count the instances owned by a player from the aggregated statistics, like
+    `PlayerBallStats.count_balls`. Filters left to `None` are not applied.
+    """
+    filters = (ball_id, shiny, special_id, server_id)
+    query = _count_query(*(x is not None for x in filters))
+    rows = await _fetch(query, [discord_id, *(x for x in filters if x is not None)], connection)
+    return int(rows[0]["total"])
+
+
+async def count_favorites(player_id: int, *, connection: "BaseDBAsyncClient | None" = None) -> int:
+    """
+    Count the favorite instances of a player.
+    """
+    rows = await _fetch(COUNT_FAVORITES, [player_id], connection)
+    return rows[0]["count"]
+
+
+async def completion_rows(
+    discord_id: int,
+    ball_ids: Iterable[int] | None = None,
+    *,
+    connection: "BaseDBAsyncClient | None" = None,
+) -> list[tuple[int, bool, int | None]]:
+    """
+    Return the distinct (ball ID, shiny, special ID) combinations owned by a player, optionally
+    restricted to some balls.
+    """
+    if ball_ids is None:
+        rows = await _fetch(COMPLETION, [discord_id], connection)
+    else:
+        rows = await _fetch(COMPLETION_OF_BALLS, [discord_id, list(ball_ids)], connection)
+    return [(x["ball_id"], x["shiny"], x["special_id"]) for x in rows]
+
+
+async def inventory_counts(
+    player_id: int, ball_ids: Iterable[int], *, connection: "BaseDBAsyncClient | None" = None
+) -> dict[int, int]:
+    """
+    Count the instances of the given balls owned by a player, indexed by ball ID. Balls not
+    owned are missing from the result.
+    """
+    rows = await _fetch(INVENTORY, [player_id, list(ball_ids)], connection)
+    return {x["ball_id"]: x["count"] for x in rows}
+
+
+@lru_cache(maxsize=None)
+def _search_query(special: bool, shiny: bool, include: bool, exclude: bool) -> str:
+    filters = [
+        "p.discord_id = $1",
+        # like the ORM search, NULL catch names make the whole text NULL and never match
+        "to_hex(bi.id) || ' ' || b.country || ' ' || b.catch_names ILIKE $2",
+    ]
+    for condition, enabled in (
+        ("bi.special_id = $", special),
+        ("bi.shiny = $", shiny),
+        ("bi.id = ANY($::int[])", include),
+        ("NOT bi.id = ANY($::int[])", exclude),
+    ):
+        if enabled:
+            filters.append(condition.replace("$", f"${len(filters) + 2}", 1))
+    return (
+        f"SELECT {INSTANCE_COLUMNS} FROM ballinstance AS bi "
+        "INNER JOIN ball AS b ON b.id = bi.ball_id INNER JOIN player AS p ON p.id = bi.player_id "
+        f"WHERE {' AND '.join(filters)} ORDER BY bi.id LIMIT $3"
+    )
+
+
+@lru_cache(maxsize=None)
+def _candidates_query(
+    ball: bool, shiny: bool, special: bool, duplicates: bool, tradeable: bool
+) -> str:
+    filters = ["bi.player_id = $1"]
+    for column, enabled in (("ball_id", ball), ("shiny", shiny), ("special_id", special)):
+        if enabled:
+            filters.append(f"bi.{column} = ${len(filters) + 3}")
+    source = f"ballinstance AS bi WHERE {' AND '.join(filters)}"
+    conditions = ["NOT c.favorite", "NOT c.id = ANY($2::int[])"]
+    if duplicates:
+        # the first instance of each ball is kept, favorites first, before excluding anything
+        source = (
+            "SELECT bi.*, row_number() OVER (PARTITION BY bi.ball_id "
+            f"ORDER BY bi.favorite DESC, bi.catch_date, bi.id) AS position FROM {source}"
+        )
+        conditions.append("c.position > 1")
+    else:
+        source = f"SELECT bi.* FROM {source}"
+    joins = ""
+    if tradeable:
+        joins = (
+            "INNER JOIN ball AS b ON b.id = c.ball_id "
+            "LEFT OUTER JOIN special AS s ON s.id = c.special_id "
+        )
+        conditions.append("c.tradeable AND b.tradeable AND COALESCE(s.tradeable, TRUE)")
+    return (
+        f"SELECT c.id FROM ({source}) AS c {joins}WHERE {' AND '.join(conditions)} "
+        "ORDER BY c.catch_date, c.id LIMIT $3"
+    )
+
+
+async def candidate_ids(
+    player_id: int,
+    exclude: Iterable[int],
+    *,
+    ball_id: int | None = None,
+    shiny: bool | None = None,
+    special_id: int | None = None,
+    duplicates: bool = False,
+    tradeable: bool = True,
+    limit: int | None = None,
+    connection: "BaseDBAsyncClient | None" = None,
+) -> list[int]:
+    """
+    Return the IDs of the instances of a player that can be added to a trade or a merge,
+    oldest first. Favorites are never returned.
+
+    Parameters
+    ----------
+    player_id: int
+        The ID of the owner.
+    exclude: Iterable[int]
+        IDs never returned, such as the instances already proposed or locked.
+    ball_id: int | None
+        Only return instances of this ball.
+    shiny: bool | None
+        Only return shiny (or non-shiny) instances.
+    special_id: int | None
+        Only return instances of this special.
+    duplicates: bool
+        Keep the first instance of each ball out of the results, favorites first.
+    tradeable: bool
+        Only return instances that can be traded.
+    limit: int | None
+        The maximum number of results, unlimited if `None`.
+    """
+    filters = (ball_id, shiny, special_id)
+    query = _candidates_query(*(x is not None for x in filters), duplicates, tradeable)
+    values = [player_id, list(exclude), limit, *(x for x in filters if x is not None)]
+    rows = await _fetch(query, values, connection)
+    return [x["id"] for x in rows]
+
+
+async def search_instances(
+    discord_id: int,
+    text: str,
+    *,
+    special_id: int | None = None,
+    shiny: bool | None = None,
+    include: Iterable[int] | None = None,
+    exclude: Iterable[int] | None = None,
+    limit: int = 25,
+    connection: "BaseDBAsyncClient | None" = None,
+) -> list[BallInstanceView]:
+    """
+    Search the instances of a player by hexadecimal ID, country or catch names, as typed in
+    autocompletion.
+
+    Parameters
+    ----------
+    discord_id: int
+        The Discord ID of the owner.
+    text: str
+        Text contained in the searched fields, case insensitive.
+    special_id: int | None
+        Only return instances of this special.
+    shiny: bool | None
+        Only return shiny (or non-shiny) instances.
+    include: Iterable[int] | None
+        Only return instances with these IDs.
+    exclude: Iterable[int] | None
+        Never return instances with these IDs.
+    limit: int
+        The maximum number of results.
+    """
+    pattern = "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    values: list[Any] = [discord_id, pattern, limit]
+    if special_id is not None:
+        values.append(special_id)
+    if shiny is not None:
+        values.append(shiny)
+    if include is not None:
+        values.append(list(include))
+    if exclude is not None:
+        values.append(list(exclude))
+    query = _search_query(
+        special_id is not None, shiny is not None, include is not None, exclude is not None
+    )
+    rows = await _fetch(query, values, connection)
+    # the views of balls missing from the cache could not be displayed
+    return [BallInstanceView(*x.values()) for x in rows if x["ball_id"] in balls]
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Iterable, Protocol, TypeVar
+
+import discord
+from prometheus_client import Gauge
+
+log = logging.getLogger("ballsdex.core.sessions")
+
+active_sessions = Gauge("active_sessions", "Number of ongoing trades and merges", ["kind"])
+
+
+class Session(Protocol):
+    kind: str
+    channel: discord.abc.GuildChannel
+
+    @property
+    def participants(self) -> Iterable[int]:
+        """
+        The Discord IDs of the users taking part in this session.
+        """
+        ...
+
+    def is_finished(self) -> bool:
+        """
+        Whether the session ended and cannot be interacted with anymore.
+        """
+        ...
+
+
+S = TypeVar("S", bound=Session)
+
+
+class SessionRegistry:
+    """
+    Index the ongoing trades and merges by kind, channel and user.
+
+    Sessions are removed as soon as they end with `unregister`. Sessions that ended without
+    being unregistered (like a view timing out) are dropped on lookup, and by a periodic sweep.
+
+    Parameters
+    ----------
+    sweep_interval: float
+        Number of seconds between two sweeps of the finished sessions.
+    """
+
+    def __init__(self, sweep_interval: float = 5 * 60):
+        self.sweep_interval = sweep_interval
+        self.sessions: dict[tuple[str, int, int], Session] = {}
+        self.task: asyncio.Task | None = None
+
+    def register(self, session: Session):
+        """
+        Index a new session under each of its participants.
+        """
+        for user_id in session.participants:
+            key = (session.kind, session.channel.id, user_id)
+            if (previous := self.sessions.get(key)) is not None and previous is not session:
+                self.unregister(previous)
+            self.sessions[key] = session
+        active_sessions.labels(kind=session.kind).inc()
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._sweep_loop())
+
+    def unregister(self, session: Session):
+        """
+        Remove a session from the registry. Does nothing if it was already removed.
+        """
+        removed = False
+        for user_id in session.participants:
+            key = (session.kind, session.channel.id, user_id)
+            if self.sessions.get(key) is session:
+                del self.sessions[key]
+                removed = True
+        if removed:
+            active_sessions.labels(kind=session.kind).dec()
+
+    def get(self, kind: type[S], channel_id: int, user_id: int) -> S | None:
+        """
+        Return the ongoing session of a user in a channel.
+
+        Parameters
+        ----------
+        kind: type[S]
+            The class of the session (`TradeMenu` or `MergeMenu`).
+        channel_id: int
+            The ID of the channel where the session takes place.
+        user_id: int
+            The Discord ID of the participant.
+        """
+        session = self.sessions.get((kind.kind, channel_id, user_id))
+        if session is None:
+            return None
+        if session.is_finished():
+            self.unregister(session)
+            return None
+        return session  # type: ignore
+
+    def sweep(self) -> int:
+        """
+        Remove all the finished sessions, returning how many were found.
+        """
+        finished = {x for x in self.sessions.values() if x.is_finished()}
+        for session in finished:
+            self.unregister(session)
+        return len(finished)
+
+    async def _sweep_loop(self):
+        while self.sessions:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                if count := self.sweep():
+                    log.debug(f"Swept {count} finished sessions")
+            except Exception:
+                log.exception("Failed to sweep the finished sessions")
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+from prometheus_client import Gauge
+
+from ballsdex.core.db import read_router
+from ballsdex.core.models import GuildConfig, Player
+
+if TYPE_CHECKING:
+    from redis.asyncio import Redis
+
+log = logging.getLogger("ballsdex.core.stats")
+
+# hash shared with the admin panel
+REDIS_KEY = "ballsdex:stats"
+
+players_gauge = Gauge("collection_players", "Number of registered players")
+instances_gauge = Gauge("collection_instances", "Number of caught countryballs")
+guilds_gauge = Gauge("collection_guilds", "Number of configured guilds")
+ball_instances_gauge = Gauge(
+    "collection_ball_instances", "Number of caught instances of a countryball", ["ball_id"]
+)
+
+
+@dataclass
+class CollectionStats:
+    """
+    A snapshot of the global counts of the bot.
+    """
+
+    players: int = 0
+    instances: int = 0
+    guilds: int = 0
+    per_ball: dict[int, int] = field(default_factory=dict)
+    refreshed_at: float = 0
+
+
+class StatsService:
+    """
+    Refresh the global collection statistics in the background.
+
+    The latest values are kept in memory for the bot's commands, published to Redis for the
+    admin panel (if ``BALLSDEXBOT_REDIS_URL`` is set), and exported as Prometheus gauges.
+
+    Parameters
+    ----------
+    interval: float
+        Number of seconds between two refreshes.
+    """
+
+    def __init__(self, interval: float = 15 * 60):
+        self.interval = interval
+        self.current: CollectionStats | None = None
+        self.task: asyncio.Task | None = None
+        self.redis: "Redis | None" = None
+        self._lock = asyncio.Lock()
+
+    def start(self):
+        if redis_url := os.environ.get("BALLSDEXBOT_REDIS_URL"):
+            from redis import asyncio as aioredis
+
+            self.redis = aioredis.from_url(redis_url, decode_responses=True, encoding="utf8")
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+        if self.redis:
+            await self.redis.close()
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception:
+                log.exception("Failed to refresh the collection statistics")
+            await asyncio.sleep(self.interval)
+
+    async def get(self) -> CollectionStats:
+        """
+        Return the latest statistics, only querying them if they were never fetched.
+        """
+        if self.current is None:
+            return await self.refresh()
+        return self.current
+
+    async def refresh(self) -> CollectionStats:
+        """
+        Query the statistics now and publish them.
+        """
+        async with self._lock:
+            connection = read_router.connection()
+            # aggregated by the playerballstats triggers, much cheaper than counting instances
+            _, rows = await connection.execute_query(
+                "SELECT ball_id, SUM(count) AS total FROM playerballstats GROUP BY ball_id"
+            )
+            per_ball = {row["ball_id"]: int(row["total"]) for row in rows}
+            stats = CollectionStats(
+                players=await Player.all().using_db(connection).count(),
+                instances=sum(per_ball.values()),
+                guilds=await GuildConfig.all().using_db(connection).count(),
+                per_ball=per_ball,
+                refreshed_at=time.time(),
+            )
+            self.current = stats
+            self._export(stats)
+            if self.redis:
+                try:
+                    await self._publish(stats)
+                except Exception:
+                    log.warning("Failed to publish the statistics to Redis", exc_info=True)
+            return stats
+
+    def _export(self, stats: CollectionStats):
+        players_gauge.set(stats.players)
+        instances_gauge.set(stats.instances)
+        guilds_gauge.set(stats.guilds)
+        ball_instances_gauge.clear()
+        for ball_id, count in stats.per_ball.items():
+            ball_instances_gauge.labels(ball_id=ball_id).set(count)
+
+    async def _publish(self, stats: CollectionStats):
+        assert self.redis
+        mapping = {
+            "players": stats.players,
+            "instances": stats.instances,
+            "guilds": stats.guilds,
+            "refreshed_at": stats.refreshed_at,
+        }
+        mapping.update({f"ball:{x}": y for x, y in stats.per_ball.items()})
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(REDIS_KEY)
+            pipe.hset(REDIS_KEY, mapping=mapping)  # type: ignore
+            await pipe.execute()
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import asyncio
+from typing import TYPE_CHECKING, Iterable
+
+import discord
+from cachetools import TTLCache
+
+if TYPE_CHECKING:
+    from ballsdex.core.bot import BallsDexBot
+
+
+class UserResolver:
+    """
+    Resolve Discord users from their ID while avoiding ``fetch_user``, a heavily rate-limited
+    REST call.
+
+    Users are first looked up in the bot's member cache, then in a TTL cache of the users
+    previously fetched. Concurrent fetches of the same user share a single request.
+
+    Parameters
+    ----------
+    bot: BallsDexBot
+        The bot instance.
+    maxsize: int
+        The maximum number of fetched users kept in cache.
+    ttl: float
+        Number of seconds before a fetched user is fetched again.
+    """
+
+    def __init__(self, bot: "BallsDexBot", maxsize: int = 10000, ttl: float = 60 * 60):
+        self.bot = bot
+        self.cache: TTLCache[int, discord.User] = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._pending: dict[int, asyncio.Task[discord.User]] = {}
+
+    async def _fetch(self, user_id: int) -> discord.User:
+        try:
+            user = await self.bot.fetch_user(user_id)
+            self.cache[user_id] = user
+            return user
+        finally:
+            del self._pending[user_id]
+
+    async def get(self, user_id: int) -> discord.User:
+        """
+        Return the user with the given ID.
+
+        Raises
+        ------
+        discord.NotFound
+            The user does not exist.
+        """
+        if user := self.bot.get_user(user_id):
+            return user
+        if user := self.cache.get(user_id):
+            return user
+        task = self._pending.get(user_id)
+        if task is None:
+            task = self._pending[user_id] = asyncio.create_task(self._fetch(user_id))
+        # a cancelled caller must not cancel the fetch shared with the others
+        return await asyncio.shield(task)
+
+    async def get_many(self, user_ids: Iterable[int]) -> dict[int, discord.User]:
+        """
+        Return multiple users at once, indexed by ID. Missing users are fetched concurrently.
+        """
+        ids = set(user_ids)
+        users = await asyncio.gather(*(self.get(x) for x in ids))
+        return dict(zip(ids, users))
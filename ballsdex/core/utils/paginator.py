@@ -2,8 +2,10 @@
 
 from __future__ import annotations
 
+import asyncio
 import logging
-from typing import TYPE_CHECKING, Any, Dict, Optional
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, Generic, Optional, TypeVar
 
 import discord
 from discord.ext.commands import Paginator as CommandPaginator
@@ -11,9 +13,13 @@ from discord.ext.commands import Paginator as CommandPaginator
 from ballsdex.core.utils import menus
 
 if TYPE_CHECKING:
+    from tortoise.models import Model
+    from tortoise.queryset import QuerySet
+
     from ballsdex.core.bot import BallsDexBot
 
 log = logging.getLogger("ballsdex.core.utils.paginator")
+M = TypeVar("M", bound="Model")
 
 
 class NumberedPageModal(discord.ui.Modal, title="Go to page"):
@@ -296,6 +302,109 @@ class FieldPageSource(menus.ListPageSource):
         return self.embed
 
 
+class QuerySetPageSource(menus.PageSource, Generic[M]):
+    """
+    A page source backed by a Tortoise queryset, fetching pages on demand.
+
+    Only the total number of entries is queried when starting. Each page is fetched when
+    displayed, and the next one is prefetched in the background. A bounded number of pages is
+    kept in memory.
+
+    This page source does not handle any sort of formatting, leaving it up
+    to the user. To do so, implement the :meth:`format_page` method.
+
+    Parameters
+    ----------
+    queryset: QuerySet[M]
+        The queryset to paginate. It must be ordered for the pages to be consistent.
+    per_page: int
+        How many elements are in a page.
+    count: int | None
+        The total number of entries, if already known or estimated. Otherwise, the queryset
+        is counted when the source is prepared.
+    cache_size: int
+        The maximum number of pages kept in memory.
+    """
+
+    def __init__(
+        self,
+        queryset: "QuerySet[M]",
+        *,
+        per_page: int,
+        count: int | None = None,
+        cache_size: int = 5,
+    ):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.count = count or 0
+        self.cache_size = cache_size
+        self._counted = count is not None
+        self._pages: OrderedDict[int, asyncio.Task[list[M]]] = OrderedDict()
+
+    async def prepare(self):
+        if not self._counted:
+            self.count = await self.queryset.count()
+            self._counted = True
+
+    async def get_count(self) -> int:
+        """
+        Return the total number of entries, counting them if not done yet.
+        """
+        await self._prepare_once()
+        return self.count
+
+    def is_paginating(self) -> bool:
+        return self.count > self.per_page
+
+    def get_max_pages(self) -> int:
+        pages, left_over = divmod(self.count, self.per_page)
+        return pages + 1 if left_over else pages
+
+    async def fetch_page(self, page_number: int) -> list[M]:
+        """
+        Query the entries of a page. Override this to customize how pages are fetched.
+        """
+        return await self.queryset.offset(page_number * self.per_page).limit(self.per_page)
+
+    def _discard_failed(self, page_number: int, task: asyncio.Task[list[M]]):
+        # retrieving the exception also silences the warning of prefetches never awaited,
+        # the page will be fetched again if displayed
+        if task.cancelled() or task.exception() is None:
+            return
+        if self._pages.get(page_number) is task:
+            del self._pages[page_number]
+
+    def _schedule(self, page_number: int) -> asyncio.Task[list[M]]:
+        task = self._pages.get(page_number)
+        if task is None:
+            task = asyncio.create_task(self.fetch_page(page_number))
+            task.add_done_callback(lambda t: self._discard_failed(page_number, t))
+            self._pages[page_number] = task
+        self._pages.move_to_end(page_number)
+        while len(self._pages) > self.cache_size:
+            self._pages.popitem(last=False)
+        return task
+
+    async def get_page(self, page_number: int) -> Any:
+        """
+        Returns either a single element or a list of at most :attr:`per_page` elements,
+        depending on :attr:`per_page`.
+        """
+        if page_number < 0:
+            raise IndexError("Negative page number.")
+        entries = await self._schedule(page_number)
+        if not entries and page_number * self.per_page < self.count:
+            # entries were deleted since they were counted, the following pages are gone
+            self.count = page_number * self.per_page
+        if page_number + 1 < self.get_max_pages():
+            self._schedule(page_number + 1)  # prefetch in the background
+        if self.per_page == 1:
+            if not entries:
+                raise IndexError("Page out of range.")
+            return entries[0]
+        return entries
+
+
 class TextPageSource(menus.ListPageSource):
     def __init__(self, text, *, prefix="```", suffix="```", max_size=2000):
         pages = CommandPaginator(prefix=prefix, suffix=suffix, max_size=max_size - 200)
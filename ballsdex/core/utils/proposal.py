@@ -0,0 +1,315 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Protocol
+
+from ballsdex.core import repository
+from ballsdex.core.models import BallInstance
+from ballsdex.settings import settings
+
+if TYPE_CHECKING:
+    import discord
+
+    from ballsdex.core.bot import BallsDexBot
+    from ballsdex.core.models import Ball, Player, Special
+
+# maximum length of a field value built from proposal lines, leaving room for decorations
+PAGE_LENGTH = 950
+
+
+class ProposalHolder(Protocol):
+    """
+    A participant of a trade or a merge (`TradingUser` or `MergingUser`).
+    """
+
+    player: Player
+    proposal: list[BallInstance]
+    locked: bool
+    cancelled: bool
+    # rendered lines, indexed by (instance ID, locked, cancelled, short)
+    lines: dict[tuple[int, bool, bool, bool], str]
+
+
+class ProposalSession(Protocol):
+    """
+    An ongoing trade or merge (`TradeMenu` or `MergeMenu`).
+    """
+
+    def is_finished(self) -> bool:
+        ...
+
+    def mark_dirty(self):
+        ...
+
+
+def proposal_lines(holder: ProposalHolder, bot: "BallsDexBot", short: bool = False) -> list[str]:
+    """
+    Return the rendered line of each proposed countryball, only formatting the new ones.
+    """
+    lines: list[str] = []
+    for countryball in holder.proposal:
+        key = (countryball.pk, holder.locked, holder.cancelled, short)
+        text = holder.lines.get(key)
+        if text is None:
+            cb_text = countryball.description(
+                short=short, include_emoji=True, bot=bot, is_trade=True
+            )
+            text = f"- *{cb_text}*\n" if holder.locked else f"- {cb_text}\n"
+            if holder.cancelled:
+                text = f"~~{text}~~"
+            holder.lines[key] = text
+        lines.append(text)
+    if len(holder.lines) > 4 * max(len(lines), 25):
+        _prune_lines(holder)
+    return lines
+
+
+def paginate_lines(lines: list[str], limit: int = PAGE_LENGTH) -> list[str]:
+    """
+    Join lines into pages of at most `limit` characters, without cutting a line.
+    """
+    pages: list[str] = []
+    start = 0
+    length = 0
+    for i, line in enumerate(lines):
+        if length + len(line) > limit and i > start:
+            pages.append("".join(lines[start:i]))
+            start = i
+            length = 0
+        length += len(line)
+    if start < len(lines):
+        pages.append("".join(lines[start:]))
+    return pages or ["*Empty*"]
+
+
+async def bulk_candidates(
+    holder: ProposalHolder,
+    bot: "BallsDexBot",
+    *,
+    ball: Ball | None = None,
+    shiny: bool | None = None,
+    special: Special | None = None,
+    count: int | None = None,
+    duplicates: bool = False,
+    tradeable: bool = True,
+) -> list[BallInstance]:
+    """
+    Find the countryballs of a player matching the filters that can be added to a proposal.
+
+    The selection is done by the database, favorites, locked countryballs and the ones already
+    proposed are never selected. Only the selected instances are then loaded.
+
+    Parameters
+    ----------
+    holder: ProposalHolder
+        The participant whose countryballs are selected.
+    bot: BallsDexBot
+        The bot, used to list the locked countryballs.
+    ball: Ball | None
+        Only select instances of this countryball.
+    shiny: bool | None
+        Only select shiny (or non-shiny) instances.
+    special: Special | None
+        Only select instances of this special.
+    count: int | None
+        The maximum number of instances to select.
+    duplicates: bool
+        Keep one instance of each countryball out of the selection, favorites first.
+    tradeable: bool
+        Only select instances that can be traded.
+
+    Returns
+    -------
+    list[BallInstance]
+        The selected instances, oldest first.
+    """
+    # a player can only lock their own countryballs
+    exclude = await bot.locks.owned(holder.player.discord_id)
+    exclude.update(x.pk for x in holder.proposal)
+    ids = await repository.candidate_ids(
+        holder.player.pk,
+        exclude,
+        ball_id=ball.pk if ball else None,
+        shiny=shiny,
+        special_id=special.pk if special else None,
+        duplicates=duplicates,
+        tradeable=tradeable,
+        limit=count,
+    )
+    if not ids:
+        return []
+    instances = {x.pk: x for x in await BallInstance.filter(id__in=ids)}
+    candidates: list[BallInstance] = []
+    for pk in ids:
+        # deleted since, by a merge or an admin command
+        if (instance := instances.get(pk)) is not None:
+            instance.player = holder.player
+            candidates.append(instance)
+    return candidates
+
+
+async def run_bulk_add(
+    interaction: discord.Interaction["BallsDexBot"],
+    session: ProposalSession | None,
+    holder: ProposalHolder | None,
+    kind: str,
+    *,
+    ball: Ball | None = None,
+    shiny: bool | None = None,
+    special: Special | None = None,
+    count: int | None = None,
+    duplicates: bool = False,
+    tradeable: bool = True,
+):
+    """
+    Run a bulk add command of a trade or a merge, answering the interaction. The other
+    parameters are the filters of `bulk_candidates`.
+
+    Parameters
+    ----------
+    interaction: discord.Interaction[BallsDexBot]
+        The interaction of the command.
+    session: ProposalSession | None
+        The ongoing trade or merge of the user, if any.
+    holder: ProposalHolder | None
+        The participant running the command, if any.
+    kind: str
+        The kind of session, ``trade`` or ``merge``, used in the messages.
+    """
+    if not ball and not duplicates:
+        await interaction.response.send_message(
+            f"You must choose a {settings.collectible_name} or to add your duplicates.",
+            ephemeral=True,
+        )
+        return
+    if not session or not holder:
+        await interaction.response.send_message(
+            f"You do not have an ongoing {kind}.", ephemeral=True
+        )
+        return
+    if holder.locked:
+        await interaction.response.send_message(
+            "You have locked your proposal, it cannot be edited! "
+            f"You can click the cancel button to stop the {kind} instead.",
+            ephemeral=True,
+        )
+        return
+    await interaction.response.defer(ephemeral=True, thinking=True)
+
+    bot = interaction.client
+    candidates = await bulk_candidates(
+        holder,
+        bot,
+        ball=ball,
+        shiny=shiny,
+        special=special,
+        count=count,
+        duplicates=duplicates,
+        tradeable=tradeable,
+    )
+    if not candidates:
+        await interaction.followup.send(
+            f"No {settings.collectible_name} matching these filters can be added.",
+            ephemeral=True,
+        )
+        return
+    if holder.locked or session.is_finished():
+        # the session changed while the countryballs were being queried
+        await interaction.followup.send(f"The {kind} cannot be edited anymore.", ephemeral=True)
+        return
+    if not await bot.locks.acquire(interaction.user.id, *candidates):
+        await interaction.followup.send(
+            f"Some of these {settings.collectible_name}s are currently in an active trade, "
+            "merge or donation, please try again later.",
+            ephemeral=True,
+        )
+        return
+    if holder.locked or session.is_finished():
+        # ended while acquiring, its proposals were already released without these
+        await bot.locks.release(*candidates)
+        await interaction.followup.send(f"The {kind} cannot be edited anymore.", ephemeral=True)
+        return
+
+    holder.proposal.extend(candidates)
+    session.mark_dirty()
+    await interaction.followup.send(
+        f"{len(candidates)} {settings.collectible_name}s added.", ephemeral=True
+    )
+
+
+async def run_bulk_remove(
+    interaction: discord.Interaction["BallsDexBot"],
+    session: ProposalSession | None,
+    holder: ProposalHolder | None,
+    kind: str,
+    *,
+    ball: Ball | None = None,
+    shiny: bool | None = None,
+    special: Special | None = None,
+    count: int | None = None,
+):
+    """
+    Run a bulk remove command of a trade or a merge, answering the interaction.
+
+    The parameters are the same as `run_bulk_add`, the filters being the ones of
+    `bulk_matches`.
+    """
+    if not session or not holder:
+        await interaction.response.send_message(
+            f"You do not have an ongoing {kind}.", ephemeral=True
+        )
+        return
+    if holder.locked:
+        await interaction.response.send_message(
+            "You have locked your proposal, it cannot be edited! "
+            f"You can click the cancel button to stop the {kind} instead.",
+            ephemeral=True,
+        )
+        return
+    matches = bulk_matches(holder, ball=ball, shiny=shiny, special=special, count=count)
+    if not matches:
+        await interaction.response.send_message(
+            f"No {settings.collectible_name} in your proposal matches these filters.",
+            ephemeral=True,
+        )
+        return
+    removed = {x.pk for x in matches}
+    holder.proposal[:] = [x for x in holder.proposal if x.pk not in removed]
+    session.mark_dirty()
+    await interaction.response.send_message(
+        f"{len(matches)} {settings.collectible_name}s removed.", ephemeral=True
+    )
+    await interaction.client.locks.release(*matches)
+
+
+def bulk_matches(
+    holder: ProposalHolder,
+    *,
+    ball: Ball | None = None,
+    shiny: bool | None = None,
+    special: Special | None = None,
+    count: int | None = None,
+) -> list[BallInstance]:
+    """
+    Find the countryballs of a proposal matching the filters, most recently added first.
+    """
+    matches: list[BallInstance] = []
+    for instance in reversed(holder.proposal):
+        if ball and instance.ball_id != ball.pk:
+            continue
+        if shiny is not None and instance.shiny != shiny:
+            continue
+        if special and instance.special_id != special.pk:
+            continue
+        matches.append(instance)
+        if count and len(matches) >= count:
+            break
+    return matches
+
+
+def _prune_lines(holder: ProposalHolder):
+    """
+    Drop the cached lines of the countryballs that left the proposal.
+    """
+    pks = {x.pk for x in holder.proposal}
+    for key in [x for x in holder.lines if x[0] not in pks]:
+        del holder.lines[key]
@@ -1,4 +1,5 @@
 from tortoise import Tortoise
+from tortoise.transactions import in_transaction
 
 
 async def row_count_estimate(table_name: str, *, analyze: bool = True) -> int:
@@ -37,3 +38,44 @@ async def row_count_estimate(table_name: str, *, analyze: bool = True) -> int:
         return await row_count_estimate(table_name, analyze=False)  # prevent recursion error
 
     return result
+
+
+STATS_COLUMNS = '"player_id", "ball_id", "special_id", "shiny", "server_id"'
+
+
+async def check_player_ball_stats(*, rebuild: bool = False) -> int:
+    """
+    Compare the `playerballstats` aggregate table with the actual content of `ballinstance`.
+
+    Parameters
+    ----------
+    rebuild: bool = False
+        If inconsistencies are found, rebuild the whole table from scratch. Writes to
+        `ballinstance` are blocked during the rebuild.
+
+    Returns
+    -------
+    int
+        Number of aggregated rows that were missing or had a wrong count.
+    """
+    connection = Tortoise.get_connection("default")
+
+    _, rows = await connection.execute_query(
+        "SELECT COUNT(*) AS mismatches FROM ("
+        f"SELECT {STATS_COLUMNS}, COUNT(*) AS count FROM ballinstance GROUP BY {STATS_COLUMNS}"
+        ") AS expected FULL OUTER JOIN (SELECT * FROM playerballstats WHERE count > 0) AS s "
+        "ON s.player_id = expected.player_id AND s.ball_id = expected.ball_id "
+        "AND s.special_id IS NOT DISTINCT FROM expected.special_id "
+        "AND s.shiny = expected.shiny AND s.server_id IS NOT DISTINCT FROM expected.server_id "
+        "WHERE s.count IS DISTINCT FROM expected.count"
+    )
+    mismatches = int(rows[0]["mismatches"])
+    if mismatches and rebuild:
+        async with in_transaction() as connection:
+            await connection.execute_query("LOCK TABLE ballinstance IN SHARE ROW EXCLUSIVE MODE")
+            await connection.execute_query("TRUNCATE playerballstats")
+            await connection.execute_query(
+                f"INSERT INTO playerballstats ({STATS_COLUMNS}, count) "
+                f"SELECT {STATS_COLUMNS}, COUNT(*) FROM ballinstance GROUP BY {STATS_COLUMNS}"
+            )
+    return mismatches
@@ -1,20 +1,22 @@
+import asyncio
 import logging
 import time
-from datetime import timedelta
 from enum import Enum
-from typing import TYPE_CHECKING, Generic, Iterable, TypeVar
+from typing import TYPE_CHECKING, Any, Generic, Iterable, NamedTuple, TypeVar
 
 import discord
+from cachetools import TTLCache
 from discord import app_commands
 from discord.interactions import Interaction
 from tortoise.exceptions import DoesNotExist
-from tortoise.expressions import Q, RawSQL
 from tortoise.models import Model
-from tortoise.timezone import now as tortoise_now
 
+from ballsdex.core import repository
+from ballsdex.core.db import read_router
 from ballsdex.core.models import (
     Ball,
     BallInstance,
+    BallInstanceView,
     Economy,
     Regime,
     Special,
@@ -156,13 +158,45 @@ class ModelTransformer(app_commands.Transformer, Generic[T]):
             return instance
 
 
+class _CachedOptions(NamedTuple):
+    filters: tuple[Any, ...]
+    value: str
+    instances: list[BallInstanceView]
+
+
 class BallInstanceTransformer(ModelTransformer[BallInstance]):
+    """
+    Autocompletion of the player's countryballs.
+
+    Discord sends an autocomplete interaction for almost every keystroke, so requests are
+    coalesced per (user, command, option): a new keystroke cancels the pending query, and
+    when the results of a prefix were exhaustive, longer inputs are filtered locally.
+
+    Attributes
+    ----------
+    debounce: float
+        Delay in seconds to wait for another keystroke before querying the database
+    """
+
     name = settings.collectible_name
     model = BallInstance  # type: ignore
+    debounce: float = 0.2
+
+    # shared by all instances, one transformer is created per command parameter
+    _pending: dict[tuple[int, str, str], asyncio.Task[list[BallInstanceView]]] = {}
+    _results: TTLCache[tuple[int, str, str], _CachedOptions] = TTLCache(maxsize=10000, ttl=5)
 
     async def get_from_pk(self, value: int) -> BallInstance:
         return await self.model.get(pk=value).prefetch_related("player")
 
+    async def transform(
+        self, interaction: Interaction["BallsDexBot"], value: str
+    ) -> BallInstance | None:
+        if value.isdigit():
+            # the ID of a catch that was just announced may still be queued
+            await interaction.client.catches.ensure_written(instance_id=int(value))
+        return await super().transform(interaction, value)
+
     async def validate(self, interaction: discord.Interaction["BallsDexBot"], item: BallInstance):
         # checking if the ball does belong to user, and a custom ID wasn't forced
         if item.player.discord_id != interaction.user.id:
@@ -171,55 +205,99 @@ class BallInstanceTransformer(ModelTransformer[BallInstance]):
     async def get_options(
         self, interaction: Interaction["BallsDexBot"], value: str
     ) -> list[app_commands.Choice[int]]:
-        balls_queryset = BallInstance.filter(player__discord_id=interaction.user.id)
-
-        if (special := getattr(interaction.namespace, "special", None)) and special.isdigit():
-            balls_queryset = balls_queryset.filter(special_id=int(special))
-        if (shiny := getattr(interaction.namespace, "shiny", None)) and shiny is not None:
-            balls_queryset = balls_queryset.filter(shiny=shiny)
-
-        if interaction.command and (trade_type := interaction.command.extras.get("trade", None)):
-            if trade_type == TradeCommandType.PICK:
-                balls_queryset = balls_queryset.filter(
-                    Q(
-                        Q(locked__isnull=True)
-                        | Q(locked__lt=tortoise_now() + timedelta(minutes=30))
-                    )
-                )
-            else:
-                balls_queryset = balls_queryset.filter(
-                    locked__isnull=False, locked__gt=tortoise_now() - timedelta(minutes=30)
-                )
-        if interaction.command and (merge_type := interaction.command.extras.get("merge", None)):
-            if merge_type == MergeCommandType.PICK:
-                balls_queryset = balls_queryset.filter(
-                    Q(
-                        Q(locked__isnull=True)
-                        | Q(locked__lt=tortoise_now() + timedelta(minutes=30))
-                    )
-                )
-            else:
-                balls_queryset = balls_queryset.filter(
-                    locked__isnull=False, locked__gt=tortoise_now() - timedelta(minutes=30)
-                )
-        balls_queryset = (
-            balls_queryset.select_related("ball")
-            .annotate(
-                searchable=RawSQL(
-                    "to_hex(ballinstance.id) || ' ' || ballinstance__ball.country || "
-                    "' ' || ballinstance__ball.catch_names"
-                )
-            )
-            .filter(searchable__icontains=value)
-            .limit(25)
+        key = _coalescing_key(interaction)
+        filters = (
+            getattr(interaction.namespace, "special", None),
+            getattr(interaction.namespace, "shiny", None),
         )
 
+        cached = self._results.get(key)
+        if (
+            cached is not None
+            and cached.filters == filters
+            and value.lower().startswith(cached.value)
+            and len(cached.instances) < 25
+        ):
+            # the results for a prefix of this input were exhaustive, no need to query again
+            instances = [x for x in cached.instances if value.lower() in _searchable(x)]
+        else:
+            if pending := self._pending.get(key):
+                pending.cancel()
+            task = asyncio.create_task(self._debounced_query(interaction, value))
+            self._pending[key] = task
+            try:
+                instances = await task
+            except asyncio.CancelledError:
+                if self._pending.get(key) is task:
+                    raise  # we are being cancelled ourselves
+                return []  # superseded by a newer keystroke
+            finally:
+                if self._pending.get(key) is task:
+                    del self._pending[key]
+            self._results[key] = _CachedOptions(filters, value.lower(), instances)
+
         choices: list[app_commands.Choice] = [
             app_commands.Choice(name=x.description(bot=interaction.client), value=str(x.pk))
-            for x in await balls_queryset
+            for x in instances
         ]
         return choices
 
+    async def _debounced_query(
+        self, interaction: Interaction["BallsDexBot"], value: str
+    ) -> list[BallInstanceView]:
+        # give some time to the next keystroke to cancel this task before hitting the database
+        await asyncio.sleep(self.debounce)
+
+        special_id: int | None = None
+        if (special := getattr(interaction.namespace, "special", None)) and special.isdigit():
+            special_id = int(special)
+        shiny = getattr(interaction.namespace, "shiny", None) or None
+
+        include: list[int] | None = None
+        exclude: list[int] | None = None
+        extras = interaction.command.extras if interaction.command else {}
+        if lock_type := extras.get("trade", None) or extras.get("merge", None):
+            # a player can only lock their own countryballs
+            locked = await interaction.client.locks.owned(interaction.user.id)
+            if lock_type in (TradeCommandType.PICK, MergeCommandType.PICK):
+                if locked:
+                    exclude = list(locked)
+            elif locked:
+                include = list(locked)
+            else:
+                return []
+        await interaction.client.catches.ensure_written(discord_id=interaction.user.id)
+        return await repository.search_instances(
+            interaction.user.id,
+            value,
+            special_id=special_id,
+            shiny=shiny,
+            include=include,
+            exclude=exclude,
+            connection=read_router.connection(interaction.user.id),
+        )
+
+
+def _focused_option_name(options: list[dict[str, Any]]) -> str:
+    for option in options:
+        if option.get("focused"):
+            return option["name"]
+        if name := _focused_option_name(option.get("options", [])):
+            return name
+    return ""
+
+
+def _coalescing_key(interaction: Interaction["BallsDexBot"]) -> tuple[int, str, str]:
+    command = interaction.command.qualified_name if interaction.command else ""
+    option = _focused_option_name(interaction.data.get("options", []))  # type: ignore
+    return (interaction.user.id, command, option)
+
+
+def _searchable(instance: BallInstanceView) -> str:
+    # local equivalent of the "searchable" annotation used in the autocompletion query
+    ball = instance.countryball
+    return f"{instance.pk:x} {ball.country} {ball.catch_names or ''}".lower()
+
 
 class TTLModelTransformer(ModelTransformer[T]):
     """
@@ -20,6 +20,7 @@ from ballsdex.core.models import (
     BlacklistedID,
     GuildConfig,
     Player,
+    PlayerBallStats,
     Trade,
     TradeObject,
     balls,
@@ -477,6 +478,7 @@ class Admin(commands.GroupCog):
             health_bonus=(health_bonus if health_bonus is not None else random.randint(-20, 20)),
             special=special,
         )
+        self.bot.completions.add(user.id, instance)
         await interaction.followup.send(
             f"`{ball.country}` {settings.collectible_name} was successfully given to `{user}`.\n"
             f"Special: `{special.name if special else None}` • ATK:`{instance.attack_bonus:+d}` • "
@@ -861,13 +863,14 @@ class Admin(commands.GroupCog):
             )
             return
         try:
-            ball = await BallInstance.get(id=ballIdConverted)
+            ball = await BallInstance.get(id=ballIdConverted).prefetch_related("player")
         except DoesNotExist:
             await interaction.response.send_message(
                 f"The {settings.collectible_name} ID you gave does not exist.", ephemeral=True
             )
             return
         await ball.delete()
+        await self.bot.completions.remove(ball.player.discord_id, ball)
         await interaction.response.send_message(
             f"{settings.collectible_name.title()} {ball_id} deleted.", ephemeral=True
         )
@@ -906,6 +909,8 @@ class Admin(commands.GroupCog):
         player, _ = await Player.get_or_create(discord_id=user.id)
         ball.player = player
         await ball.save()
+        self.bot.completions.add(player.discord_id, ball)
+        await self.bot.completions.remove(original_player.discord_id, ball)
 
         trade = await Trade.create(player1=original_player, player2=player)
         await TradeObject.create(trade=trade, ballinstance=ball, player=original_player)
@@ -970,6 +975,7 @@ class Admin(commands.GroupCog):
             count = len(to_delete)
         else:
             count = await BallInstance.filter(player=player).delete()
+        self.bot.completions.invalidate(player.discord_id)
         await interaction.followup.send(
             f"{count} {settings.collectible_name}s from {user} have been reset.", ephemeral=True
         )
@@ -1010,7 +1016,7 @@ class Admin(commands.GroupCog):
         if user:
             filters["player__discord_id"] = user.id
         await interaction.response.defer(ephemeral=True, thinking=True)
-        balls = await BallInstance.filter(**filters).count()
+        balls = await PlayerBallStats.count_balls(**filters)
         country = f"{ball.country} " if ball else ""
         plural = "s" if balls > 1 or balls == 0 else ""
         special_str = f"{special.name} " if special else ""
@@ -1238,35 +1244,23 @@ class Admin(commands.GroupCog):
         await interaction.response.defer(ephemeral=True, thinking=True)
 
         if user2:
-            history = (
-                await Trade.filter(
-                    (Q(player1__discord_id=user.id) & Q(player2__discord_id=user2.id))
-                    | (Q(player1__discord_id=user2.id) & Q(player2__discord_id=user.id))
-                )
-                .order_by(sorting.value)
-                .prefetch_related("player1", "player2")
-            )
-
-            if not history:
-                await interaction.followup.send("No history found.", ephemeral=True)
-                return
-
+            history = Trade.filter(
+                (Q(player1__discord_id=user.id) & Q(player2__discord_id=user2.id))
+                | (Q(player1__discord_id=user2.id) & Q(player2__discord_id=user.id))
+            ).order_by(sorting.value)
             source = TradeViewFormat(
                 history, f"{user.display_name} and {user2.display_name}", self.bot
             )
         else:
-            history = (
-                await Trade.filter(Q(player1__discord_id=user.id) | Q(player2__discord_id=user.id))
-                .order_by(sorting.value)
-                .prefetch_related("player1", "player2")
-            )
-
-            if not history:
-                await interaction.followup.send("No history found.", ephemeral=True)
-                return
-
+            history = Trade.filter(
+                Q(player1__discord_id=user.id) | Q(player2__discord_id=user.id)
+            ).order_by(sorting.value)
             source = TradeViewFormat(history, user.display_name, self.bot)
 
+        if not await source.get_count():
+            await interaction.followup.send("No history found.", ephemeral=True)
+            return
+
         pages = Pages(source=source, interaction=interaction)
         await pages.start(ephemeral=True)
 
@@ -1311,18 +1305,11 @@ class Admin(commands.GroupCog):
             return
 
         await interaction.response.defer(ephemeral=True, thinking=True)
-        history = await TradeObject.filter(ballinstance__id=pk).prefetch_related(
-            "trade", "ballinstance__player"
-        )
-        if not history:
+        trades = Trade.filter(tradeobjects__ballinstance__id=pk).order_by(sorting.value)
+        source = TradeViewFormat(trades, f"{settings.collectible_name} {ball}", self.bot)
+        if not await source.get_count():
             await interaction.followup.send("No history found.", ephemeral=True)
             return
-        trades = (
-            await Trade.filter(id__in=[x.trade_id for x in history])
-            .order_by(sorting.value)
-            .prefetch_related("player1", "player2")
-        )
-        source = TradeViewFormat(trades, f"{settings.collectible_name} {ball}", self.bot)
         pages = Pages(source=source, interaction=interaction)
         await pages.start(ephemeral=True)
 
@@ -1360,10 +1347,6 @@ class Admin(commands.GroupCog):
             timestamp=trade.date,
         )
         embed.set_footer(text="Trade date: ")
-        fill_trade_embed_fields(
-            embed,
-            self.bot,
-            await TradingUser.from_trade_model(trade, trade.player1, self.bot),
-            await TradingUser.from_trade_model(trade, trade.player2, self.bot),
-        )
+        traders = await TradingUser.from_trade_models([trade], self.bot)
+        fill_trade_embed_fields(embed, self.bot, *traders[trade.pk])
         await interaction.response.send_message(embed=embed, ephemeral=True)
@@ -1,6 +1,5 @@
 import enum
 import logging
-from collections import defaultdict
 from typing import TYPE_CHECKING, Union
 
 import discord
@@ -9,6 +8,9 @@ from discord.ext import commands
 from discord.ui import Button, View, button
 from tortoise.exceptions import DoesNotExist
 
+from ballsdex.core import repository
+from ballsdex.core.completion import completion_fields, iter_bits
+from ballsdex.core.db import read_router
 from ballsdex.core.models import (
     BallInstance,
     DonationPolicy,
@@ -25,7 +27,7 @@ from ballsdex.core.utils.transformers import (
     SpecialEnabledTransform,
     TradeCommandType,
 )
-from ballsdex.packages.balls.countryballs_paginator import CountryballsViewer
+from ballsdex.packages.balls.countryballs_paginator import CountryballsSource, CountryballsViewer
 from ballsdex.settings import settings
 
 if TYPE_CHECKING:
@@ -65,7 +67,7 @@ class DonationRequest(View):
             )
         except discord.NotFound:
             pass
-        await self.countryball.unlock()
+        await self.bot.locks.release(self.countryball)
 
     @button(
         style=discord.ButtonStyle.success, emoji="\N{HEAVY CHECK MARK}\N{VARIATION SELECTOR-16}"
@@ -77,6 +79,10 @@ class DonationRequest(View):
         self.countryball.trade_player = self.countryball.player
         self.countryball.player = self.new_player
         await self.countryball.save()
+        self.bot.completions.add(self.new_player.discord_id, self.countryball)
+        await self.bot.completions.remove(
+            self.countryball.trade_player.discord_id, self.countryball
+        )
         trade = await Trade.create(player1=self.countryball.trade_player, player2=self.new_player)
         await TradeObject.create(
             trade=trade, ballinstance=self.countryball, player=self.countryball.trade_player
@@ -86,7 +92,7 @@ class DonationRequest(View):
             + "\n\N{WHITE HEAVY CHECK MARK} The donation was accepted!",
             view=self,
         )
-        await self.countryball.unlock()
+        await self.bot.locks.release(self.countryball)
 
     @button(
         style=discord.ButtonStyle.danger,
@@ -101,24 +107,22 @@ class DonationRequest(View):
             + "\n\N{CROSS MARK} The donation was denied.",
             view=self,
         )
-        await self.countryball.unlock()
+        await self.bot.locks.release(self.countryball)
 
 
 class SortingChoices(enum.Enum):
-    alphabetic = "ball__country"
-    catch_date = "-catch_date"
-    rarity = "ball__rarity"
-    special = "special__id"
+    # values are keys of countryballs_paginator.SORT_KEYS, all sorts are done by SQL
+    alphabetic = "alphabetic"
+    catch_date = "catch_date"
+    rarity = "rarity"
+    special = "special"
     health = "health"
     attack = "attack"
-    health_bonus = "-health_bonus"
-    attack_bonus = "-attack_bonus"
-    stats_bonus = "stats"
+    health_bonus = "health_bonus"
+    attack_bonus = "attack_bonus"
+    stats_bonus = "stats_bonus"
     total_stats = "total_stats"
-
-    # manual sorts are not sorted by SQL queries but by our code
-    # this may be do-able with SQL still, but I don't have much experience ngl
-    duplicates = "manualsort-duplicates"
+    duplicates = "duplicates"
 
 
 class Balls(commands.GroupCog, group_name=settings.players_group_cog_name):
@@ -155,6 +159,7 @@ class Balls(commands.GroupCog, group_name=settings.players_group_cog_name):
         """
         user_obj = user or interaction.user
         await interaction.response.defer(thinking=True)
+        await self.bot.catches.ensure_written(discord_id=user_obj.id)
 
         try:
             player = await Player.get(discord_id=user_obj.id)
@@ -172,30 +177,14 @@ class Balls(commands.GroupCog, group_name=settings.players_group_cog_name):
             if await inventory_privacy(self.bot, interaction, player, user_obj) is False:
                 return
 
-        await player.fetch_related("balls")
-        filters = {"ball__id": countryball.pk} if countryball else {}
-        if sort:
-            if sort == SortingChoices.duplicates:
-                countryballs = await player.balls.filter(**filters)
-                count = defaultdict(int)
-                for ball in countryballs:
-                    count[ball.countryball.pk] += 1
-                countryballs.sort(key=lambda m: (-count[m.countryball.pk], m.countryball.pk))
-            elif sort == SortingChoices.stats_bonus:
-                countryballs = await player.balls.filter(**filters)
-                countryballs.sort(key=lambda x: x.health_bonus + x.attack_bonus, reverse=True)
-            elif sort == SortingChoices.health or sort == SortingChoices.attack:
-                countryballs = await player.balls.filter(**filters)
-                countryballs.sort(key=lambda x: getattr(x, sort.value), reverse=True)
-            elif sort == SortingChoices.total_stats:
-                countryballs = await player.balls.filter(**filters)
-                countryballs.sort(key=lambda x: x.health + x.attack, reverse=True)
-            else:
-                countryballs = await player.balls.filter(**filters).order_by(sort.value)
-        else:
-            countryballs = await player.balls.filter(**filters).order_by("-favorite", "-shiny")
-
-        if len(countryballs) < 1:
+        source = CountryballsSource(
+            player.pk,
+            sort.value if sort else "default",
+            reverse=reverse,
+            ball_id=countryball.pk if countryball else None,
+            discord_id=user_obj.id,
+        )
+        if await source.get_count() < 1:
             ball_txt = countryball.country if countryball else ""
             if user_obj == interaction.user:
                 await interaction.followup.send(
@@ -206,10 +195,8 @@ class Balls(commands.GroupCog, group_name=settings.players_group_cog_name):
                     f"{user_obj.name} doesn't have any {ball_txt} {settings.collectible_name} yet."
                 )
             return
-        if reverse:
-            countryballs.reverse()
 
-        paginator = CountryballsViewer(interaction, countryballs)
+        paginator = CountryballsViewer(interaction, source)
         if user_obj == interaction.user:
             await paginator.start()
         else:
@@ -250,18 +237,12 @@ class Balls(commands.GroupCog, group_name=settings.players_group_cog_name):
             if await inventory_privacy(self.bot, interaction, player, user_obj) is False:
                 return
         # Filter disabled balls, they do not count towards progression
-        # Only ID and emoji is interesting for us
-        bot_countryballs = {x: y.emoji_id for x, y in balls.items() if y.enabled}
+        bot_countryballs = [x for x, y in balls.items() if y.enabled]
 
-        # Set of ball IDs owned by the player
-        filters = {"player__discord_id": user_obj.id, "ball__enabled": True}
         if special:
-            filters["special"] = special
-            bot_countryballs = {
-                x: y.emoji_id
-                for x, y in balls.items()
-                if y.enabled and y.created_at < special.end_date
-            }
+            bot_countryballs = [
+                x for x, y in balls.items() if y.enabled and y.created_at < special.end_date
+            ]
         if not bot_countryballs:
             await interaction.response.send_message(
                 f"There are no {settings.collectible_name}s registered on this bot yet.",
@@ -270,55 +251,32 @@ class Balls(commands.GroupCog, group_name=settings.players_group_cog_name):
             return
         await interaction.response.defer(thinking=True)
 
-        if shiny is not None:
-            filters["shiny"] = shiny
-        owned_countryballs = set(
-            x[0]
-            for x in await BallInstance.filter(**filters)
-            .distinct()  # Do not query everything
-            .values_list("ball_id")
-        )
+        # Bitsets of ball IDs, read from the cached completion of the player
+        catalog = sum(1 << x for x in bot_countryballs)
+        completion = await self.bot.completions.get(user_obj.id)
+        owned = catalog & completion.owned(shiny=shiny, special_id=special.pk if special else None)
+        missing = catalog & ~owned
 
         entries: list[tuple[str, str]] = []
+        emojis = self.bot.ball_emojis
 
-        def fill_fields(title: str, emoji_ids: set[int]):
-            # check if we need to add "(continued)" to the field name
-            first_field_added = False
-            buffer = ""
-
-            for emoji_id in emoji_ids:
-                emoji = self.bot.get_emoji(emoji_id)
-                if not emoji:
-                    continue
-
-                text = f"{emoji} "
-                if len(buffer) + len(text) > 1024:
-                    # hitting embed limits, adding an intermediate field
-                    if first_field_added:
-                        entries.append(("\u200B", buffer))
-                    else:
-                        entries.append((f"__**{title}**__", buffer))
-                        first_field_added = True
-                    buffer = ""
-                buffer += text
-
-            if buffer:  # add what's remaining
-                if first_field_added:
-                    entries.append(("\u200B", buffer))
-                else:
-                    entries.append((f"__**{title}**__", buffer))
-
-        if owned_countryballs:
-            # Getting the list of emoji IDs from the IDs of the owned countryballs
-            fill_fields(
-                f"Owned {settings.collectible_name}s",
-                set(bot_countryballs[x] for x in owned_countryballs),
+        if owned:
+            entries.extend(
+                completion_fields(
+                    f"Owned {settings.collectible_name}s",
+                    [emojis[x] for x in iter_bits(owned) if x in emojis],
+                )
             )
         else:
             entries.append((f"__**Owned {settings.collectible_name}s**__", "Nothing yet."))
 
-        if missing := set(y for x, y in bot_countryballs.items() if x not in owned_countryballs):
-            fill_fields(f"Missing {settings.collectible_name}s", missing)
+        if missing:
+            entries.extend(
+                completion_fields(
+                    f"Missing {settings.collectible_name}s",
+                    [emojis[x] for x in iter_bits(missing) if x in emojis],
+                )
+            )
         else:
             entries.append(
                 (
@@ -333,7 +291,7 @@ class Balls(commands.GroupCog, group_name=settings.players_group_cog_name):
         shiny_str = " shiny" if shiny else ""
         source.embed.description = (
             f"{settings.bot_name}{special_str}{shiny_str} progression: "
-            f"**{round(len(owned_countryballs)/len(bot_countryballs)*100, 1)}%**"
+            f"**{round(owned.bit_count()/len(bot_countryballs)*100, 1)}%**"
         )
         source.embed.colour = discord.Colour.blurple()
         source.embed.set_author(name=user_obj.display_name, icon_url=user_obj.display_avatar.url)
@@ -382,6 +340,7 @@ class Balls(commands.GroupCog, group_name=settings.players_group_cog_name):
         """
         user_obj = user if user else interaction.user
         await interaction.response.defer(thinking=True)
+        await self.bot.catches.ensure_written(discord_id=user_obj.id)
         try:
             player = await Player.get(discord_id=user_obj.id)
         except DoesNotExist:
@@ -424,7 +383,7 @@ class Balls(commands.GroupCog, group_name=settings.players_group_cog_name):
 
         if not countryball.favorite:
             player = await Player.get(discord_id=interaction.user.id).prefetch_related("balls")
-            if await player.balls.filter(favorite=True).count() >= settings.max_favorites:
+            if await repository.count_favorites(player.pk) >= settings.max_favorites:
                 await interaction.response.send_message(
                     f"You cannot set more than {settings.max_favorites} "
                     f"favorite {settings.collectible_name}s.",
@@ -478,12 +437,11 @@ class Balls(commands.GroupCog, group_name=settings.players_group_cog_name):
         if user.bot:
             await interaction.response.send_message("You cannot donate to bots.")
             return
-        if await countryball.is_locked():
+        if not await self.bot.locks.acquire(interaction.user.id, countryball):
             await interaction.response.send_message(
                 "This countryball is currently locked for a trade. Please try again later."
             )
             return
-        await countryball.lock_for_trade()
         new_player, _ = await Player.get_or_create(discord_id=user.id)
         old_player = countryball.player
 
@@ -491,19 +449,19 @@ class Balls(commands.GroupCog, group_name=settings.players_group_cog_name):
             await interaction.response.send_message(
                 f"You cannot give a {settings.collectible_name} to yourself."
             )
-            await countryball.unlock()
+            await self.bot.locks.release(countryball)
             return
         if new_player.donation_policy == DonationPolicy.ALWAYS_DENY:
             await interaction.response.send_message(
                 "This player does not accept donations. You can use trades instead."
             )
-            await countryball.unlock()
+            await self.bot.locks.release(countryball)
             return
         if new_player.discord_id in self.bot.blacklist:
             await interaction.response.send_message(
                 "You cannot donate to a blacklisted user", ephemeral=True
             )
-            await countryball.unlock()
+            await self.bot.locks.release(countryball)
             return
         elif new_player.donation_policy == DonationPolicy.REQUEST_APPROVAL:
             await interaction.response.send_message(
@@ -518,6 +476,8 @@ class Balls(commands.GroupCog, group_name=settings.players_group_cog_name):
         countryball.trade_player = old_player
         countryball.favorite = False
         await countryball.save()
+        self.bot.completions.add(new_player.discord_id, countryball)
+        await self.bot.completions.remove(old_player.discord_id, countryball)
 
         trade = await Trade.create(player1=old_player, player2=new_player)
         await TradeObject.create(trade=trade, ballinstance=countryball, player=old_player)
@@ -528,7 +488,7 @@ class Balls(commands.GroupCog, group_name=settings.players_group_cog_name):
         await interaction.response.send_message(
             f"You just gave the {settings.collectible_name} {cb_txt} to {user.mention}!"
         )
-        await countryball.unlock()
+        await self.bot.locks.release(countryball)
 
     @app_commands.command()
     async def count(
@@ -556,18 +516,16 @@ class Balls(commands.GroupCog, group_name=settings.players_group_cog_name):
         if interaction.response.is_done():
             return
         assert interaction.guild
-        filters = {}
-        if countryball:
-            filters["ball"] = countryball
-        if shiny is not None:
-            filters["shiny"] = shiny
-        if special:
-            filters["special"] = special
-        if current_server:
-            filters["server_id"] = interaction.guild.id
-        filters["player__discord_id"] = interaction.user.id
         await interaction.response.defer(ephemeral=True, thinking=True)
-        balls = await BallInstance.filter(**filters).count()
+        await self.bot.catches.ensure_written(discord_id=interaction.user.id)
+        balls = await repository.count_instances(
+            interaction.user.id,
+            ball_id=countryball.pk if countryball else None,
+            shiny=shiny,
+            special_id=special.pk if special else None,
+            server_id=interaction.guild.id if current_server else None,
+            connection=read_router.connection(interaction.user.id),
+        )
         country = f"{countryball.country} " if countryball else ""
         plural = "s" if balls > 1 or balls == 0 else ""
         shiny_str = "shiny " if shiny else ""
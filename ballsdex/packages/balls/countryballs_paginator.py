@@ -1,34 +1,150 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, List
+from typing import TYPE_CHECKING, Any, List
 
 import discord
+from tortoise import Tortoise
 
-from ballsdex.core.models import BallInstance
-from ballsdex.core.utils import menus
-from ballsdex.core.utils.paginator import Pages
+from ballsdex.core.db import read_router
+from ballsdex.core.models import BallInstance, BallInstanceView
+from ballsdex.core.utils.paginator import Pages, QuerySetPageSource
 
 if TYPE_CHECKING:
     from ballsdex.core.bot import BallsDexBot
 
+HEALTH = "b.health + TRUNC(b.health * bi.health_bonus * 0.01)"
+ATTACK = "b.attack + TRUNC(b.attack * bi.attack_bonus * 0.01)"
 
-class CountryballsSource(menus.ListPageSource):
-    def __init__(self, entries: List[BallInstance]):
-        super().__init__(entries, per_page=25)
+# SQL expressions used as sort keys for each sorting choice, with True for a descending order.
+# The instance ID is always appended as the last key, giving a stable order for keyset pagination.
+SORT_KEYS: dict[str, tuple[tuple[str, bool], ...]] = {
+    "default": (("bi.favorite", True), ("bi.shiny", True)),
+    "alphabetic": (("b.country", False),),
+    "catch_date": (("bi.catch_date", True),),
+    "rarity": (("b.rarity", False),),
+    # instances without special are listed last
+    "special": (("COALESCE(bi.special_id, 2147483647)", False),),
+    "health": ((HEALTH, True),),
+    "attack": ((ATTACK, True),),
+    "health_bonus": (("bi.health_bonus", True),),
+    "attack_bonus": (("bi.attack_bonus", True),),
+    "stats_bonus": (("bi.health_bonus + bi.attack_bonus", True),),
+    "total_stats": ((f"{HEALTH} + {ATTACK}", True),),
+    "duplicates": (("COUNT(*) OVER (PARTITION BY bi.ball_id)", True), ("bi.ball_id", False)),
+}
 
-    async def format_page(self, menu: CountryballsSelector, balls: List[BallInstance]):
+
+class CountryballsSource(QuerySetPageSource[BallInstance]):
+    """
+    Lists the countryballs of a player, fetching one page at a time from the database.
+
+    Sorting is entirely done by SQL, and pages are fetched with keyset pagination: the sort
+    keys of the last row of a page are the starting point of the next one. Jumping to a page
+    that wasn't reached yet falls back to an offset.
+
+    The queryset is only used for counting the entries.
+
+    Parameters
+    ----------
+    player_id: int
+        The primary key of the player whose countryballs are listed.
+    sort: str
+        A key of `SORT_KEYS`.
+    reverse: bool
+        Reverse the order of the listing.
+    ball_id: int | None
+        Only list instances of this countryball.
+    discord_id: int | None
+        The Discord ID of the player. If set, the listing is read from the replica unless the
+        player obtained or lost instances recently.
+    """
+
+    def __init__(
+        self,
+        player_id: int,
+        sort: str = "default",
+        *,
+        reverse: bool = False,
+        ball_id: int | None = None,
+        discord_id: int | None = None,
+    ):
+        # the listing may span several pages, the connection is picked once for consistency
+        self.connection = (
+            read_router.connection(discord_id)
+            if discord_id is not None
+            else Tortoise.get_connection("default")
+        )
+        queryset = BallInstance.filter(player_id=player_id).using_db(self.connection)
+        if ball_id is not None:
+            queryset = queryset.filter(ball_id=ball_id)
+        super().__init__(queryset, per_page=25)
+        self.player_id = player_id
+        self.ball_id = ball_id
+        self.keys = [(expr, desc != reverse) for expr, desc in SORT_KEYS[sort]]
+        self.keys.append(("bi.id", reverse))
+        # sort keys of the last row of each fetched page
+        self._cursors: dict[int, tuple[Any, ...]] = {}
+
+    def _build_query(self, page_number: int) -> tuple[str, list[Any]]:
+        values: list[Any] = [self.player_id]
+        where = "bi.player_id = $1"
+        if self.ball_id is not None:
+            values.append(self.ball_id)
+            where += " AND bi.ball_id = $2"
+        columns = ", ".join(f"{expr} AS k{i}" for i, (expr, _) in enumerate(self.keys))
+        order_by = ", ".join(
+            f"k{i} {'DESC' if desc else 'ASC'}" for i, (_, desc) in enumerate(self.keys)
+        )
+
+        keyset = ""
+        offset = ""
+        if page_number > 0 and (cursor := self._cursors.get(page_number - 1)):
+            # (k0, k1, ...) strictly after the cursor, respecting the direction of each key
+            conditions: list[str] = []
+            for i, (_, desc) in enumerate(self.keys):
+                terms = [f"k{j} = ${len(values) + j + 1}" for j in range(i)]
+                terms.append(f"k{i} {'<' if desc else '>'} ${len(values) + i + 1}")
+                conditions.append(f"({' AND '.join(terms)})")
+            values.extend(cursor)
+            keyset = f"WHERE {' OR '.join(conditions)}"
+        elif page_number > 0:
+            offset = f"OFFSET {page_number * self.per_page}"
+
+        # the sort keys are computed in a subquery, window functions cannot be filtered on
+        query = (
+            f"SELECT * FROM (SELECT {columns} FROM ballinstance AS bi "
+            f"INNER JOIN ball AS b ON b.id = bi.ball_id WHERE {where}) AS listing "
+            f"{keyset} ORDER BY {order_by} LIMIT {self.per_page} {offset}"
+        )
+        return query, values
+
+    async def fetch_page(self, page_number: int) -> List[BallInstanceView]:  # type: ignore
+        query, values = self._build_query(page_number)
+        _, rows = await self.connection.execute_query(query, values)
+        if not rows:
+            return []
+
+        key_count = len(self.keys)
+        self._cursors[page_number] = tuple(rows[-1][f"k{i}"] for i in range(key_count))
+        ids: list[int] = [row[f"k{key_count - 1}"] for row in rows]
+        queryset = BallInstance.filter(id__in=ids).using_db(self.connection)
+        instances = {x.pk: x for x in await BallInstanceView.fetch(queryset)}
+        return [instances[x] for x in ids if x in instances]
+
+    async def format_page(self, menu: CountryballsSelector, balls: List[BallInstanceView]):
         menu.set_options(balls)
         return True  # signal to edit the page
 
 
 class CountryballsSelector(Pages):
-    def __init__(self, interaction: discord.Interaction["BallsDexBot"], balls: List[BallInstance]):
+    def __init__(
+        self, interaction: discord.Interaction["BallsDexBot"], source: CountryballsSource
+    ):
         self.bot = interaction.client
-        source = CountryballsSource(balls)
         super().__init__(source, interaction=interaction)
         self.add_item(self.select_ball_menu)
 
-    def set_options(self, balls: List[BallInstance]):
+    def set_options(self, balls: List[BallInstanceView]):
         options: List[discord.SelectOption] = []
         for ball in balls:
             emoji = self.bot.get_emoji(int(ball.countryball.emoji_id))
@@ -20,15 +20,11 @@ class CountryBallsSpawner(commands.Cog):
         self.bot = bot
 
     async def load_cache(self):
-        i = 0
-        async for config in GuildConfig.all():
-            if not config.enabled:
-                continue
-            if not config.spawn_channel:
-                continue
-            self.spawn_manager.cache[config.guild_id] = config.spawn_channel
-            i += 1
-        log.info(f"Loaded {i} guilds in cache")
+        configs = await GuildConfig.filter(enabled=True, spawn_channel__isnull=False).values_list(
+            "guild_id", "spawn_channel"
+        )
+        self.spawn_manager.cache.update(configs)  # type: ignore
+        log.info(f"Loaded {len(configs)} guilds in cache")
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
@@ -10,12 +10,13 @@ from discord.ui import Button, Modal, TextInput, View
 from prometheus_client import Counter
 from tortoise.timezone import now as datetime_now
 
-from ballsdex.core.models import BallInstance, Player, specials
+from ballsdex.core import repository
+from ballsdex.core.models import specials
 from ballsdex.settings import settings
 
 if TYPE_CHECKING:
     from ballsdex.core.bot import BallsDexBot
-    from ballsdex.core.models import Special
+    from ballsdex.core.models import BallInstanceView, Special
     from ballsdex.packages.countryballs.countryball import CountryBall
 
 log = logging.getLogger("ballsdex.packages.countryballs.components")
@@ -87,8 +88,8 @@ class CountryballNamePrompt(Modal, title=f"Catch this {settings.collectible_name
 
     async def catch_ball(
         self, bot: "BallsDexBot", user: discord.Member
-    ) -> tuple[BallInstance, bool]:
-        player, created = await Player.get_or_create(discord_id=user.id)
+    ) -> tuple["BallInstanceView", bool]:
+        player, created = await repository.get_or_create_player(user.id)
 
         # stat may vary by +/- 20% of base stat
         bonus_attack = random.randint(-20, 20)
@@ -110,16 +111,18 @@ class CountryballNamePrompt(Modal, title=f"Catch this {settings.collectible_name
             # None is added representing the common countryball
             special = random.choices(population=population + [None], weights=weights, k=1)[0]
 
-        is_new = not await BallInstance.filter(player=player, ball=self.ball.model).exists()
-        ball = await BallInstance.create(
-            ball=self.ball.model,
-            player=player,
+        completion = await bot.completions.get(user.id)
+        is_new = not completion.owns(self.ball.model.pk)
+        ball = await bot.catches.create(
+            player,
+            self.ball.model.pk,
             shiny=shiny,
-            special=special,
+            special_id=special.pk if special else None,
             attack_bonus=bonus_attack,
             health_bonus=bonus_health,
             server_id=user.guild.id,
         )
+        bot.completions.add(user.id, ball)
         if user.id in bot.catch_log:
             log.info(
                 f"{user} caught {settings.collectible_name}"
@@ -10,7 +10,6 @@ from discord.ext import commands
 from ballsdex import __version__ as ballsdex_version
 from ballsdex.core.models import Ball
 from ballsdex.core.models import balls as countryballs
-from ballsdex.core.utils.tortoise import row_count_estimate
 from ballsdex.settings import settings
 
 if TYPE_CHECKING:
@@ -65,8 +64,9 @@ class Info(commands.Cog):
             balls = []
 
         balls_count = len([x for x in countryballs.values() if x.enabled])
-        players_count = await row_count_estimate("player")
-        balls_instances_count = await row_count_estimate("ballinstance")
+        stats = await self.bot.stats.get()
+        players_count = stats.players
+        balls_instances_count = stats.instances
 
         assert self.bot.user
         assert self.bot.application
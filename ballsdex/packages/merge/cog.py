@@ -1,5 +1,6 @@
-from collections import defaultdict
-from typing import TYPE_CHECKING, cast
+import logging
+from collections import Counter
+from typing import TYPE_CHECKING
 
 import discord
 from discord import app_commands
@@ -8,33 +9,40 @@ from discord.utils import MISSING
 from tortoise.expressions import Q
 from tortoise.exceptions import DoesNotExist
 
-from ballsdex.core.models import Player
+from ballsdex.core.models import Player, balls
 # from ballsdex.core.models import Merge as MergeModel
 from ballsdex.core.utils.buttons import ConfirmChoiceView
 from ballsdex.core.utils.paginator import Pages
+from ballsdex.core.utils.proposal import run_bulk_add, run_bulk_remove
 from ballsdex.core.utils.transformers import (
+    BallEnabledTransform,
     BallTransform,
     BallInstanceTransform,
     SpecialEnabledTransform,
     MergeCommandType,
 )
 from ballsdex.packages.merge.display import MergeViewFormat
-from ballsdex.packages.merge.menu import MergeMenu, recipes
+from ballsdex.packages.merge.executor import InvalidMergeOperation, execute_merges
+from ballsdex.packages.merge.menu import MergeMenu
 from ballsdex.packages.merge.merge_user import MergingUser
+from ballsdex.packages.merge.planner import plan_merges
 from ballsdex.settings import settings
 
 if TYPE_CHECKING:
     from ballsdex.core.bot import BallsDexBot
 
+log = logging.getLogger("ballsdex.packages.merge.cog")
+
 
 class Merge(commands.GroupCog):
     """
     Merge countryballs into another
     """
 
+    bulk = app_commands.Group(name="bulk", description="Add or remove many countryballs at once")
+
     def __init__(self, bot: "BallsDexBot"):
         self.bot = bot
-        self.merges: dict[int, dict[int, list[MergeMenu]]] = defaultdict(lambda: defaultdict(list))
 
     def get_merge(
         self,
@@ -56,43 +64,16 @@ class Merge(commands.GroupCog):
         tuple[MergeMenu, MergingUser] | tuple[None, None]
             A tuple with the `MergeMenu` and `MergingUser` if found, else `None`.
         """
-        guild: discord.Guild
         if interaction:
-            guild = cast(discord.Guild, interaction.guild)
-            channel = cast(discord.TextChannel, interaction.channel)
+            channel = interaction.channel  # type: ignore
             user = interaction.user
-        elif channel:
-            guild = channel.guild
-        else:
+        elif not channel:
             raise TypeError("Missing interaction or channel")
 
-        if guild.id not in self.merges:
-            return (None, None)
-        if channel.id not in self.merges[guild.id]:
+        merge = self.bot.sessions.get(MergeMenu, channel.id, user.id)
+        if merge is None:
             return (None, None)
-        to_remove: list[MergeMenu] = []
-        for merge in self.merges[guild.id][channel.id]:
-            if (
-                merge.current_view.is_finished()
-                or merge.merger1.cancelled
-            ):
-                # remove what was supposed to have been removed
-                to_remove.append(merge)
-                continue
-            try:
-                merger = merge._get_merger(user)
-            except RuntimeError:
-                continue
-            else:
-                break
-        else:
-            for merge in to_remove:
-                self.merges[guild.id][channel.id].remove(merge)
-            return (None, None)
-
-        for merge in to_remove:
-            self.merges[guild.id][channel.id].remove(merge)
-        return (merge, merger)
+        return (merge, merge._get_merger(user))
 
     @app_commands.command()
     async def recipe(
@@ -106,25 +87,26 @@ class Merge(commands.GroupCog):
 
         """
 
-        user = interaction.user
-
-        if(ball.country not in recipes.keys()):
+        if ball.pk not in self.bot.recipes:
             await interaction.response.send_message(
                 f"This {settings.collectible_name} is not able to merge!!", ephemeral=True
             )
             return
 
-        player = await Player.get(discord_id=user.id)
+        player, _ = await Player.get_or_create(discord_id=interaction.user.id)
+        owned = await self.bot.recipes.owned_counts(player, ball.pk)
 
-        await player.fetch_related("balls")
-        countryballs = await player.balls.all()
-        cb_name = list(cb.countryball.country for cb in countryballs)
-
-        _recipe = recipes[ball.country]
         response = f"Recipe of {ball.country}:\n--------------------"
-
-        for ing in _recipe:
-            response = response + '\n' + ing + f' (You own {str(cb_name.count(ing))})'
+        for ingredient, amount in self.bot.recipes.recipes[ball.pk].items():
+            name = balls[ingredient].country if ingredient in balls else str(ingredient)
+            if amount > 1:
+                name = f"{name} x{amount}"
+            response += f"\n{name} (You own {owned.get(ingredient, 0)})"
+        if self.bot.recipes.is_nested(ball.pk):
+            response += "\n--------------------\nIn base ingredients:"
+            for ingredient, amount in self.bot.recipes.expanded[ball.pk].items():
+                name = balls[ingredient].country if ingredient in balls else str(ingredient)
+                response += f"\n{name} x{amount} (You own {owned.get(ingredient, 0)})"
 
         await interaction.response.send_message(
             response + "\n--------------------", ephemeral=True
@@ -133,6 +115,136 @@ class Merge(commands.GroupCog):
         return
 
 
+    @app_commands.command()
+    async def available(self, interaction: discord.Interaction["BallsDexBot"]):
+        """
+        List the merges you can do with the countryballs you own.
+        """
+        player, _ = await Player.get_or_create(discord_id=interaction.user.id)
+        completable, from_base = await self.bot.recipes.completable_by(player)
+        from_base = [x for x in from_base if x not in completable]
+        if not completable and not from_base:
+            await interaction.response.send_message(
+                "You cannot complete any recipe right now.", ephemeral=True
+            )
+            return
+        response = ""
+        if completable:
+            names = sorted(balls[x].country for x in completable if x in balls)
+            response += "You can merge the following:\n" + "\n".join(f"- {x}" for x in names)
+        if from_base:
+            names = sorted(balls[x].country for x in from_base if x in balls)
+            response += (
+                "\nYou own the base ingredients of the following, merge their sub-recipes "
+                "first:\n" + "\n".join(f"- {x}" for x in names)
+            )
+        await interaction.response.send_message(response.strip(), ephemeral=True)
+
+    @app_commands.command()
+    async def auto(
+        self,
+        interaction: discord.Interaction["BallsDexBot"],
+        ball: BallTransform,
+        count: app_commands.Range[int, 1, 100] = 1,
+        favorites: bool = False,
+        shinies: bool = False,
+        specials: bool = False,
+    ):
+        """
+        Merge a countryball using the ingredients from your inventory.
+
+        Parameters
+        ----------
+        ball: Ball
+            The countryball you want to obtain.
+        count: int
+            The number of merges to do at once.
+        favorites: bool
+            Allow using your favorite countryballs as ingredients.
+        shinies: bool
+            Allow using shiny countryballs as ingredients.
+        specials: bool
+            Allow using special countryballs as ingredients.
+        """
+        if ball.pk not in self.bot.recipes:
+            await interaction.response.send_message(
+                f"This {settings.collectible_name} is not able to merge!!", ephemeral=True
+            )
+            return
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        player, _ = await Player.get_or_create(discord_id=interaction.user.id)
+
+        plan = await plan_merges(
+            self.bot,
+            player,
+            ball.pk,
+            count,
+            favorites=favorites,
+            shinies=shinies,
+            specials=specials,
+        )
+        if not plan.batches:
+            missing = "\n".join(
+                f"- {balls[x].country if x in balls else x} x{amount}"
+                for x, amount in plan.missing.items()
+            )
+            await interaction.followup.send(
+                f"You do not have enough ingredients to merge {ball.country}, missing:\n"
+                f"{missing}",
+                ephemeral=True,
+            )
+            return
+
+        ingredients = plan.ingredients
+        if not await self.bot.locks.acquire(interaction.user.id, *ingredients):
+            await interaction.followup.send(
+                "Some of these ingredients are currently in an active trade, merge or donation, "
+                "please try again later.",
+                ephemeral=True,
+            )
+            return
+
+        used = "\n".join(
+            f"- {balls[x].country if x in balls else x} x{amount}"
+            for x, amount in Counter(x.ball_id for x in ingredients).items()
+        )
+        view = ConfirmChoiceView(interaction)
+        await interaction.followup.send(
+            f"Merge {ball.country} x{len(plan.batches)} using the following "
+            f"{settings.collectible_name}s?\n{used}",
+            view=view,
+            ephemeral=True,
+        )
+        await view.wait()
+        if not view.value:
+            await self.bot.locks.release(*ingredients)
+            return
+
+        try:
+            results = await execute_merges(self.bot, player, ball, plan.batches)
+        except InvalidMergeOperation:
+            await self.bot.locks.release(*ingredients)
+            await interaction.followup.send(
+                f":warning: Some of these {settings.collectible_name}s changed in the meantime, "
+                "nothing was merged.",
+                ephemeral=True,
+            )
+            return
+        except Exception:
+            log.exception(f"Failed to auto merge {ball.country} for {interaction.user.id}")
+            await self.bot.locks.release(*ingredients)
+            await interaction.followup.send(
+                "An error occured when merging, nothing was merged.", ephemeral=True
+            )
+            return
+
+        shinies_obtained = sum(x.shiny for x in results)
+        await interaction.followup.send(
+            f"You obtained {ball.country} x{len(results)}!"
+            + (f" ({shinies_obtained} shiny)" if shinies_obtained else ""),
+            ephemeral=True,
+        )
+
     @app_commands.command()
     async def begin(
         self,
@@ -152,7 +264,7 @@ class Merge(commands.GroupCog):
             )
             return
 
-        if(ball.country not in recipes.keys()):
+        if ball.pk not in self.bot.recipes:
             await interaction.response.send_message(
                 f"This {settings.collectible_name} is not able to merge!!", ephemeral=True
             )
@@ -163,7 +275,7 @@ class Merge(commands.GroupCog):
         menu = MergeMenu(
             self, interaction, MergingUser(interaction.user, player1), ball
         )
-        self.merges[interaction.guild.id][interaction.channel.id].append(menu)  # type: ignore
+        self.bot.sessions.register(menu)
         await menu.start()
         await interaction.response.send_message("Merge started!", ephemeral=True)
 
@@ -223,16 +335,21 @@ class Merge(commands.GroupCog):
                 ephemeral=True,
             )
             return
-        if await countryball.is_locked():
+        if not await self.bot.locks.acquire(interaction.user.id, countryball):
             await interaction.followup.send(
                 "This countryball is currently in an active merge or donation, "
                 "please try again later.",
                 ephemeral=True,
             )
             return
+        if merger.locked or merge.is_finished():
+            # ended while acquiring, its proposals were already released without this one
+            await self.bot.locks.release(countryball)
+            await interaction.followup.send("The merge cannot be edited anymore.", ephemeral=True)
+            return
 
-        await countryball.lock_for_merge()
         merger.proposal.append(countryball)
+        merge.mark_dirty()
         await interaction.followup.send(
             f"{countryball.countryball.country} added.", ephemeral=True
         )
@@ -269,10 +386,86 @@ class Merge(commands.GroupCog):
             )
             return
         merger.proposal.remove(countryball)
+        merge.mark_dirty()
         await interaction.response.send_message(
             f"{countryball.countryball.country} removed.", ephemeral=True
         )
-        await countryball.unlock()
+        await self.bot.locks.release(countryball)
+
+    @bulk.command(name="add")
+    async def bulk_add(
+        self,
+        interaction: discord.Interaction["BallsDexBot"],
+        countryball: BallEnabledTransform | None = None,
+        shiny: bool | None = None,
+        special: SpecialEnabledTransform | None = None,
+        count: app_commands.Range[int, 1, 500] | None = None,
+        duplicates: bool = False,
+    ):
+        """
+        Add many countryballs to the ongoing merge at once. Favorites are never added.
+
+        Parameters
+        ----------
+        countryball: Ball
+            Only add this countryball.
+        shiny: bool
+            Only add shiny (or non-shiny) countryballs.
+        special: Special
+            Only add countryballs of this special event.
+        count: int
+            The maximum number of countryballs to add.
+        duplicates: bool
+            Keep one of each countryball out of the merge, only adding the duplicates.
+        """
+        merge, merger = self.get_merge(interaction)
+        await run_bulk_add(
+            interaction,
+            merge,
+            merger,
+            "merge",
+            ball=countryball,
+            shiny=shiny,
+            special=special,
+            count=count,
+            duplicates=duplicates,
+            tradeable=False,
+        )
+
+    @bulk.command(name="remove")
+    async def bulk_remove(
+        self,
+        interaction: discord.Interaction["BallsDexBot"],
+        countryball: BallEnabledTransform | None = None,
+        shiny: bool | None = None,
+        special: SpecialEnabledTransform | None = None,
+        count: app_commands.Range[int, 1, 500] | None = None,
+    ):
+        """
+        Remove many countryballs from your proposal at once, all of them without filters.
+
+        Parameters
+        ----------
+        countryball: Ball
+            Only remove this countryball.
+        shiny: bool
+            Only remove shiny (or non-shiny) countryballs.
+        special: Special
+            Only remove countryballs of this special event.
+        count: int
+            The maximum number of countryballs to remove, starting from the last added.
+        """
+        merge, merger = self.get_merge(interaction)
+        await run_bulk_remove(
+            interaction,
+            merge,
+            merger,
+            "merge",
+            ball=countryball,
+            shiny=shiny,
+            special=special,
+            count=count,
+        )
 
     @app_commands.command()
     async def cancel(self, interaction: discord.Interaction):
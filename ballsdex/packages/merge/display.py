@@ -5,6 +5,7 @@ import discord
 from ballsdex.core.models import Merge as MergeModel
 from ballsdex.core.utils import menus
 from ballsdex.core.utils.paginator import Pages
+from ballsdex.core.utils.proposal import PAGE_LENGTH, paginate_lines, proposal_lines
 from ballsdex.packages.merge.merge_user import MergingUser
 
 if TYPE_CHECKING:
@@ -46,45 +47,31 @@ def _get_prefix_emote(merger: MergingUser) -> str:
         return ""
 
 
-def _build_list_of_strings(
-    merger: MergingUser, bot: "BallsDexBot", short: bool = False
-) -> list[str]:
-    # this builds a list of strings always lower than 1024 characters
-    # while not cutting in the middle of a line
-    proposal: list[str] = [""]
-    i = 0
-
-    for countryball in merger.proposal:
-        cb_text = countryball.description(short=short, include_emoji=True, bot=bot, is_trade=True)
-        if merger.locked:
-            text = f"- *{cb_text}*\n"
-        else:
-            text = f"- {cb_text}\n"
-        if merger.cancelled:
-            text = f"~~{text}~~"
-
-        if len(text) + len(proposal[i]) > 950:
-            # move to a new list element
-            i += 1
-            proposal.append("")
-        proposal[i] += text
-
-    if not proposal[0]:
-        proposal[0] = "*Empty*"
+def _layout_fields(name: str, pages: list[str]) -> list[tuple[str, str]]:
+    fields = [(name, pages[0])]
+    if len(pages) > 1:
+        # we'll have to trick for displaying the other pages
+        # fields have to stack themselves vertically
+        # to do this, we add a 3rd empty field on each line (since 3 fields per line)
+        for page in pages[1:]:
+            fields.append(("\u200B", "\u200B"))  # empty
+            fields.append(("\u200B", page))
 
-    return proposal
+        # always add an empty field at the end, otherwise the alignment is off
+        fields.append(("\u200B", "\u200B"))
+    return fields
 
 
 def fill_merge_embed_fields(
     embed: discord.Embed,
     bot: "BallsDexBot",
     merger1: MergingUser,
-    compact: bool = False,
 ):
     """
     Fill the fields of an embed with the items part of a merge.
 
-    This handles embed limits and will shorten the content if needed.
+    This handles embed limits and will shorten the content if needed. The lines of each
+    countryball are cached on the merger, only new countryballs are formatted.
 
     Parameters
     ----------
@@ -94,48 +81,21 @@ def fill_merge_embed_fields(
         The bot object, used for getting emojis.
     merger1: MergingUser
         The player that initiated the merge, displayed on the left side.
-    compact: bool
-        If `True`, display countryballs in a compact way. This should not be used directly.
     """
     embed.clear_fields()
+    remaining = 6000 - len(embed)
+    name = f"{_get_prefix_emote(merger1)} {merger1.user.name}"
 
-    # first, build embed strings
     # to play around the limit of 1024 characters per field, we'll be using multiple fields
-    # these vars are list of fields, being a list of lines to include
-    merger1_proposal = _build_list_of_strings(merger1, bot, compact)
-
-    # then display the text. first page is easy
-    embed.add_field(
-        name=f"{_get_prefix_emote(merger1)} {merger1.user.name}",
-        value=merger1_proposal[0],
-        inline=True,
-    )
-
-    if len(merger1_proposal) > 1:
-        # we'll have to trick for displaying the other pages
-        # fields have to stack themselves vertically
-        # to do this, we add a 3rd empty field on each line (since 3 fields per line)
-        i = 1
-        while i < len(merger1_proposal):
-            embed.add_field(name="\u200B", value="\u200B", inline=True)  # empty
-
-            if i < len(merger1_proposal):
-                embed.add_field(name="\u200B", value=merger1_proposal[i], inline=True)
-            else:
-                embed.add_field(name="\u200B", value="\u200B", inline=True)
-
-            i += 1
-
-        # always add an empty field at the end, otherwise the alignment is off
-        embed.add_field(name="\u200B", value="\u200B", inline=True)
-
-    if len(embed) > 6000:
-        if not compact:
-            return fill_merge_embed_fields(embed, bot, merger1, compact=True)
-        else:
-            embed.clear_fields()
-            embed.add_field(
-                name=f"{_get_prefix_emote(merger1)} {merger1.user.name}",
-                value=f"Merge too long, only showing last page:\n{merger1_proposal[-1]}",
-                inline=True,
-            )
\ No newline at end of file
+    lines = proposal_lines(merger1, bot)
+    length = sum(map(len, lines))
+    # the fields only add their names and a few empty values to the lines of each page
+    if length + len(name) + 8 * (length // PAGE_LENGTH + 2) > remaining:
+        lines = proposal_lines(merger1, bot, short=True)
+    pages = paginate_lines(lines)
+    fields = _layout_fields(name, pages)
+    if sum(len(x) + len(y) for x, y in fields) > remaining:
+        fields = [(name, f"Merge too long, only showing last page:\n{pages[-1]}")]
+
+    for field_name, value in fields:
+        embed.add_field(name=field_name, value=value, inline=True)
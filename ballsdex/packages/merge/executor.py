@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import random
+import time
+from collections import Counter
+from typing import TYPE_CHECKING
+
+from prometheus_client import Histogram
+from tortoise.transactions import in_transaction
+
+from ballsdex.core.models import BallInstance, Merge, MergeObject
+
+if TYPE_CHECKING:
+    from ballsdex.core.bot import BallsDexBot
+    from ballsdex.core.models import Ball, Player
+
+merge_commit_duration = Histogram(
+    "merge_commit_duration", "Time taken to commit merges to the database"
+)
+
+
+class InvalidMergeOperation(Exception):
+    pass
+
+
+async def execute_merges(
+    bot: "BallsDexBot", player: "Player", ball: "Ball", batches: list[list[BallInstance]]
+) -> list[BallInstance]:
+    """
+    Merge sets of ingredients into new instances of a ball, in a single transaction.
+
+    The ingredient rows are locked and checked against the owner and the recipe before being
+    deleted. Nothing is written if one of the checks fails. The locks of the ingredients are
+    released once done.
+
+    Parameters
+    ----------
+    bot: BallsDexBot
+        The bot, holding the recipes and the caches.
+    player: Player
+        The player merging, owner of the ingredients.
+    ball: Ball
+        The ball obtained by merging.
+    batches: list[list[BallInstance]]
+        The ingredients of each merge.
+
+    Returns
+    -------
+    list[BallInstance]
+        The created instances, one per batch.
+
+    Raises
+    ------
+    InvalidMergeOperation
+        An ingredient is not owned by the player anymore, or the ingredients do not match the
+        recipe.
+    """
+    start = time.perf_counter()
+    recipe = bot.recipes.recipes.get(ball.pk)
+    ingredients = [x for batch in batches for x in batch]
+    ids = [x.pk for x in ingredients]
+    if recipe is None or len(set(ids)) != len(ids):
+        raise InvalidMergeOperation()
+
+    async with in_transaction() as connection:
+        # lock the rows until the end of the transaction, ordered to prevent deadlocks
+        rows = {
+            pk: (player_id, ball_id)
+            for pk, player_id, ball_id in await BallInstance.filter(id__in=ids)
+            .using_db(connection)
+            .order_by("id")
+            .select_for_update()
+            .values_list("id", "player_id", "ball_id")
+        }
+        if len(rows) != len(ids) or any(x[0] != player.pk for x in rows.values()):
+            raise InvalidMergeOperation()
+        for batch in batches:
+            if Counter(rows[x.pk][1] for x in batch) != recipe:
+                raise InvalidMergeOperation()
+
+        results: list[BallInstance] = []
+        merge_objects: list[MergeObject] = []
+        for batch in batches:
+            instance = await BallInstance.create(
+                ball=ball,
+                player=player,
+                shiny=(random.randint(1, 2048) == 1),
+                attack_bonus=(random.randint(-20, 20)),
+                health_bonus=(random.randint(-20, 20)),
+                special=None,
+                using_db=connection,
+            )
+            merge = await Merge.create(
+                player1=player, ball=ball, result=instance, using_db=connection
+            )
+            results.append(instance)
+            merge_objects.extend(
+                MergeObject(
+                    merge=merge, ballinstance_id=x.pk, ball_id=rows[x.pk][1], player=player
+                )
+                for x in batch
+            )
+        await MergeObject.bulk_create(merge_objects, using_db=connection)
+        await BallInstance.filter(id__in=ids).using_db(connection).delete()
+
+    await bot.locks.release(*ingredients)
+    merge_commit_duration.observe(time.perf_counter() - start)
+
+    bot.completions.add(player.discord_id, *results)
+    await bot.completions.remove(player.discord_id, *ingredients)
+    return results
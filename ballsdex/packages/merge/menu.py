@@ -1,17 +1,14 @@
 from __future__ import annotations
 
-import asyncio
 import logging
-import random
-from datetime import datetime, timedelta
 from typing import TYPE_CHECKING, cast
 
 import discord
 from discord.ui import Button, View, button
 
-from ballsdex.core.models import BallInstance
 from ballsdex.core.models import balls
 from ballsdex.packages.merge.display import fill_merge_embed_fields
+from ballsdex.packages.merge.executor import InvalidMergeOperation, execute_merges
 from ballsdex.packages.merge.merge_user import MergingUser
 from ballsdex.settings import settings
 from ballsdex.core.utils.transformers import BallTransform
@@ -22,23 +19,6 @@ if TYPE_CHECKING:
 
 log = logging.getLogger("ballsdex.packages.merge.menu")
 
-recipes = {
-    "四君子湯": ["人參", "白朮", "茯苓", "甘草"],
-    "四物湯": ["熟地", "當歸", "白芍", "川芎"],
-    "八珍湯": ["四君子湯", "四物湯"],
-    "十全大補湯": ["八珍湯", "黃耆", "肉桂"],
-    "六味地黃丸": ["熟地", "山藥", "茯苓", "牡丹皮"],
-    "桂枝湯": ["桂枝", "白芍", "生薑", "甘草", "大棗"],
-    "二陳湯": ["陳皮", "半夏", "茯苓", "甘草", "大棗"],
-    "黃連解毒湯": ["黃芩", "黃連", "黃柏", "梔子"],
-    "龜鹿二仙膠": ["龜龜", "謝一如"],
-    "溫婕伶": ["豬苓", "豬苓", "豬苓", "豬苓", "豬苓", "豬苓", "豬苓", "豬苓","豬苓", "豬苓", "豬苓", "豬苓", "豬苓", "豬苓", "豬苓", "豬苓", "豬苓","豬苓", "豬苓", "豬苓", "豬苓", "豬苓", "豬苓", "豬苓", "豬苓",],
-    }
-
-
-class InvalidMergeOperation(Exception):
-    pass
-
 
 class MergeView(View):
     def __init__(self, merge: MergeMenu):
@@ -87,9 +67,9 @@ class MergeView(View):
                 ephemeral=True,
             )
         else:
-            for countryball in merger.proposal:
-                await countryball.unlock()
+            await self.merge.bot.locks.release(*merger.proposal)
             merger.proposal.clear()
+            self.merge.mark_dirty()
             await interaction.response.send_message("Proposal cleared.", ephemeral=True)
 
     @button(
@@ -118,6 +98,9 @@ class ConfirmView(View):
         else:
             return True
 
+    async def on_timeout(self):
+        self.merge.bot.sessions.unregister(self.merge)
+
     @discord.ui.button(
         style=discord.ButtonStyle.success, emoji="\N{HEAVY CHECK MARK}\N{VARIATION SELECTOR-16}"
     )
@@ -152,6 +135,8 @@ class ConfirmView(View):
 
 
 class MergeMenu:
+    kind = "merge"
+
     def __init__(
         self,
         cog: MergeCog,
@@ -164,7 +149,6 @@ class MergeMenu:
         self.channel: discord.TextChannel = cast(discord.TextChannel, interaction.channel)
         self.merger1 = merger1
         self.embed = discord.Embed()
-        self.task: asyncio.Task | None = None
         self.current_view: MergeView | ConfirmView = MergeView(self)
         self.message: discord.Message
         self.ball = ball
@@ -175,6 +159,13 @@ class MergeMenu:
 
         raise RuntimeError(f"User with ID {user.id} cannot be found in the merge")
 
+    @property
+    def participants(self) -> tuple[int]:
+        return (self.merger1.user.id,)
+
+    def is_finished(self) -> bool:
+        return self.current_view.is_finished() or self.merger1.cancelled
+
     def _generate_embed(self):
         add_command = self.cog.add.extras.get("mention", "`/merge add`")
         remove_command = self.cog.remove.extras.get("mention", "`/merge remove`")
@@ -188,37 +179,26 @@ class MergeMenu:
             "*You have 30 minutes before this interaction ends.*"
         )
         self.embed.set_footer(
-            text="This message is updated every 15 seconds, "
-            "but you can keep on editing your proposal."
+            text="This message is updated a few seconds after each change, "
+            "you can keep on editing your proposal."
         )
 
-    async def update_message_loop(self):
+    def mark_dirty(self):
         """
-        A loop task that updates each 5 second the menu with the new content.
+        Schedule a refresh of the message after a change of the proposal.
         """
+        self.bot.menu_refresher.mark_dirty(self)
 
-        assert self.task
-        start_time = datetime.utcnow()
+    async def refresh(self):
+        """
+        Update the menu with the new content, called by the bot's `MenuRefresher`.
+        """
+        fill_merge_embed_fields(self.embed, self.bot, self.merger1)
+        await self.message.edit(embed=self.embed)
 
-        while True:
-            await asyncio.sleep(15)
-            if datetime.utcnow() - start_time > timedelta(minutes=15):
-                self.embed.colour = discord.Colour.dark_red()
-                await self.cancel("The merge timed out")
-                return
-
-            try:
-                fill_merge_embed_fields(self.embed, self.bot, self.merger1)
-                await self.message.edit(embed=self.embed)
-            except Exception:
-                log.exception(
-                    "Failed to refresh the merge menu "
-                    f"guild={self.message.guild.id} "  # type: ignore
-                    f"merger1={self.merger1.user.id}"
-                )
-                self.embed.colour = discord.Colour.dark_red()
-                await self.cancel("The merge timed out")
-                return
+    async def timeout(self):
+        self.embed.colour = discord.Colour.dark_red()
+        await self.cancel("The merge timed out")
 
     async def start(self):
         """
@@ -231,17 +211,16 @@ class MergeMenu:
             embed=self.embed,
             view=self.current_view,
         )
-        self.task = self.bot.loop.create_task(self.update_message_loop())
+        self.bot.menu_refresher.open(self)
 
     async def cancel(self, reason: str = "The merge has been cancelled."):
         """
         Cancel the merge immediately.
         """
-        if self.task:
-            self.task.cancel()
+        self.bot.menu_refresher.close(self)
+        self.bot.sessions.unregister(self)
 
-        for countryball in self.merger1.proposal:
-            await countryball.unlock()
+        await self.bot.locks.release(*self.merger1.proposal)
 
         self.current_view.stop()
         for item in self.current_view.children:
@@ -257,8 +236,7 @@ class MergeMenu:
         """
         merger.locked = True
         if self.merger1.locked:
-            if self.task:
-                self.task.cancel()
+            self.bot.menu_refresher.close(self)
             self.current_view.stop()
             fill_merge_embed_fields(self.embed, self.bot, self.merger1)
 
@@ -277,87 +255,16 @@ class MergeMenu:
         self.embed.colour = discord.Colour.red()
         await self.cancel()
 
-    async def check_recipe(self, recipe: list):
-        if(len(self.merger1.proposal) != len(recipe)):
-            return False
-
-        recipe_cp = [ingre for ingre in recipe]
-
-        for cb in self.merger1.proposal:
-            bb = cb.countryball
-            if(bb.country in recipe_cp):
-                recipe_cp.remove(bb.country)
-
-        if(len(recipe_cp) == 0):
-            return True
-
-        return False
-
     async def perform_merge(self):
-        # valid_transferable_countryballs: list[BallInstance] = []
-
-        # merge = await Merge.create(player1=self.merger1.player)
-
-        recipe = recipes[self.ball.country]
-        success = await self.check_recipe(recipe)
-        if(not success):
+        if not self.bot.recipes.matches(self.ball.pk, self.merger1.proposal):
             self.merger1.cancelled = True
             self.embed.colour = discord.Colour.dark_red()
-            for countryball in self.merger1.proposal:
-                await countryball.unlock()
-                await countryball.save()
+            await self.bot.locks.release(*self.merger1.proposal)
             self.merger1.proposal = []
             await self.cancel("Ho Ho Ho, the ingredients are not correct!")
             return
 
-        instance = await BallInstance.create(
-            ball=self.ball,
-            player=self.merger1.player,
-            shiny=(random.randint(1, 2048) == 1),
-            attack_bonus=(random.randint(-20, 20)),
-            health_bonus=(random.randint(-20, 20)),
-            special=None,
-        )
-
-        for countryball in self.merger1.proposal:
-            await countryball.refresh_from_db()
-            await countryball.delete()
-
-        # await interaction.followup.send(
-        #     f"`{ball.country}` {settings.collectible_name} was successfully given to `{user}`.\n"
-        #     f"Special: `{special.name if special else None}` • ATK:`{instance.attack_bonus:+d}` • "
-        #     f"HP:`{instance.health_bonus:+d}` • Shiny: `{instance.shiny}`"
-        # )
-        # await log_action(
-        #     f"{interaction.user} gave {settings.collectible_name} {ball.country} to {user}. "
-        #     f"Special={special.name if special else None} ATK={instance.attack_bonus:+d} "
-        #     f"HP={instance.health_bonus:+d} shiny={instance.shiny}",
-        #     self.bot,
-        # )
-
-
-
-
-            # valid_transferable_countryballs.append(countryball)
-            # await MergeObject.create(
-            #     merge=merge, ballinstance=countryball, player=self.merger1.player
-            # )
-
-        # for countryball in self.merger2.proposal:
-        #     if countryball.player.discord_id != self.merger2.player.discord_id:
-        #         # This is a invalid mutation, the player is not the owner of the countryball
-        #         raise InvalidMergeOperation()
-        #     countryball.player = self.merger1.player
-        #     countryball.merge_player = self.merger2.player
-        #     countryball.favorite = False
-        #     valid_transferable_countryballs.append(countryball)
-        #     await MergeObject.create(
-        #         merge=merge, ballinstance=countryball, player=self.merger2.player
-        #     )
-
-        # for countryball in valid_transferable_countryballs:
-        #     await countryball.unlock()
-        #     await countryball.save()
+        await execute_merges(self.bot, self.merger1.player, self.ball, [self.merger1.proposal])
 
     async def confirm(self, merger: MergingUser) -> bool:
         """
@@ -369,9 +276,9 @@ class MergeMenu:
         merger.accepted = True
         fill_merge_embed_fields(self.embed, self.bot, self.merger1)
         if self.merger1.accepted:
-            if self.task and not self.task.cancelled():
-                # shouldn't happen but just in case
-                self.task.cancel()
+            # shouldn't be open anymore but just in case
+            self.bot.menu_refresher.close(self)
+            self.bot.sessions.unregister(self)
 
             self.embed.description = "All ingredients added!"
             self.embed.colour = discord.Colour.green()
@@ -394,6 +301,9 @@ class MergeMenu:
                 self.embed.description = "An error occured when concluding the merge."
                 self.embed.colour = discord.Colour.red()
                 result = False
+            finally:
+                # released on success too, but a failed merge leaves them locked otherwise
+                await self.bot.locks.release(*self.merger1.proposal)
 
         await self.message.edit(content=None, embed=self.embed, view=self.current_view)
         return result
\ No newline at end of file
@@ -1,11 +1,13 @@
 from dataclasses import dataclass, field
 from typing import TYPE_CHECKING
 
+from ballsdex.core.models import BallInstance
+
 if TYPE_CHECKING:
     import discord
 
     from ballsdex.core.bot import BallsDexBot
-    from ballsdex.core.models import BallInstance, Player, Merge
+    from ballsdex.core.models import Merge, Player
 
 
 @dataclass(slots=True)
@@ -16,9 +18,16 @@ class MergingUser:
     locked: bool = False
     cancelled: bool = False
     accepted: bool = False
+    # rendered proposal lines, see ballsdex.core.utils.proposal
+    lines: dict[tuple[int, bool, bool, bool], str] = field(default_factory=dict, repr=False)
 
     @classmethod
     async def from_merge_model(cls, merge: "Merge", player: "Player", bot: "BallsDexBot"):
-        proposal = await merge.mergeobjects.filter(player=player).prefetch_related("ballinstance")
-        user = await bot.fetch_user(player.discord_id)
-        return cls(user, player, [x.ballinstance for x in proposal])
\ No newline at end of file
+        proposal = await merge.mergeobjects.filter(player=player)
+        user = await bot.user_resolver.get(player.discord_id)
+        # the ingredients were deleted, only their ball is known
+        return cls(
+            user,
+            player,
+            [BallInstance(id=x.ballinstance_id, ball_id=x.ball_id) for x in proposal],
+        )
\ No newline at end of file
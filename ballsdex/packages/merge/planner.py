@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+from ballsdex.core.models import BallInstance
+
+if TYPE_CHECKING:
+    from ballsdex.core.bot import BallsDexBot
+    from ballsdex.core.models import Player
+
+
+@dataclass
+class MergePlan:
+    """
+    The ingredients selected to merge a ball one or more times.
+
+    Attributes
+    ----------
+    batches: list[list[BallInstance]]
+        The ingredients of each merge. Empty if not a single merge is possible.
+    missing: dict[int, int]
+        The number of instances missing for a single merge, indexed by ball ID.
+    """
+
+    batches: list[list[BallInstance]] = field(default_factory=list)
+    missing: dict[int, int] = field(default_factory=dict)
+
+    @property
+    def ingredients(self) -> list[BallInstance]:
+        return [x for batch in self.batches for x in batch]
+
+
+def _cost(instance: BallInstance) -> tuple:
+    # the least valuable instances are used first
+    return (
+        instance.favorite,
+        instance.shiny,
+        instance.special_id is not None,
+        instance.attack_bonus + instance.health_bonus,
+        instance.pk,
+    )
+
+
+async def plan_merges(
+    bot: "BallsDexBot",
+    player: "Player",
+    ball_id: int,
+    count: int = 1,
+    *,
+    favorites: bool = False,
+    shinies: bool = False,
+    specials: bool = False,
+) -> MergePlan:
+    """
+    Pick the ingredients to merge a ball from the inventory of a player, with one query.
+
+    Locked instances are never selected. Among the others, the least valuable ones are used
+    first: regular instances before favorites, shinies and specials, then the lowest stats.
+
+    Parameters
+    ----------
+    bot: BallsDexBot
+        The bot, holding the recipes and the locks.
+    player: Player
+        The owner of the ingredients.
+    ball_id: int
+        The ID of the ball to obtain.
+    count: int
+        The number of merges wanted. Fewer are planned if the inventory is not sufficient.
+    favorites: bool
+        Allow using favorite instances.
+    shinies: bool
+        Allow using shiny instances.
+    specials: bool
+        Allow using special instances.
+    """
+    recipe = bot.recipes.recipes[ball_id]
+    queryset = BallInstance.filter(player=player, ball_id__in=list(recipe))
+    if not favorites:
+        queryset = queryset.filter(favorite=False)
+    if not shinies:
+        queryset = queryset.filter(shiny=False)
+    if not specials:
+        queryset = queryset.filter(special_id=None)
+    # a player can only lock their own countryballs, this also covers the locks held by other
+    # processes with the Redis backend
+    if locked := await bot.locks.owned(player.discord_id):
+        queryset = queryset.exclude(id__in=list(locked))
+
+    available: dict[int, list[BallInstance]] = {x: [] for x in recipe}
+    for instance in await queryset:
+        instance.player = player
+        available[instance.ball_id].append(instance)
+
+    possible = min(len(available[x]) // amount for x, amount in recipe.items())
+    if possible == 0:
+        return MergePlan(
+            missing={
+                x: amount - len(available[x])
+                for x, amount in recipe.items()
+                if len(available[x]) < amount
+            }
+        )
+
+    for instances in available.values():
+        instances.sort(key=_cost)
+    plan = MergePlan()
+    for i in range(min(count, possible)):
+        plan.batches.append(
+            [
+                instance
+                for x, amount in recipe.items()
+                for instance in available[x][i * amount : (i + 1) * amount]
+            ]
+        )
+    return plan
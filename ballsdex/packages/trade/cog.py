@@ -1,5 +1,4 @@
-from collections import defaultdict
-from typing import TYPE_CHECKING, cast
+from typing import TYPE_CHECKING
 
 import discord
 from discord import app_commands
@@ -11,7 +10,9 @@ from ballsdex.core.models import Player
 from ballsdex.core.models import Trade as TradeModel
 from ballsdex.core.utils.buttons import ConfirmChoiceView
 from ballsdex.core.utils.paginator import Pages
+from ballsdex.core.utils.proposal import run_bulk_add, run_bulk_remove
 from ballsdex.core.utils.transformers import (
+    BallEnabledTransform,
     BallInstanceTransform,
     SpecialEnabledTransform,
     TradeCommandType,
@@ -30,9 +31,10 @@ class Trade(commands.GroupCog):
     Trade countryballs with other playersa
     """
 
+    bulk = app_commands.Group(name="bulk", description="Add or remove many countryballs at once")
+
     def __init__(self, bot: "BallsDexBot"):
         self.bot = bot
-        self.trades: dict[int, dict[int, list[TradeMenu]]] = defaultdict(lambda: defaultdict(list))
 
     def get_trade(
         self,
@@ -54,44 +56,16 @@ class Trade(commands.GroupCog):
         tuple[TradeMenu, TradingUser] | tuple[None, None]
             A tuple with the `TradeMenu` and `TradingUser` if found, else `None`.
         """
-        guild: discord.Guild
         if interaction:
-            guild = cast(discord.Guild, interaction.guild)
-            channel = cast(discord.TextChannel, interaction.channel)
+            channel = interaction.channel  # type: ignore
             user = interaction.user
-        elif channel:
-            guild = channel.guild
-        else:
+        elif not channel:
             raise TypeError("Missing interaction or channel")
 
-        if guild.id not in self.trades:
-            return (None, None)
-        if channel.id not in self.trades[guild.id]:
-            return (None, None)
-        to_remove: list[TradeMenu] = []
-        for trade in self.trades[guild.id][channel.id]:
-            if (
-                trade.current_view.is_finished()
-                or trade.trader1.cancelled
-                or trade.trader2.cancelled
-            ):
-                # remove what was supposed to have been removed
-                to_remove.append(trade)
-                continue
-            try:
-                trader = trade._get_trader(user)
-            except RuntimeError:
-                continue
-            else:
-                break
-        else:
-            for trade in to_remove:
-                self.trades[guild.id][channel.id].remove(trade)
+        trade = self.bot.sessions.get(TradeMenu, channel.id, user.id)
+        if trade is None:
             return (None, None)
-
-        for trade in to_remove:
-            self.trades[guild.id][channel.id].remove(trade)
-        return (trade, trader)
+        return (trade, trade._get_trader(user))
 
     @app_commands.command()
     async def begin(self, interaction: discord.Interaction["BallsDexBot"], user: discord.User):
@@ -136,7 +110,7 @@ class Trade(commands.GroupCog):
         menu = TradeMenu(
             self, interaction, TradingUser(interaction.user, player1), TradingUser(user, player2)
         )
-        self.trades[interaction.guild.id][interaction.channel.id].append(menu)  # type: ignore
+        self.bot.sessions.register(menu)
         await menu.start()
         await interaction.response.send_message("Trade started!", ephemeral=True)
 
@@ -196,16 +170,21 @@ class Trade(commands.GroupCog):
                 ephemeral=True,
             )
             return
-        if await countryball.is_locked():
+        if not await self.bot.locks.acquire(interaction.user.id, countryball):
             await interaction.followup.send(
                 "This countryball is currently in an active trade or donation, "
                 "please try again later.",
                 ephemeral=True,
             )
             return
+        if trader.locked or trade.is_finished():
+            # ended while acquiring, its proposals were already released without this one
+            await self.bot.locks.release(countryball)
+            await interaction.followup.send("The trade cannot be edited anymore.", ephemeral=True)
+            return
 
-        await countryball.lock_for_trade()
         trader.proposal.append(countryball)
+        trade.mark_dirty()
         await interaction.followup.send(
             f"{countryball.countryball.country} added.", ephemeral=True
         )
@@ -242,10 +221,86 @@ class Trade(commands.GroupCog):
             )
             return
         trader.proposal.remove(countryball)
+        trade.mark_dirty()
         await interaction.response.send_message(
             f"{countryball.countryball.country} removed.", ephemeral=True
         )
-        await countryball.unlock()
+        await self.bot.locks.release(countryball)
+
+    @bulk.command(name="add")
+    async def bulk_add(
+        self,
+        interaction: discord.Interaction["BallsDexBot"],
+        countryball: BallEnabledTransform | None = None,
+        shiny: bool | None = None,
+        special: SpecialEnabledTransform | None = None,
+        count: app_commands.Range[int, 1, 500] | None = None,
+        duplicates: bool = False,
+    ):
+        """
+        Add many countryballs to the ongoing trade at once. Favorites are never added.
+
+        Parameters
+        ----------
+        countryball: Ball
+            Only add this countryball.
+        shiny: bool
+            Only add shiny (or non-shiny) countryballs.
+        special: Special
+            Only add countryballs of this special event.
+        count: int
+            The maximum number of countryballs to add.
+        duplicates: bool
+            Keep one of each countryball out of the trade, only adding the duplicates.
+        """
+        trade, trader = self.get_trade(interaction)
+        await run_bulk_add(
+            interaction,
+            trade,
+            trader,
+            "trade",
+            ball=countryball,
+            shiny=shiny,
+            special=special,
+            count=count,
+            duplicates=duplicates,
+            tradeable=True,
+        )
+
+    @bulk.command(name="remove")
+    async def bulk_remove(
+        self,
+        interaction: discord.Interaction["BallsDexBot"],
+        countryball: BallEnabledTransform | None = None,
+        shiny: bool | None = None,
+        special: SpecialEnabledTransform | None = None,
+        count: app_commands.Range[int, 1, 500] | None = None,
+    ):
+        """
+        Remove many countryballs from your proposal at once, all of them without filters.
+
+        Parameters
+        ----------
+        countryball: Ball
+            Only remove this countryball.
+        shiny: bool
+            Only remove shiny (or non-shiny) countryballs.
+        special: Special
+            Only remove countryballs of this special event.
+        count: int
+            The maximum number of countryballs to remove, starting from the last added.
+        """
+        trade, trader = self.get_trade(interaction)
+        await run_bulk_remove(
+            interaction,
+            trade,
+            trader,
+            "trade",
+            ball=countryball,
+            shiny=shiny,
+            special=special,
+            count=count,
+        )
 
     @app_commands.command()
     async def cancel(self, interaction: discord.Interaction):
@@ -296,12 +351,11 @@ class Trade(commands.GroupCog):
             history_queryset = TradeModel.filter(
                 Q(player1__discord_id=user.id) | Q(player2__discord_id=user.id)
             )
-        history = await history_queryset.order_by(sorting.value).prefetch_related(
-            "player1", "player2"
+        source = TradeViewFormat(
+            history_queryset.order_by(sorting.value), interaction.user.name, self.bot
         )
-        if not history:
+        if not await source.get_count():
             await interaction.followup.send("No history found.", ephemeral=True)
             return
-        source = TradeViewFormat(history, interaction.user.name, self.bot)
         pages = Pages(source=source, interaction=interaction)
         await pages.start()
\ No newline at end of file
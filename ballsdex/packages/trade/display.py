@@ -1,21 +1,33 @@
-from typing import TYPE_CHECKING, Iterable
+from typing import TYPE_CHECKING
 
 import discord
+from cachetools import LRUCache
 
 from ballsdex.core.models import Trade as TradeModel
-from ballsdex.core.utils import menus
-from ballsdex.core.utils.paginator import Pages
+from ballsdex.core.utils.paginator import Pages, QuerySetPageSource
+from ballsdex.core.utils.proposal import PAGE_LENGTH, paginate_lines, proposal_lines
 from ballsdex.packages.trade.trade_user import TradingUser
 
 if TYPE_CHECKING:
+    from tortoise.queryset import QuerySet
+
     from ballsdex.core.bot import BallsDexBot
 
 
-class TradeViewFormat(menus.ListPageSource):
-    def __init__(self, entries: Iterable[TradeModel], header: str, bot: "BallsDexBot"):
+class TradeViewFormat(QuerySetPageSource[TradeModel]):
+    def __init__(self, queryset: "QuerySet[TradeModel]", header: str, bot: "BallsDexBot"):
         self.header = header
         self.bot = bot
-        super().__init__(entries, per_page=1)
+        super().__init__(queryset.select_related("player1", "player2"), per_page=1)
+        # traders of the fetched trades, loaded along with their page
+        self.traders: LRUCache[int, tuple[TradingUser, TradingUser]] = LRUCache(
+            maxsize=self.cache_size * self.per_page
+        )
+
+    async def fetch_page(self, page_number: int) -> list[TradeModel]:
+        trades = await super().fetch_page(page_number)
+        self.traders.update(await TradingUser.from_trade_models(trades, self.bot))
+        return trades
 
     async def format_page(self, menu: Pages, trade: TradeModel) -> discord.Embed:
         embed = discord.Embed(
@@ -26,12 +38,11 @@ class TradeViewFormat(menus.ListPageSource):
         embed.set_footer(
             text=f"Trade {menu.current_page + 1 }/{menu.source.get_max_pages()} | Trade date: "
         )
-        fill_trade_embed_fields(
-            embed,
-            self.bot,
-            await TradingUser.from_trade_model(trade, trade.player1, self.bot),
-            await TradingUser.from_trade_model(trade, trade.player2, self.bot),
-        )
+        traders = self.traders.get(trade.pk)
+        if traders is None:
+            # evicted from the cache, only possible with an unusual page size
+            traders = (await TradingUser.from_trade_models([trade], self.bot))[trade.pk]
+        fill_trade_embed_fields(embed, self.bot, *traders)
         return embed
 
 
@@ -46,33 +57,23 @@ def _get_prefix_emote(trader: TradingUser) -> str:
         return ""
 
 
-def _build_list_of_strings(
-    trader: TradingUser, bot: "BallsDexBot", short: bool = False
-) -> list[str]:
-    # this builds a list of strings always lower than 1024 characters
-    # while not cutting in the middle of a line
-    proposal: list[str] = [""]
-    i = 0
-
-    for countryball in trader.proposal:
-        cb_text = countryball.description(short=short, include_emoji=True, bot=bot, is_trade=True)
-        if trader.locked:
-            text = f"- *{cb_text}*\n"
-        else:
-            text = f"- {cb_text}\n"
-        if trader.cancelled:
-            text = f"~~{text}~~"
-
-        if len(text) + len(proposal[i]) > 950:
-            # move to a new list element
-            i += 1
-            proposal.append("")
-        proposal[i] += text
-
-    if not proposal[0]:
-        proposal[0] = "*Empty*"
+def _layout_fields(
+    name1: str, name2: str, pages1: list[str], pages2: list[str]
+) -> list[tuple[str, str]]:
+    # the first page of each trader is displayed side by side
+    fields = [(name1, pages1[0]), (name2, pages2[0])]
+    if len(pages1) > 1 or len(pages2) > 1:
+        # we'll have to trick for displaying the other pages
+        # fields have to stack themselves vertically
+        # to do this, we add a 3rd empty field on each line (since 3 fields per line)
+        for i in range(1, max(len(pages1), len(pages2))):
+            fields.append(("\u200B", "\u200B"))  # empty
+            fields.append(("\u200B", pages1[i] if i < len(pages1) else "\u200B"))
+            fields.append(("\u200B", pages2[i] if i < len(pages2) else "\u200B"))
 
-    return proposal
+        # always add an empty field at the end, otherwise the alignment is off
+        fields.append(("\u200B", "\u200B"))
+    return fields
 
 
 def fill_trade_embed_fields(
@@ -80,12 +81,12 @@ def fill_trade_embed_fields(
     bot: "BallsDexBot",
     trader1: TradingUser,
     trader2: TradingUser,
-    compact: bool = False,
 ):
     """
     Fill the fields of an embed with the items part of a trade.
 
-    This handles embed limits and will shorten the content if needed.
+    This handles embed limits and will shorten the content if needed. The lines of each
+    countryball are cached on the traders, only new countryballs are formatted.
 
     Parameters
     ----------
@@ -97,63 +98,28 @@ def fill_trade_embed_fields(
         The player that initiated the trade, displayed on the left side.
     trader2: TradingUser
         The player that was invited to trade, displayed on the right side.
-    compact: bool
-        If `True`, display countryballs in a compact way. This should not be used directly.
     """
     embed.clear_fields()
+    remaining = 6000 - len(embed)
+    name1 = f"{_get_prefix_emote(trader1)} {trader1.user.name}"
+    name2 = f"{_get_prefix_emote(trader2)} {trader2.user.name}"
 
-    # first, build embed strings
     # to play around the limit of 1024 characters per field, we'll be using multiple fields
-    # these vars are list of fields, being a list of lines to include
-    trader1_proposal = _build_list_of_strings(trader1, bot, compact)
-    trader2_proposal = _build_list_of_strings(trader2, bot, compact)
-
-    # then display the text. first page is easy
-    embed.add_field(
-        name=f"{_get_prefix_emote(trader1)} {trader1.user.name}",
-        value=trader1_proposal[0],
-        inline=True,
-    )
-    embed.add_field(
-        name=f"{_get_prefix_emote(trader2)} {trader2.user.name}",
-        value=trader2_proposal[0],
-        inline=True,
-    )
-
-    if len(trader1_proposal) > 1 or len(trader2_proposal) > 1:
-        # we'll have to trick for displaying the other pages
-        # fields have to stack themselves vertically
-        # to do this, we add a 3rd empty field on each line (since 3 fields per line)
-        i = 1
-        while i < len(trader1_proposal) or i < len(trader2_proposal):
-            embed.add_field(name="\u200B", value="\u200B", inline=True)  # empty
-
-            if i < len(trader1_proposal):
-                embed.add_field(name="\u200B", value=trader1_proposal[i], inline=True)
-            else:
-                embed.add_field(name="\u200B", value="\u200B", inline=True)
-
-            if i < len(trader2_proposal):
-                embed.add_field(name="\u200B", value=trader2_proposal[i], inline=True)
-            else:
-                embed.add_field(name="\u200B", value="\u200B", inline=True)
-            i += 1
-
-        # always add an empty field at the end, otherwise the alignment is off
-        embed.add_field(name="\u200B", value="\u200B", inline=True)
-
-    if len(embed) > 6000:
-        if not compact:
-            return fill_trade_embed_fields(embed, bot, trader1, trader2, compact=True)
-        else:
-            embed.clear_fields()
-            embed.add_field(
-                name=f"{_get_prefix_emote(trader1)} {trader1.user.name}",
-                value=f"Trade too long, only showing last page:\n{trader1_proposal[-1]}",
-                inline=True,
-            )
-            embed.add_field(
-                name=f"{_get_prefix_emote(trader2)} {trader2.user.name}",
-                value=f"Trade too long, only showing last page:\n{trader2_proposal[-1]}",
-                inline=True,
-            )
\ No newline at end of file
+    lines1 = proposal_lines(trader1, bot)
+    lines2 = proposal_lines(trader2, bot)
+    length = sum(map(len, lines1)) + sum(map(len, lines2))
+    # the fields only add their names and a few empty values to the lines of each page
+    if length + len(name1) + len(name2) + 8 * (length // PAGE_LENGTH + 2) > remaining:
+        lines1 = proposal_lines(trader1, bot, short=True)
+        lines2 = proposal_lines(trader2, bot, short=True)
+    pages1 = paginate_lines(lines1)
+    pages2 = paginate_lines(lines2)
+    fields = _layout_fields(name1, name2, pages1, pages2)
+    if sum(len(x) + len(y) for x, y in fields) > remaining:
+        fields = [
+            (name1, f"Trade too long, only showing last page:\n{pages1[-1]}"),
+            (name2, f"Trade too long, only showing last page:\n{pages2[-1]}"),
+        ]
+
+    for name, value in fields:
+        embed.add_field(name=name, value=value, inline=True)
@@ -1,12 +1,13 @@
 from __future__ import annotations
 
-import asyncio
 import logging
-from datetime import datetime, timedelta
+import time
 from typing import TYPE_CHECKING, cast
 
 import discord
 from discord.ui import Button, View, button
+from prometheus_client import Histogram
+from tortoise.transactions import in_transaction
 
 from ballsdex.core.models import BallInstance, Trade, TradeObject
 from ballsdex.packages.trade.display import fill_trade_embed_fields
@@ -18,6 +19,9 @@ if TYPE_CHECKING:
     from ballsdex.packages.trade.cog import Trade as TradeCog
 
 log = logging.getLogger("ballsdex.packages.trade.menu")
+trade_commit_duration = Histogram(
+    "trade_commit_duration", "Time taken to commit a concluded trade to the database"
+)
 
 
 class InvalidTradeOperation(Exception):
@@ -71,9 +75,9 @@ class TradeView(View):
                 ephemeral=True,
             )
         else:
-            for countryball in trader.proposal:
-                await countryball.unlock()
+            await self.trade.bot.locks.release(*trader.proposal)
             trader.proposal.clear()
+            self.trade.mark_dirty()
             await interaction.response.send_message("Proposal cleared.", ephemeral=True)
 
     @button(
@@ -102,6 +106,9 @@ class ConfirmView(View):
         else:
             return True
 
+    async def on_timeout(self):
+        self.trade.bot.sessions.unregister(self.trade)
+
     @discord.ui.button(
         style=discord.ButtonStyle.success, emoji="\N{HEAVY CHECK MARK}\N{VARIATION SELECTOR-16}"
     )
@@ -136,6 +143,8 @@ class ConfirmView(View):
 
 
 class TradeMenu:
+    kind = "trade"
+
     def __init__(
         self,
         cog: TradeCog,
@@ -149,7 +158,6 @@ class TradeMenu:
         self.trader1 = trader1
         self.trader2 = trader2
         self.embed = discord.Embed()
-        self.task: asyncio.Task | None = None
         self.current_view: TradeView | ConfirmView = TradeView(self)
         self.message: discord.Message
 
@@ -160,6 +168,15 @@ class TradeMenu:
             return self.trader2
         raise RuntimeError(f"User with ID {user.id} cannot be found in the trade")
 
+    @property
+    def participants(self) -> tuple[int, int]:
+        return (self.trader1.user.id, self.trader2.user.id)
+
+    def is_finished(self) -> bool:
+        return (
+            self.current_view.is_finished() or self.trader1.cancelled or self.trader2.cancelled
+        )
+
     def _generate_embed(self):
         add_command = self.cog.add.extras.get("mention", "`/trade add`")
         remove_command = self.cog.remove.extras.get("mention", "`/trade remove`")
@@ -174,37 +191,26 @@ class TradeMenu:
             "*You have 30 minutes before this interaction ends.*"
         )
         self.embed.set_footer(
-            text="This message is updated every 15 seconds, "
-            "but you can keep on editing your proposal."
+            text="This message is updated a few seconds after each change, "
+            "you can keep on editing your proposal."
         )
 
-    async def update_message_loop(self):
+    def mark_dirty(self):
         """
-        A loop task that updates each 5 second the menu with the new content.
+        Schedule a refresh of the message after a change of the proposals.
         """
+        self.bot.menu_refresher.mark_dirty(self)
 
-        assert self.task
-        start_time = datetime.utcnow()
-
-        while True:
-            await asyncio.sleep(15)
-            if datetime.utcnow() - start_time > timedelta(minutes=15):
-                self.embed.colour = discord.Colour.dark_red()
-                await self.cancel("The trade timed out")
-                return
+    async def refresh(self):
+        """
+        Update the menu with the new content, called by the bot's `MenuRefresher`.
+        """
+        fill_trade_embed_fields(self.embed, self.bot, self.trader1, self.trader2)
+        await self.message.edit(embed=self.embed)
 
-            try:
-                fill_trade_embed_fields(self.embed, self.bot, self.trader1, self.trader2)
-                await self.message.edit(embed=self.embed)
-            except Exception:
-                log.exception(
-                    "Failed to refresh the trade menu "
-                    f"guild={self.message.guild.id} "  # type: ignore
-                    f"trader1={self.trader1.user.id} trader2={self.trader2.user.id}"
-                )
-                self.embed.colour = discord.Colour.dark_red()
-                await self.cancel("The trade timed out")
-                return
+    async def timeout(self):
+        self.embed.colour = discord.Colour.dark_red()
+        await self.cancel("The trade timed out")
 
     async def start(self):
         """
@@ -218,17 +224,16 @@ class TradeMenu:
             embed=self.embed,
             view=self.current_view,
         )
-        self.task = self.bot.loop.create_task(self.update_message_loop())
+        self.bot.menu_refresher.open(self)
 
     async def cancel(self, reason: str = "The trade has been cancelled."):
         """
         Cancel the trade immediately.
         """
-        if self.task:
-            self.task.cancel()
+        self.bot.menu_refresher.close(self)
+        self.bot.sessions.unregister(self)
 
-        for countryball in self.trader1.proposal + self.trader2.proposal:
-            await countryball.unlock()
+        await self.bot.locks.release(*self.trader1.proposal, *self.trader2.proposal)
 
         self.current_view.stop()
         for item in self.current_view.children:
@@ -244,8 +249,7 @@ class TradeMenu:
         """
         trader.locked = True
         if self.trader1.locked and self.trader2.locked:
-            if self.task:
-                self.task.cancel()
+            self.bot.menu_refresher.close(self)
             self.current_view.stop()
             fill_trade_embed_fields(self.embed, self.bot, self.trader1, self.trader2)
 
@@ -265,38 +269,57 @@ class TradeMenu:
         await self.cancel()
 
     async def perform_trade(self):
-        valid_transferable_countryballs: list[BallInstance] = []
-
-        trade = await Trade.create(player1=self.trader1.player, player2=self.trader2.player)
-
-        for countryball in self.trader1.proposal:
-            await countryball.refresh_from_db()
-            if countryball.player.discord_id != self.trader1.player.discord_id:
-                # This is a invalid mutation, the player is not the owner of the countryball
-                raise InvalidTradeOperation()
-            countryball.player = self.trader2.player
-            countryball.trade_player = self.trader1.player
-            countryball.favorite = False
-            valid_transferable_countryballs.append(countryball)
-            await TradeObject.create(
-                trade=trade, ballinstance=countryball, player=self.trader1.player
-            )
+        start = time.perf_counter()
+        transfers = (
+            (self.trader1, self.trader2, self.trader1.proposal),
+            (self.trader2, self.trader1, self.trader2.proposal),
+        )
 
-        for countryball in self.trader2.proposal:
-            if countryball.player.discord_id != self.trader2.player.discord_id:
-                # This is a invalid mutation, the player is not the owner of the countryball
-                raise InvalidTradeOperation()
-            countryball.player = self.trader1.player
-            countryball.trade_player = self.trader2.player
-            countryball.favorite = False
-            valid_transferable_countryballs.append(countryball)
-            await TradeObject.create(
-                trade=trade, ballinstance=countryball, player=self.trader2.player
+        async with in_transaction() as connection:
+            # lock the rows until the end of the transaction, ordered to prevent deadlocks
+            owners = dict(
+                await BallInstance.filter(
+                    id__in=[x.pk for x in self.trader1.proposal + self.trader2.proposal]
+                )
+                .using_db(connection)
+                .order_by("id")
+                .select_for_update()
+                .values_list("id", "player_id")
             )
+            for giver, _, proposal in transfers:
+                if any(owners.get(x.pk) != giver.player.pk for x in proposal):
+                    # This is a invalid mutation, the player is not the owner of the countryball
+                    raise InvalidTradeOperation()
 
-        for countryball in valid_transferable_countryballs:
-            await countryball.unlock()
-            await countryball.save()
+            trade = await Trade.create(
+                player1=self.trader1.player, player2=self.trader2.player, using_db=connection
+            )
+            trade_objects: list[TradeObject] = []
+            for giver, receiver, proposal in transfers:
+                if not proposal:
+                    continue
+                ids = [x.pk for x in proposal]
+                await BallInstance.filter(id__in=ids).using_db(connection).update(
+                    player=receiver.player, trade_player=giver.player, favorite=False, locked=None
+                )
+                trade_objects.extend(
+                    TradeObject(trade=trade, ballinstance=x, player=giver.player) for x in proposal
+                )
+            await TradeObject.bulk_create(trade_objects, using_db=connection)
+
+        for giver, receiver, proposal in transfers:
+            for countryball in proposal:
+                countryball.player = receiver.player
+                countryball.trade_player = giver.player
+                countryball.favorite = False
+                countryball.locked = None  # type: ignore
+        trade_commit_duration.observe(time.perf_counter() - start)
+
+        completions = self.bot.completions
+        completions.add(self.trader1.user.id, *self.trader2.proposal)
+        completions.add(self.trader2.user.id, *self.trader1.proposal)
+        await completions.remove(self.trader1.user.id, *self.trader1.proposal)
+        await completions.remove(self.trader2.user.id, *self.trader2.proposal)
 
     async def confirm(self, trader: TradingUser) -> bool:
         """
@@ -308,9 +331,9 @@ class TradeMenu:
         trader.accepted = True
         fill_trade_embed_fields(self.embed, self.bot, self.trader1, self.trader2)
         if self.trader1.accepted and self.trader2.accepted:
-            if self.task and not self.task.cancelled():
-                # shouldn't happen but just in case
-                self.task.cancel()
+            # shouldn't be open anymore but just in case
+            self.bot.menu_refresher.close(self)
+            self.bot.sessions.unregister(self)
 
             self.embed.description = "Trade concluded!"
             self.embed.colour = discord.Colour.green()
@@ -333,6 +356,9 @@ class TradeMenu:
                 self.embed.description = "An error occured when concluding the trade."
                 self.embed.colour = discord.Colour.red()
                 result = False
+            finally:
+                # the trade is over whatever the outcome, nothing else will free them
+                await self.bot.locks.release(*self.trader1.proposal, *self.trader2.proposal)
 
         await self.message.edit(content=None, embed=self.embed, view=self.current_view)
         return result
\ No newline at end of file
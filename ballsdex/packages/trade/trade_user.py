@@ -1,5 +1,7 @@
 from dataclasses import dataclass, field
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Iterable
+
+from ballsdex.core.models import TradeObject
 
 if TYPE_CHECKING:
     import discord
@@ -16,9 +18,54 @@ class TradingUser:
     locked: bool = False
     cancelled: bool = False
     accepted: bool = False
+    # rendered proposal lines, see ballsdex.core.utils.proposal
+    lines: dict[tuple[int, bool, bool, bool], str] = field(default_factory=dict, repr=False)
 
     @classmethod
-    async def from_trade_model(cls, trade: "Trade", player: "Player", bot: "BallsDexBot"):
-        proposal = await trade.tradeobjects.filter(player=player).prefetch_related("ballinstance")
-        user = await bot.fetch_user(player.discord_id)
-        return cls(user, player, [x.ballinstance for x in proposal])
\ No newline at end of file
+    async def from_trade_models(
+        cls, trades: Iterable["Trade"], bot: "BallsDexBot"
+    ) -> dict[int, tuple["TradingUser", "TradingUser"]]:
+        """
+        Build the traders of multiple concluded trades, with a single query for all the traded
+        countryballs. The players of the trades must be prefetched.
+
+        Parameters
+        ----------
+        trades: Iterable[Trade]
+            The trades to load.
+        bot: BallsDexBot
+            The bot, used to resolve the Discord users.
+
+        Returns
+        -------
+        dict[int, tuple[TradingUser, TradingUser]]
+            The two traders of each trade, indexed by trade ID.
+        """
+        trades = list(trades)
+        if not trades:
+            return {}
+        proposals: dict[tuple[int, int], list["BallInstance"]] = {}
+        for trade_object in await TradeObject.filter(
+            trade_id__in=[x.pk for x in trades]
+        ).select_related("ballinstance"):
+            key = (trade_object.trade_id, trade_object.player_id)  # type: ignore
+            proposals.setdefault(key, []).append(trade_object.ballinstance)
+
+        users = await bot.user_resolver.get_many(
+            player.discord_id for trade in trades for player in (trade.player1, trade.player2)
+        )
+        return {
+            trade.pk: (
+                cls(
+                    users[trade.player1.discord_id],
+                    trade.player1,
+                    proposals.get((trade.pk, trade.player1.pk), []),
+                ),
+                cls(
+                    users[trade.player2.discord_id],
+                    trade.player2,
+                    proposals.get((trade.pk, trade.player2.pk), []),
+                ),
+            )
+            for trade in trades
+        }
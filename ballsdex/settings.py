@@ -83,6 +83,23 @@ class Settings:
     prometheus_host: str = "0.0.0.0"
     prometheus_port: int = 15260
 
+    # share the trade locks through Redis, for multi-process setups
+    redis_locks: bool = False
+
+    # directory of the files written by the bot
+    data_path: str = "."
+
+    # database connection pool
+    db_pool_min_size: int = 1
+    db_pool_max_size: int = 5
+    db_statement_cache_size: int = 100
+    db_statement_timeout: float = 0
+    slow_query_threshold: float = 1
+    replica_max_lag: float = 5
+    buffer_catches: bool = False
+    catch_flush_interval: float = 0.05
+    catch_journal: str | None = "catches.journal"
+
 
 settings = Settings()
 
@@ -118,6 +135,19 @@ def read_settings(path: "Path"):
     settings.prometheus_port = content["prometheus"]["port"]
 
     settings.max_favorites = content.get("max-favorites", 50)
+    settings.redis_locks = content.get("redis-locks", False)
+    settings.data_path = content.get("data-path", ".")
+
+    database = content.get("database") or {}
+    settings.db_pool_min_size = database.get("pool-min-size", 1)
+    settings.db_pool_max_size = database.get("pool-max-size", 5)
+    settings.db_statement_cache_size = database.get("statement-cache-size", 100)
+    settings.db_statement_timeout = database.get("statement-timeout", 0)
+    settings.slow_query_threshold = database.get("slow-query-threshold", 1)
+    settings.replica_max_lag = database.get("replica-max-lag", 5)
+    settings.buffer_catches = database.get("buffer-catches", False)
+    settings.catch_flush_interval = database.get("catch-flush-interval", 0.05)
+    settings.catch_journal = database.get("catch-journal", "catches.journal")
     log.info("Settings loaded.")
 
 
@@ -193,6 +223,41 @@ prometheus:
   enabled: false
   host: "0.0.0.0"
   port: 15260
+
+# share the locks of traded countryballs through Redis, only needed when running multiple
+# processes. requires the BALLSDEXBOT_REDIS_URL environment variable
+redis-locks: false
+
+# directory where the bot keeps its own files, like the hashes of the synced command trees
+data-path: .
+
+# database connection settings, the defaults are fine for most bots
+database:
+  # minimum and maximum number of connections kept open
+  pool-min-size: 1
+  pool-max-size: 5
+
+  # number of prepared statements cached per connection, set to 0 if using pgbouncer
+  statement-cache-size: 100
+
+  # cancel queries running for longer than this number of seconds, 0 to disable
+  statement-timeout: 0
+
+  # log queries taking longer than this number of seconds, 0 to disable
+  slow-query-threshold: 1
+
+  # when a read replica is set with the BALLSDEXBOT_DB_REPLICA_URL environment variable, reads
+  # go back to the primary if the replica lags behind by more than this number of seconds
+  replica-max-lag: 5
+
+  # queue the catches and insert them in batches, only useful if the database struggles
+  # during spawn storms. queued catches are written every catch-flush-interval seconds
+  buffer-catches: false
+  catch-flush-interval: 0.05
+
+  # file where queued catches are saved until written, to write them again after a crash.
+  # leave empty to disable, queued catches are then lost if the bot is killed
+  catch-journal: catches.journal
   """  # noqa: W291
     )
 
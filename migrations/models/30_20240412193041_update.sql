@@ -0,0 +1,44 @@
+-- upgrade --
+CREATE TABLE IF NOT EXISTS "playerballstats" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "player_id" INT NOT NULL REFERENCES "player" ("id") ON DELETE CASCADE,
+    "ball_id" INT NOT NULL REFERENCES "ball" ("id") ON DELETE CASCADE,
+    "special_id" INT REFERENCES "special" ("id") ON DELETE CASCADE,
+    "shiny" BOOL NOT NULL,
+    "server_id" BIGINT,
+    "count" INT NOT NULL DEFAULT 0
+);
+COMMENT ON TABLE "playerballstats" IS 'Number of instances per player, ball, special, shininess and server. Maintained by triggers on ballinstance';
+CREATE UNIQUE INDEX "uid_playerballs_player_4c1f2a" ON "playerballstats" ("player_id", "ball_id", COALESCE("special_id", 0), "shiny", COALESCE("server_id", 0));
+CREATE INDEX "idx_playerballs_ball_id_235db8" ON "playerballstats" ("ball_id");
+CREATE OR REPLACE FUNCTION playerballstats_sync() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        UPDATE "playerballstats" SET "count" = "count" - 1
+        WHERE "player_id" = OLD."player_id" AND "ball_id" = OLD."ball_id"
+            AND COALESCE("special_id", 0) = COALESCE(OLD."special_id", 0)
+            AND "shiny" = OLD."shiny" AND COALESCE("server_id", 0) = COALESCE(OLD."server_id", 0);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO "playerballstats" ("player_id", "ball_id", "special_id", "shiny", "server_id", "count")
+        VALUES (NEW."player_id", NEW."ball_id", NEW."special_id", NEW."shiny", NEW."server_id", 1)
+        ON CONFLICT ("player_id", "ball_id", COALESCE("special_id", 0), "shiny", COALESCE("server_id", 0))
+        DO UPDATE SET "count" = "playerballstats"."count" + 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER "playerballstats_insert_delete" AFTER INSERT OR DELETE ON "ballinstance"
+    FOR EACH ROW EXECUTE FUNCTION playerballstats_sync();
+CREATE TRIGGER "playerballstats_update" AFTER UPDATE OF "player_id", "ball_id", "special_id", "shiny", "server_id" ON "ballinstance"
+    FOR EACH ROW
+    WHEN ((OLD."player_id", OLD."ball_id", OLD."special_id", OLD."shiny", OLD."server_id") IS DISTINCT FROM (NEW."player_id", NEW."ball_id", NEW."special_id", NEW."shiny", NEW."server_id"))
+    EXECUTE FUNCTION playerballstats_sync();
+INSERT INTO "playerballstats" ("player_id", "ball_id", "special_id", "shiny", "server_id", "count")
+    SELECT "player_id", "ball_id", "special_id", "shiny", "server_id", COUNT(*) FROM "ballinstance"
+    GROUP BY "player_id", "ball_id", "special_id", "shiny", "server_id";
+-- downgrade --
+DROP TRIGGER IF EXISTS "playerballstats_update" ON "ballinstance";
+DROP TRIGGER IF EXISTS "playerballstats_insert_delete" ON "ballinstance";
+DROP FUNCTION IF EXISTS playerballstats_sync;
+DROP TABLE IF EXISTS "playerballstats";
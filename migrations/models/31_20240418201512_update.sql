@@ -0,0 +1,18 @@
+-- upgrade --
+ALTER TABLE "ball" ADD "mergeable" BOOL NOT NULL  DEFAULT False;
+ALTER TABLE "ball" ADD "recipe" TEXT;
+COMMENT ON COLUMN "ball"."recipe" IS 'List the ingredients to merge this ball, separated by semicolons. Remains empty if not mergeable.';
+-- recipes previously hardcoded in the merge package
+UPDATE "ball" SET "mergeable" = True, "recipe" = '人參;白朮;茯苓;甘草' WHERE "country" = '四君子湯' AND "recipe" IS NULL;
+UPDATE "ball" SET "mergeable" = True, "recipe" = '熟地;當歸;白芍;川芎' WHERE "country" = '四物湯' AND "recipe" IS NULL;
+UPDATE "ball" SET "mergeable" = True, "recipe" = '四君子湯;四物湯' WHERE "country" = '八珍湯' AND "recipe" IS NULL;
+UPDATE "ball" SET "mergeable" = True, "recipe" = '八珍湯;黃耆;肉桂' WHERE "country" = '十全大補湯' AND "recipe" IS NULL;
+UPDATE "ball" SET "mergeable" = True, "recipe" = '熟地;山藥;茯苓;牡丹皮' WHERE "country" = '六味地黃丸' AND "recipe" IS NULL;
+UPDATE "ball" SET "mergeable" = True, "recipe" = '桂枝;白芍;生薑;甘草;大棗' WHERE "country" = '桂枝湯' AND "recipe" IS NULL;
+UPDATE "ball" SET "mergeable" = True, "recipe" = '陳皮;半夏;茯苓;甘草;大棗' WHERE "country" = '二陳湯' AND "recipe" IS NULL;
+UPDATE "ball" SET "mergeable" = True, "recipe" = '黃芩;黃連;黃柏;梔子' WHERE "country" = '黃連解毒湯' AND "recipe" IS NULL;
+UPDATE "ball" SET "mergeable" = True, "recipe" = '龜龜;謝一如' WHERE "country" = '龜鹿二仙膠' AND "recipe" IS NULL;
+UPDATE "ball" SET "mergeable" = True, "recipe" = '豬苓;豬苓;豬苓;豬苓;豬苓;豬苓;豬苓;豬苓;豬苓;豬苓;豬苓;豬苓;豬苓;豬苓;豬苓;豬苓;豬苓;豬苓;豬苓;豬苓;豬苓;豬苓;豬苓;豬苓;豬苓' WHERE "country" = '溫婕伶' AND "recipe" IS NULL;
+-- downgrade --
+ALTER TABLE "ball" DROP COLUMN "recipe";
+ALTER TABLE "ball" DROP COLUMN "mergeable";
@@ -0,0 +1,22 @@
+-- upgrade --
+CREATE TABLE IF NOT EXISTS "merge" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "date" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "ball_id" INT NOT NULL REFERENCES "ball" ("id") ON DELETE CASCADE,
+    "player1_id" INT NOT NULL REFERENCES "player" ("id") ON DELETE CASCADE,
+    "result_id" INT REFERENCES "ballinstance" ("id") ON DELETE SET NULL
+);
+COMMENT ON COLUMN "merge"."ball_id" IS 'The ball obtained from this merge';
+COMMENT ON COLUMN "merge"."result_id" IS 'The instance created by this merge';
+CREATE TABLE IF NOT EXISTS "mergeobject" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "ball_id" INT NOT NULL REFERENCES "ball" ("id") ON DELETE CASCADE,
+    "ballinstance_id" INT NOT NULL,
+    "merge_id" INT NOT NULL REFERENCES "merge" ("id") ON DELETE CASCADE,
+    "player_id" INT NOT NULL REFERENCES "player" ("id") ON DELETE CASCADE
+);
+COMMENT ON COLUMN "mergeobject"."ballinstance_id" IS 'ID of the consumed instance';
+CREATE INDEX "idx_mergeobject_merge_i_3a63c6" ON "mergeobject" ("merge_id");
+-- downgrade --
+DROP TABLE IF EXISTS "mergeobject";
+DROP TABLE IF EXISTS "merge";
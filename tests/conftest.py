@@ -0,0 +1,50 @@
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, TypeVar
+
+import pytest
+
+T = TypeVar("T")
+
+# tests needing PostgreSQL run against this database, which must be empty and disposable
+TEST_DB_URL = os.environ.get("BALLSDEXBOT_TEST_DB_URL")
+
+
+@pytest.fixture(scope="session")
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture(scope="session")
+def run(loop: asyncio.AbstractEventLoop) -> Callable[[Awaitable[T]], T]:
+    """
+    Run a coroutine on the event loop shared by the session, which holds the connections.
+    """
+    return loop.run_until_complete  # type: ignore
+
+
+@pytest.fixture(scope="session")
+def database(run: Callable[[Awaitable[Any]], Any]):
+    """
+    Initialize Tortoise on the test database, applying the migrations like the bot does.
+    """
+    if not TEST_DB_URL:
+        pytest.skip("BALLSDEXBOT_TEST_DB_URL is not set")
+    from aerich import Command
+    from tortoise import Tortoise
+
+    from ballsdex.core.db import tortoise_config
+
+    config = tortoise_config(TEST_DB_URL)
+
+    async def setup():
+        await Tortoise.init(config=config)
+        command = Command(config, app="models")
+        await command.init()
+        await command.upgrade()
+
+    run(setup())
+    yield
+    run(Tortoise.close_connections())
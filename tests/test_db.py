@@ -0,0 +1,53 @@
+from tortoise import Tortoise
+
+from ballsdex.core.db import ReadRouter, normalize_query
+
+
+def test_parameter_lists_collapse():
+    assert (
+        normalize_query("SELECT * FROM ballinstance WHERE id IN ($1,$2,$3) LIMIT 25")
+        == "SELECT * FROM ballinstance WHERE id IN ($n) LIMIT ?"
+    )
+
+
+def test_parameter_list_length_does_not_change_shape():
+    short = normalize_query("SELECT * FROM ballinstance WHERE id IN ($1, $2)")
+    long = normalize_query("SELECT * FROM ballinstance WHERE id IN ($1, $2, $3, $4, $5, $6)")
+    assert short == long
+
+
+def test_literals_and_spaces():
+    assert (
+        normalize_query("SELECT  id FROM ball\n WHERE country = 'it''s' AND rarity > 1.5")
+        == "SELECT id FROM ball WHERE country = ? AND rarity > ?"
+    )
+
+
+def test_numbers_in_identifiers_are_kept():
+    query = "SELECT col1 FROM t2 WHERE a = $10"
+    assert normalize_query(query) == "SELECT col1 FROM t2 WHERE a = $n"
+
+
+def _router(monkeypatch, **kwargs) -> ReadRouter:
+    monkeypatch.setattr(Tortoise, "get_connection", staticmethod(lambda name: name))
+    router = ReadRouter(**kwargs)
+    router.enabled = True
+    router.healthy = True
+    return router
+
+
+def test_recent_writers_read_from_primary(monkeypatch):
+    router = _router(monkeypatch)
+    router.mark_write(1)
+    assert router.connection(1) == "default"
+    assert router.connection(2) == "replica"
+    assert router.connection() == "replica"
+
+
+def test_evicted_writers_read_from_primary(monkeypatch):
+    router = _router(monkeypatch, max_tracked=2)
+    for key in (1, 2, 3):
+        router.mark_write(key)
+    # 1 was evicted before the end of its delay
+    assert router.connection(1) == "default"
+    assert router.connection() == "replica"
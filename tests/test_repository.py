@@ -0,0 +1,401 @@
+"""
+Parity tests of the hand-written queries of `ballsdex.core.repository` against the ORM queries
+they replaced, and a micro-benchmark comparing both.
+
+They need an empty PostgreSQL database, given with the ``BALLSDEXBOT_TEST_DB_URL`` environment
+variable. The benchmark also needs ``BALLSDEXBOT_BENCHMARK=1`` and is shown with ``pytest -s``.
+"""
+
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable
+
+import pytest
+
+from tests.conftest import TEST_DB_URL
+
+if not TEST_DB_URL:
+    pytest.skip("BALLSDEXBOT_TEST_DB_URL is not set", allow_module_level=True)
+
+from tortoise import Tortoise  # noqa: E402
+from tortoise.expressions import RawSQL  # noqa: E402
+from tortoise.functions import Count  # noqa: E402
+
+from ballsdex.core import repository  # noqa: E402
+from ballsdex.core.models import (  # noqa: E402
+    Ball,
+    BallInstance,
+    Player,
+    Regime,
+    Special,
+    balls,
+)
+
+Run = Callable[[Awaitable[Any]], Any]
+
+DISCORD_ID = 100000000000000001
+OTHER_DISCORD_ID = 100000000000000002
+
+
+async def _reset():
+    await Tortoise.get_connection("default").execute_script(
+        "TRUNCATE ballinstance, playerballstats, player, ball, special, regime "
+        "RESTART IDENTITY CASCADE"
+    )
+
+
+def _ball(regime: Regime, country: str, **kwargs: Any) -> Ball:
+    return Ball(
+        country=country,
+        regime=regime,
+        health=100,
+        attack=100,
+        rarity=1,
+        emoji_id=100000000000000000,
+        wild_card="wild.png",
+        collection_card="card.png",
+        credits="tests",
+        capacity_name="capacity",
+        capacity_description="description",
+        **kwargs,
+    )
+
+
+@pytest.fixture
+def data(database, run: Run) -> dict[str, Any]:
+    """
+    A player owning instances of three balls, with favorites, shinies, specials, untradeable
+    instances and balls without catch names. Another player owns a few instances too.
+    """
+
+    async def setup() -> dict[str, Any]:
+        await _reset()
+        regime = await Regime.create(name="Democracy", background="democracy.png")
+        ball_list = [
+            _ball(regime, "France", catch_names="french;frenchie"),
+            _ball(regime, "Germany"),
+            _ball(regime, "Italy", tradeable=False),
+        ]
+        for ball in ball_list:
+            await ball.save()
+        now = datetime.now(timezone.utc)
+        special = await Special.create(
+            name="Event", start_date=now, end_date=now + timedelta(days=1), rarity=0.1
+        )
+        untradeable = await Special.create(
+            name="Locked event",
+            start_date=now,
+            end_date=now + timedelta(days=1),
+            rarity=0.1,
+            tradeable=False,
+        )
+        player = await Player.create(discord_id=DISCORD_ID)
+        other = await Player.create(discord_id=OTHER_DISCORD_ID)
+        instances: list[BallInstance] = []
+        for i in range(30):
+            instances.append(
+                await BallInstance.create(
+                    ball=ball_list[i % 3],
+                    player=player,
+                    shiny=i % 7 == 0,
+                    special=(special, None, untradeable, None, None)[i % 5],
+                    favorite=i % 4 == 0,
+                    tradeable=i % 11 != 0,
+                    attack_bonus=i % 5,
+                    health_bonus=-(i % 3),
+                    server_id=(None, 1, 2)[i % 3],
+                    catch_date=now - timedelta(minutes=i % 13),
+                )
+            )
+        for ball in ball_list[:2]:
+            await BallInstance.create(ball=ball, player=other)
+        balls.clear()
+        balls.update((x.pk, x) for x in ball_list)
+        return {
+            "balls": ball_list,
+            "special": special,
+            "player": player,
+            "other": other,
+            "instances": instances,
+        }
+
+    return run(setup())
+
+
+def test_get_or_create_player(data, run: Run):
+    existing, created = run(repository.get_or_create_player(DISCORD_ID))
+    assert not created
+    assert existing.id == data["player"].pk
+    assert existing.donation_policy == data["player"].donation_policy
+    assert existing.privacy_policy == data["player"].privacy_policy
+
+    new, created = run(repository.get_or_create_player(100000000000000003))
+    assert created
+    orm = run(Player.get(discord_id=100000000000000003))
+    assert new == (orm.pk, orm.discord_id, orm.donation_policy, orm.privacy_policy)
+
+
+def test_create_instance_uses_model_defaults(data, run: Run):
+    ball = data["balls"][0]
+    view = run(
+        repository.create_instance(
+            data["player"].pk, ball.pk, shiny=True, attack_bonus=3, health_bonus=-4, server_id=5
+        )
+    )
+    created = run(BallInstance.get(id=view.id))
+    orm = run(
+        BallInstance.create(
+            ball=ball, player=data["player"], shiny=True, attack_bonus=3, health_bonus=-4
+        )
+    )
+    for field in ("favorite", "tradeable", "extra_data", "locked", "special_id", "shiny"):
+        assert getattr(created, field) == getattr(orm, field), field
+    assert created.server_id == 5
+    assert abs(created.catch_date - orm.catch_date) < timedelta(seconds=10)
+    assert (view.attack_bonus, view.health_bonus, view.catch_date) == (
+        created.attack_bonus,
+        created.health_bonus,
+        created.catch_date,
+    )
+
+
+def test_insert_instances_uses_model_defaults(data, run: Run):
+    ids = run(repository.reserve_instance_ids(2))
+    now = datetime.now(timezone.utc)
+    ball = data["balls"][1]
+    rows = [
+        (ids[0], ball.pk, data["player"].pk, False, None, 1, 2, None, now),
+        (ids[1], ball.pk, data["player"].pk, True, data["special"].pk, -1, -2, 3, now),
+    ]
+    run(repository.insert_instances(rows))
+    # retried writes skip the rows already inserted
+    run(repository.insert_instances(rows))
+    inserted = run(BallInstance.filter(id__in=ids).order_by("id"))
+    assert [x.pk for x in inserted] == ids
+    orm = run(BallInstance.create(ball=ball, player=data["player"]))
+    for instance in inserted:
+        for field in ("favorite", "tradeable", "extra_data", "locked"):
+            assert getattr(instance, field) == getattr(orm, field), field
+    assert inserted[1].special_id == data["special"].pk
+    assert inserted[1].server_id == 3
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [
+        {},
+        {"ball": 0},
+        {"shiny": True},
+        {"shiny": False, "special": True},
+        {"ball": 1, "server_id": 1},
+        {"ball": 2, "shiny": False, "special": True, "server_id": 2},
+    ],
+)
+def test_count_instances(data, run: Run, filters: dict[str, Any]):
+    kwargs: dict[str, Any] = {}
+    orm_filters: dict[str, Any] = {"player__discord_id": DISCORD_ID}
+    if "ball" in filters:
+        kwargs["ball_id"] = orm_filters["ball_id"] = data["balls"][filters["ball"]].pk
+    if "shiny" in filters:
+        kwargs["shiny"] = orm_filters["shiny"] = filters["shiny"]
+    if "special" in filters:
+        kwargs["special_id"] = orm_filters["special_id"] = data["special"].pk
+    if "server_id" in filters:
+        kwargs["server_id"] = orm_filters["server_id"] = filters["server_id"]
+    expected = run(BallInstance.filter(**orm_filters).count())
+    assert run(repository.count_instances(DISCORD_ID, **kwargs)) == expected
+
+
+def test_count_favorites(data, run: Run):
+    expected = run(BallInstance.filter(player=data["player"], favorite=True).count())
+    assert run(repository.count_favorites(data["player"].pk)) == expected
+
+
+def test_completion_rows(data, run: Run):
+    expected = set(
+        run(
+            BallInstance.filter(player__discord_id=DISCORD_ID)
+            .distinct()
+            .values_list("ball_id", "shiny", "special_id")
+        )
+    )
+    assert set(run(repository.completion_rows(DISCORD_ID))) == expected
+
+    ball_ids = [data["balls"][0].pk, data["balls"][2].pk]
+    assert set(run(repository.completion_rows(DISCORD_ID, ball_ids))) == {
+        x for x in expected if x[0] in ball_ids
+    }
+
+
+def test_inventory_counts(data, run: Run):
+    ball_ids = [x.pk for x in data["balls"][:2]]
+    expected = {
+        ball_id: count
+        for ball_id, count in run(
+            BallInstance.filter(player=data["player"], ball_id__in=ball_ids)
+            .annotate(count=Count("id"))
+            .group_by("ball_id")
+            .values_list("ball_id", "count")
+        )
+    }
+    assert run(repository.inventory_counts(data["player"].pk, ball_ids)) == expected
+
+
+@pytest.mark.parametrize("text", ["", "fr", "FRENCH", "germ", "ital", "1", "%", "nothing"])
+def test_search_instances(data, run: Run, text: str):
+    expected = run(
+        BallInstance.filter(player__discord_id=DISCORD_ID)
+        .select_related("ball")
+        .annotate(
+            searchable=RawSQL(
+                "to_hex(ballinstance.id) || ' ' || ballinstance__ball.country || "
+                "' ' || ballinstance__ball.catch_names"
+            )
+        )
+        .filter(searchable__icontains=text)
+        .order_by("id")
+        .limit(25)
+        .values_list("id", flat=True)
+    )
+    assert [x.id for x in run(repository.search_instances(DISCORD_ID, text))] == expected
+
+
+def test_search_instances_filters(data, run: Run):
+    special = data["special"].pk
+    exclude = [x.pk for x in data["instances"][:10]]
+    expected = run(
+        BallInstance.filter(
+            player__discord_id=DISCORD_ID, ball__catch_names__isnull=False, special_id=special
+        )
+        .exclude(id__in=exclude)
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+    results = run(repository.search_instances(DISCORD_ID, "", special_id=special, exclude=exclude))
+    assert [x.id for x in results] == expected
+
+
+async def _reference_candidates(
+    player: Player,
+    exclude: set[int],
+    *,
+    ball_id: int | None,
+    shiny: bool | None,
+    duplicates: bool,
+    tradeable: bool,
+    limit: int | None,
+) -> list[int]:
+    # the selection made in Python over the whole inventory before candidate_ids
+    queryset = BallInstance.filter(player=player).prefetch_related("ball", "special")
+    if ball_id is not None:
+        queryset = queryset.filter(ball_id=ball_id)
+    if shiny is not None:
+        queryset = queryset.filter(shiny=shiny)
+    kept: set[int] = set()
+    candidates: list[BallInstance] = []
+    for instance in await queryset.order_by("-favorite", "catch_date", "id"):
+        if duplicates and instance.ball_id not in kept:
+            kept.add(instance.ball_id)
+            continue
+        if instance.favorite or instance.pk in exclude:
+            continue
+        if tradeable and not (
+            instance.tradeable
+            and instance.ball.tradeable
+            and getattr(instance.special, "tradeable", True)
+        ):
+            continue
+        candidates.append(instance)
+        if limit and len(candidates) >= limit:
+            break
+    return [x.pk for x in candidates]
+
+
+@pytest.mark.parametrize("duplicates", [False, True])
+@pytest.mark.parametrize("tradeable", [False, True])
+@pytest.mark.parametrize(
+    "filters", [{}, {"ball": 0}, {"ball": 2, "shiny": False}, {"limit": 4}, {"shiny": True}]
+)
+def test_candidate_ids(
+    data, run: Run, duplicates: bool, tradeable: bool, filters: dict[str, Any]
+):
+    exclude = {x.pk for x in data["instances"][5:9]}
+    ball_id = data["balls"][filters["ball"]].pk if "ball" in filters else None
+    kwargs: dict[str, Any] = {
+        "ball_id": ball_id,
+        "shiny": filters.get("shiny"),
+        "duplicates": duplicates,
+        "tradeable": tradeable,
+        "limit": filters.get("limit"),
+    }
+    expected = run(_reference_candidates(data["player"], exclude, **kwargs))
+    assert run(repository.candidate_ids(data["player"].pk, exclude, **kwargs)) == expected
+
+
+@pytest.mark.skipif(
+    not os.environ.get("BALLSDEXBOT_BENCHMARK"), reason="BALLSDEXBOT_BENCHMARK is not set"
+)
+def test_benchmark(data, run: Run):
+    player = data["player"]
+    ball_ids = [x.pk for x in data["balls"]]
+    cases: list[tuple[str, Callable[[], Awaitable[Any]], Callable[[], Awaitable[Any]]]] = [
+        (
+            "get_or_create_player",
+            lambda: Player.get_or_create(discord_id=DISCORD_ID),
+            lambda: repository.get_or_create_player(DISCORD_ID),
+        ),
+        (
+            "count_instances",
+            lambda: BallInstance.filter(player__discord_id=DISCORD_ID).count(),
+            lambda: repository.count_instances(DISCORD_ID),
+        ),
+        (
+            "count_favorites",
+            lambda: BallInstance.filter(player=player, favorite=True).count(),
+            lambda: repository.count_favorites(player.pk),
+        ),
+        (
+            "completion_rows",
+            lambda: BallInstance.filter(player__discord_id=DISCORD_ID)
+            .distinct()
+            .values_list("ball_id", "shiny", "special_id"),
+            lambda: repository.completion_rows(DISCORD_ID),
+        ),
+        (
+            "inventory_counts",
+            lambda: BallInstance.filter(player=player, ball_id__in=ball_ids)
+            .annotate(count=Count("id"))
+            .group_by("ball_id")
+            .values_list("ball_id", "count"),
+            lambda: repository.inventory_counts(player.pk, ball_ids),
+        ),
+        (
+            "search_instances",
+            lambda: BallInstance.filter(player__discord_id=DISCORD_ID)
+            .select_related("ball")
+            .annotate(
+                searchable=RawSQL(
+                    "to_hex(ballinstance.id) || ' ' || ballinstance__ball.country || "
+                    "' ' || ballinstance__ball.catch_names"
+                )
+            )
+            .filter(searchable__icontains="fr")
+            .order_by("id")
+            .limit(25),
+            lambda: repository.search_instances(DISCORD_ID, "fr"),
+        ),
+    ]
+
+    async def measure(query: Callable[[], Awaitable[Any]], iterations: int = 200) -> float:
+        await query()  # warm up the statement cache
+        start = time.perf_counter()
+        for _ in range(iterations):
+            await query()
+        return (time.perf_counter() - start) / iterations * 1000
+
+    print(f"\n{'query':<24}{'ORM (ms)':>12}{'SQL (ms)':>12}{'speedup':>10}")
+    for name, orm, sql in cases:
+        orm_time = run(measure(orm))
+        sql_time = run(measure(sql))
+        print(f"{name:<24}{orm_time:>12.3f}{sql_time:>12.3f}{orm_time / sql_time:>9.1f}x")